@@ -1,59 +1,172 @@
-from flask import Flask, jsonify, g, request, make_response
+from flask import Flask, jsonify, request, make_response, Response, stream_with_context
 import sqlite3
 import jwt
 from functools import wraps
 import datetime
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
+import time
+import json
 import uuid
 from dotenv import load_dotenv
 from google.cloud import translate_v2 as translate
 from flask_cors import CORS
+from auth_cache import AuthCache
+from pagination import PageRequest, InvalidPageRequest
+from search import SearchRequest
+import migrations
+from item_batch import apply_batch, InvalidBatch
+from item_repository import ItemRepository, clean_fields, DATE_FORMAT
+from sync import InvalidSyncCursor, parse_since, list_etag
+from serialization import json_response
+from http_middleware import HTTPMiddleware
+from item_transfer import (InvalidTransfer, FORMATS, transfer_format, iter_rows, export_lines,
+                           parse_ndjson, parse_csv, import_records)
+from sqlite_db import SQLiteDatabase, ReaderBusy, WriterBusy
+from password_hasher import PasswordHasher, HasherBusy
+from reminders import ReminderScheduler, sink_from_config
+from metrics import Metrics
+from request_profiler import RequestProfiler, phase, record_query
+from rate_limiter import RateLimiter, MemoryBucketStore, SQLiteBucketStore, ROUTE_CLASSES, parse_limit
 
 # Load environment variables from .env file
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+CORS(app, expose_headers=['ETag', 'X-Sync-Cursor'])  # Enable CORS for all routes
+# Prometheus metrics at /metrics; installed first so its after_request hook sees the final status
+metrics = Metrics()
+metrics.init_app(app, token=os.environ.get('METRICS_TOKEN'))
+# Opt-in per-request profiling: sampled, or forced with X-Profile plus x-admin-token
+request_profiler = RequestProfiler(
+    directory=os.environ.get('PROFILE_DIR'),
+    sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+    slow_threshold=float(os.environ.get('PROFILE_SLOW_THRESHOLD', 1.0)),
+    capacity=int(os.environ.get('PROFILE_CAPACITY', 200)),
+    mode=os.environ.get('PROFILE_MODE', 'timeline'),
+    admin_token=os.environ.get('ADMIN_TOKEN')
+)
+request_profiler.init_app(app)
+metrics.on_query = record_query
+# Compression, conditional GETs and cache headers for all routes
+HTTPMiddleware(app, min_size=int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+               level=int(os.environ.get('COMPRESSION_LEVEL', 6)))
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_secret_key')
-DATABASE = 'todolist.db'
+app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+# SQLite is used for development, so apply migrations on start unless disabled
+app.config['AUTO_MIGRATE'] = os.environ.get('AUTO_MIGRATE', 'true').lower() == 'true'
+app.config['ITEM_IMPORT_CHUNK_SIZE'] = int(os.environ.get('ITEM_IMPORT_CHUNK_SIZE', 500))
+app.config['ITEM_IMPORT_MAX_ROWS'] = int(os.environ.get('ITEM_IMPORT_MAX_ROWS', 100000))
+app.config['REMINDERS_ENABLED'] = os.environ.get('REMINDERS_ENABLED', 'true').lower() == 'true'
+DATABASE = os.environ.get('DATABASE', 'todolist.db')
 
+database = SQLiteDatabase(
+    DATABASE,
+    journal_mode=os.environ.get('SQLITE_JOURNAL_MODE', 'wal'),
+    synchronous=os.environ.get('SQLITE_SYNCHRONOUS', 'normal'),
+    cache_size_kb=int(os.environ.get('SQLITE_CACHE_SIZE_KB', 65536)),
+    mmap_size=int(os.environ.get('SQLITE_MMAP_SIZE', 268435456)),
+    busy_timeout_ms=int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    write_timeout=float(os.environ.get('SQLITE_WRITE_TIMEOUT', 10)),
+    max_readers=int(os.environ.get('SQLITE_MAX_READERS', 16)),
+    read_timeout=float(os.environ.get('SQLITE_READ_TIMEOUT', 10)),
+    # Times every query for the db_query_duration_seconds metric
+    factory=metrics.sqlite_connection_class()
+)
+metrics.add_collector('sqlite', database.stats, gauges=('waiting', 'recent_wait', 'readers', 'readers_in_use'),
+                      counters=('readers_opened', 'reader_checkouts', 'reader_timeouts',
+                                'writes', 'write_timeouts', 'write_wait_total'))
+
+# Token buckets per user and client IP for each route class, and load shedding.
+# RATE_LIMIT_STORE=database shares the buckets between worker processes.
+rate_limiter = RateLimiter(
+    store=SQLiteBucketStore(database.writer, lease=int(os.environ.get('RATE_LIMIT_LEASE', 5)))
+    if os.environ.get('RATE_LIMIT_STORE', 'memory') == 'database' else MemoryBucketStore(),
+    limits={name: parse_limit(os.environ[f'RATE_LIMIT_{name.upper()}'])
+            for name in ROUTE_CLASSES if os.environ.get(f'RATE_LIMIT_{name.upper()}')},
+    ip_multiplier=float(os.environ.get('RATE_LIMIT_IP_MULTIPLIER', 4)),
+    trusted_proxies=int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0)),
+    enabled=os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+    max_in_flight=int(os.environ.get('SHED_MAX_IN_FLIGHT', 0)),
+    max_queue_time=float(os.environ.get('SHED_MAX_QUEUE_TIME', 0)),
+    shed_waiting=int(os.environ.get('SHED_MAX_WAITING', 0)),
+    shed_wait=float(os.environ.get('SHED_MAX_WAIT', 0))
+)
+# Only writes queue on the writer lock; reads never touch it
+rate_limiter.watch('sqlite_writer', database.load, classes=('auth', 'write'))
+rate_limiter.init_app(app)
+metrics.add_collector('rate_limiter', rate_limiter.stats, gauges=('in_flight', 'keys'),
+                      counters=('limited', 'shed', 'store_errors'))
+
+item_repository = ItemRepository('?')
+
+password_hasher = PasswordHasher(
+    method=os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256'),
+    workers=int(os.environ['PASSWORD_HASH_WORKERS']) if os.environ.get('PASSWORD_HASH_WORKERS') else None,
+    max_pending=int(os.environ['PASSWORD_HASH_MAX_PENDING']) if os.environ.get('PASSWORD_HASH_MAX_PENDING') else None,
+    timeout=float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+)
+
+auth_cache = AuthCache(
+    max_tokens=int(os.environ.get('AUTH_CACHE_MAX_TOKENS', 10000)),
+    max_users=int(os.environ.get('AUTH_CACHE_MAX_USERS', 10000)),
+    user_ttl=float(os.environ.get('AUTH_CACHE_USER_TTL', 30))
+)
+
+# Reads use a pooled read-only connection, returned when the app context ends
 def get_db():
-    db = getattr(g, '_database', None)
-    if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
-    return db
+    return database.reader()
+
+# Writes: `with write_db() as db:` commits on exit, one writer at a time
+def write_db():
+    return database.writer()
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
-    if db is not None:
-        db.close()
+    database.end_read()
+
+def load_reminders(start, end, after, limit):
+    # Runs on the scheduler thread, outside any app context
+    try:
+        return item_repository.pending_reminders(get_db().cursor(), start, end, after, limit)
+    finally:
+        database.end_read()
+
+def claim_reminder(item_id, reminder_date):
+    with write_db() as db:
+        return item_repository.claim_reminder(db.cursor(), item_id, reminder_date)
+
+reminder_scheduler = ReminderScheduler(
+    load_reminders,
+    claim_reminder,
+    sink_from_config(os.environ.get('REMINDER_SINK', 'log')),
+    window=int(os.environ.get('REMINDER_WINDOW_SECONDS', 3600)),
+    batch_size=int(os.environ.get('REMINDER_BATCH_SIZE', 1000)),
+    catchup=int(os.environ.get('REMINDER_CATCHUP_SECONDS', 3600))
+)
+
+@app.before_request
+def start_reminders():
+    # Started lazily so every worker process runs its own scheduler thread
+    if app.config['REMINDERS_ENABLED']:
+        reminder_scheduler.ensure_started()
 
 def init_db():
+    # Migrations manage their own transactions, so they get a dedicated connection
+    db = database.connect()
+    try:
+        if app.config['AUTO_MIGRATE']:
+            migrations.migrate(db, 'sqlite')
+        else:
+            pending = migrations.pending_migrations(db, 'sqlite')
+            if pending:
+                print(f"Warning: {len(pending)} schema migrations pending; "
+                      f"run 'python migrations.py --backend sqlite upgrade'")
+    finally:
+        db.close()
+
+def load_user(user_id):
     db = get_db()
-    db.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id TEXT PRIMARY KEY,
-        name TEXT NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL
-    )
-    ''')
-    
-    db.execute('''
-    CREATE TABLE IF NOT EXISTS entries (
-        id TEXT PRIMARY KEY,
-        what_to_do TEXT NOT NULL,
-        due_date TEXT,
-        reminder_date TEXT,
-        status TEXT DEFAULT 'pending',
-        user_id TEXT,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )
-    ''')
-    db.commit()
+    return db.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
 
 def token_required(f):
     @wraps(f)
@@ -66,16 +179,30 @@ def token_required(f):
             return jsonify({'message': 'Token is missing!'}), 401
         
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            db = get_db()
-            current_user = db.execute('SELECT * FROM users WHERE id = ?', 
-                               (data['user_id'],)).fetchone()
+            with phase('auth.token'):
+                data = auth_cache.verify_token(token, app.config['SECRET_KEY'])
+            with phase('auth.user'):
+                current_user = auth_cache.get_user(data['user_id'], load_user)
         except:
             return jsonify({'message': 'Token is invalid!'}), 401
-        
+
+        if not current_user:
+            # Deleted user whose token has not expired yet
+            return jsonify({'message': 'Token is invalid!'}), 401
+
+        rate_limiter.check_user(current_user['id'])
         return f(current_user, *args, **kwargs)
     return decorated
 
+def admin_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        admin_token = app.config['ADMIN_TOKEN']
+        if not admin_token or request.headers.get('x-admin-token') != admin_token:
+            return jsonify({'message': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated
+
 @app.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -83,15 +210,15 @@ def register():
     if not data or not data.get('email') or not data.get('password') or not data.get('name'):
         return jsonify({'message': 'Missing required fields'}), 400
     
-    hashed_password = generate_password_hash(data['password'], method='pbkdf2:sha256')
+    hashed_password = password_hasher.hash(data['password'])
     
     user_id = str(uuid.uuid4())
     
-    db = get_db()
     try:
-        db.execute('INSERT INTO users (id, name, email, password) VALUES (?, ?, ?, ?)',
-                  (user_id, data['name'], data['email'], hashed_password))
-        db.commit()
+        with write_db() as db:
+            db.execute('INSERT INTO users (id, name, email, password) VALUES (?, ?, ?, ?)',
+                      (user_id, data['name'], data['email'], hashed_password))
+            db.execute('INSERT INTO sync_versions (user_id, version) VALUES (?, 0)', (user_id,))
         return jsonify({'message': 'User registered successfully'}), 201
     except sqlite3.IntegrityError:
         return jsonify({'message': 'User already exists'}), 409
@@ -107,8 +234,17 @@ def login():
     user = db.execute('SELECT * FROM users WHERE email = ?', 
                      (auth['email'],)).fetchone()
     
-    if not user or not check_password_hash(user['password'], auth['password']):
+    if not user:
+        return jsonify({'message': 'Invalid credentials'}), 401
+    with phase('auth.password'):
+        valid, new_hash = password_hasher.verify_and_update(user['password'], auth['password'])
+    if not valid:
         return jsonify({'message': 'Invalid credentials'}), 401
+    if new_hash:
+        # Hash parameters changed since this password was stored
+        with write_db() as db:
+            db.execute('UPDATE users SET password = ? WHERE id = ? AND password = ?',
+                       (new_hash, user['id'], user['password']))
     
     token = jwt.encode({
         'user_id': user['id'],
@@ -124,16 +260,44 @@ def login():
         }
     })
 
+def sync_response(payload, etag, version):
+    with phase('serialize'):
+        response = json_response(payload) if payload is not None else make_response('', 304)
+    response.set_etag(etag)
+    response.headers['X-Sync-Cursor'] = str(version)
+    return response
+
 @app.route("/api/items")
 @token_required
 def get_items(current_user):
-    db = get_db()
-    cur = db.execute('SELECT id, what_to_do, due_date, reminder_date, status FROM entries WHERE user_id = ?',
-                    (current_user['id'],))
-    entries = cur.fetchall()
-    tdlist = [dict(id=row['id'], what_to_do=row['what_to_do'], due_date=row['due_date'], 
-                 reminder_date=row['reminder_date'], status=row['status']) for row in entries]
-    return jsonify(tdlist)
+    try:
+        page = PageRequest(request.args)
+        since = parse_since(request.args.get('since'))
+    except (InvalidPageRequest, InvalidSyncCursor) as e:
+        return jsonify({'message': str(e)}), 400
+    
+    cursor = get_db().cursor()
+    # Read the change counter before any rows so a racing write is resent, not missed
+    version = item_repository.sync_version(cursor, current_user['id'])
+    etag = list_etag(current_user['id'], version, request.query_string)
+    if request.if_none_match.contains_weak(etag):
+        return sync_response(None, etag, version)
+    
+    if since is not None:
+        if since > version:
+            return jsonify({'message': 'Unknown sync cursor, reload the full list'}), 410
+        entries, deleted = item_repository.changes_since(cursor, current_user['id'], since)
+        next_cursor = None
+    else:
+        entries, next_cursor = item_repository.page(cursor, page, current_user['id'])
+    
+    # Rows are encoded as they are; see serialization.py
+    if since is not None:
+        return sync_response({'items': entries, 'deleted': deleted, 'sync_cursor': str(version)}, etag, version)
+    if page.paginated:
+        return sync_response({'items': entries, 'next_cursor': next_cursor, 'sync_cursor': str(version)},
+                             etag, version)
+    return sync_response(entries, etag, version)
 
 @app.route("/api/items", methods=['POST'])
 @token_required
@@ -143,54 +307,124 @@ def add_item(current_user):
     if not data or not data.get('what_to_do'):
         return jsonify({'message': 'Task description is required'}), 400
     
-    item_id = str(uuid.uuid4())
-    db = get_db()
-    db.execute('INSERT INTO entries (id, what_to_do, due_date, reminder_date, status, user_id) VALUES (?, ?, ?, ?, ?, ?)',
-              (item_id, data['what_to_do'], data.get('due_date'), data.get('reminder_date'), 'pending', current_user['id']))
-    db.commit()
+    with write_db() as db:
+        item_id = item_repository.create(db.cursor(), current_user['id'], data['what_to_do'],
+                                         data.get('due_date'), data.get('reminder_date'))
+    if data.get('reminder_date'):
+        reminder_scheduler.item_changed(item_id, data['reminder_date'])
     
     return jsonify({'message': 'Task added successfully', 'id': item_id}), 201
 
-@app.route("/api/items/<item_id>", methods=['PUT'])
+@app.route("/api/items/search")
 @token_required
-def update_item(current_user, item_id):
-    data = request.get_json()
+def search_items(current_user):
+    try:
+        search = SearchRequest(request.args)
+    except InvalidPageRequest as e:
+        return jsonify({'message': str(e)}), 400
     
-    db = get_db()
-    item = db.execute('SELECT * FROM entries WHERE id = ? AND user_id = ?', 
-                     (item_id, current_user['id'])).fetchone()
+    cursor = get_db().cursor()
+    version = item_repository.sync_version(cursor, current_user['id'])
+    etag = list_etag(current_user['id'], version, b'search?' + request.query_string)
+    if request.if_none_match.contains_weak(etag):
+        return sync_response(None, etag, version)
     
-    if not item:
-        return jsonify({'message': 'Item not found'}), 404
+    entries, next_cursor = item_repository.search(cursor, search, current_user['id'])
+    return sync_response({'items': entries, 'next_cursor': next_cursor, 'sync_cursor': str(version)},
+                         etag, version)
+
+@app.route("/api/items/stats")
+@token_required
+def item_stats(current_user):
+    # Due dates are in the client's local time, so a client can send its own clock
+    now = datetime.datetime.now()
+    if request.args.get('now'):
+        try:
+            now = datetime.datetime.fromisoformat(request.args['now'])
+        except ValueError:
+            return jsonify({'message': 'now must be an ISO 8601 date and time'}), 400
+    
+    stats = item_repository.stats(get_db().cursor(), current_user['id'], now.strftime(DATE_FORMAT))
+    return jsonify(stats)
+
+@app.route("/api/items/batch", methods=['POST'])
+@token_required
+def batch_items(current_user):
+    data = request.get_json() or {}
+    
+    try:
+        with write_db() as db:
+            results = apply_batch(db, db.cursor(), item_repository, current_user['id'], data.get('operations'),
+                                  on_reminder=reminder_scheduler.item_changed)
+    except InvalidBatch as e:
+        return jsonify({'message': str(e)}), 400
+    
+    return jsonify({'results': results})
+
+@app.route("/api/items/export", methods=['GET'])
+@token_required
+def export_items(current_user):
+    try:
+        fmt = transfer_format(request.args.get('format'))
+    except InvalidTransfer as e:
+        return jsonify({'message': str(e)}), 400
     
-    if 'status' in data:
-        db.execute('UPDATE entries SET status = ? WHERE id = ?', (data['status'], item_id))
+    cursor = get_db().cursor()
+    item_repository.export(cursor, current_user['id'])
+    response = Response(stream_with_context(export_lines(iter_rows(cursor), fmt)), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=tasks.{fmt}'
+    return response
+
+@app.route("/api/items/import", methods=['POST'])
+@token_required
+def import_items(current_user):
+    try:
+        fmt = transfer_format(request.args.get('format'), request.content_type)
+    except InvalidTransfer as e:
+        return jsonify({'message': str(e)}), 400
     
-    if 'what_to_do' in data:
-        db.execute('UPDATE entries SET what_to_do = ? WHERE id = ?', (data['what_to_do'], item_id))
+    # Each chunk is its own write transaction, so other writers get turns in between
+    def insert_chunk(rows):
+        with write_db() as db:
+            item_repository.create_many(db.cursor(), rows)
     
-    if 'due_date' in data:
-        db.execute('UPDATE entries SET due_date = ? WHERE id = ?', (data['due_date'], item_id))
+    records = parse_csv(request.stream) if fmt == 'csv' else parse_ndjson(request.stream)
+    reports = import_records(records, item_repository, current_user['id'], insert_chunk,
+                             chunk_size=app.config['ITEM_IMPORT_CHUNK_SIZE'],
+                             max_rows=app.config['ITEM_IMPORT_MAX_ROWS'],
+                             on_reminder=reminder_scheduler.item_changed)
+    return Response(stream_with_context(json.dumps(report) + '\n' for report in reports),
+                    mimetype='application/x-ndjson')
+
+@app.route("/api/items/<item_id>", methods=['PUT'])
+@token_required
+def update_item(current_user, item_id):
+    data = request.get_json()
     
-    if 'reminder_date' in data:
-        db.execute('UPDATE entries SET reminder_date = ? WHERE id = ?', (data['reminder_date'], item_id))
+    fields = clean_fields(data)
+    # One ownership-checked statement; the row count says whether the item was found
+    if fields:
+        with write_db() as db:
+            found = item_repository.update(db.cursor(), current_user['id'], item_id, fields)
+    else:
+        found = item_repository.exists(get_db().cursor(), current_user['id'], item_id)
     
-    db.commit()
+    if not found:
+        return jsonify({'message': 'Item not found'}), 404
+    if 'reminder_date' in fields:
+        reminder_scheduler.item_changed(item_id, fields['reminder_date'])
     
     return jsonify({'message': 'Item updated successfully'})
 
 @app.route("/api/items/<item_id>", methods=['DELETE'])
 @token_required
 def delete_item(current_user, item_id):
-    db = get_db()
-    item = db.execute('SELECT * FROM entries WHERE id = ? AND user_id = ?', 
-                     (item_id, current_user['id'])).fetchone()
+    with write_db() as db:
+        found = item_repository.delete(db.cursor(), current_user['id'], item_id)
     
-    if not item:
+    if not found:
         return jsonify({'message': 'Item not found'}), 404
-    
-    db.execute('DELETE FROM entries WHERE id = ?', (item_id,))
-    db.commit()
+    reminder_scheduler.item_deleted(item_id)
     
     return jsonify({'message': 'Item deleted successfully'})
 
@@ -209,10 +443,19 @@ def translate_text(current_user):
         # Log translation attempt for debugging
         print(f"Translating text: '{data['text']}' to language '{data['target_language']}'")
         
-        result = translate_client.translate(
-            data['text'],
-            target_language=data['target_language']
-        )
+        start = time.monotonic()
+        try:
+            with phase('translate.providers'):
+                result = translate_client.translate(
+                    data['text'],
+                    target_language=data['target_language']
+                )
+        except Exception:
+            metrics.record_translation('google_cloud', data['target_language'], 'error',
+                                       time.monotonic() - start)
+            raise
+        metrics.record_translation('google_cloud', data['target_language'], 'success',
+                                   time.monotonic() - start)
         
         # Log successful translation
         print(f"Translation successful: '{result['translatedText']}'")
@@ -237,6 +480,86 @@ def get_user_profile(current_user):
         'email': current_user['email']
     })
 
+@app.route("/api/user", methods=['PUT'])
+@token_required
+def update_user_profile(current_user):
+    data = request.get_json() or {}
+    
+    fields = []
+    params = []
+    if data.get('name'):
+        fields.append('name = ?')
+        params.append(data['name'])
+    if data.get('email'):
+        fields.append('email = ?')
+        params.append(data['email'])
+    if data.get('password'):
+        fields.append('password = ?')
+        params.append(password_hasher.hash(data['password']))
+    
+    if not fields:
+        return jsonify({'message': 'Nothing to update'}), 400
+    
+    try:
+        params.append(current_user['id'])
+        with write_db() as db:
+            db.execute(f"UPDATE users SET {', '.join(fields)} WHERE id = ?", params)
+    except sqlite3.IntegrityError:
+        return jsonify({'message': 'Email already in use'}), 409
+    finally:
+        auth_cache.invalidate_user(current_user['id'])
+    
+    return jsonify({'message': 'User updated successfully'})
+
+@app.route("/api/user", methods=['DELETE'])
+@token_required
+def delete_user(current_user):
+    with write_db() as db:
+        db.execute('DELETE FROM entries WHERE user_id = ?', (current_user['id'],))
+        db.execute('DELETE FROM entry_tombstones WHERE user_id = ?', (current_user['id'],))
+        db.execute('DELETE FROM sync_versions WHERE user_id = ?', (current_user['id'],))
+        db.execute('DELETE FROM task_counts WHERE user_id = ?', (current_user['id'],))
+        db.execute('DELETE FROM users WHERE id = ?', (current_user['id'],))
+    auth_cache.invalidate_user(current_user['id'])
+    
+    return jsonify({'message': 'User deleted successfully'})
+
+@app.route("/api/admin/stats", methods=['GET'])
+@admin_required
+def admin_stats():
+    return jsonify({'auth_cache': auth_cache.stats(), 'sqlite': database.stats(),
+                    'reminders': reminder_scheduler.stats(), 'password_hasher': password_hasher.stats(),
+                    'rate_limiter': rate_limiter.stats()})
+
+@app.route("/api/admin/profiles", methods=['GET'])
+@admin_required
+def admin_profiles():
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({'profiles': request_profiler.list(limit)})
+
+@app.route("/api/admin/profiles/<profile_id>", methods=['GET'])
+@admin_required
+def admin_profile(profile_id):
+    report = request_profiler.get(profile_id)
+    if report is None:
+        return jsonify({'message': 'Profile not found'}), 404
+    return jsonify(report)
+
+@app.errorhandler(ReaderBusy)
+@app.errorhandler(WriterBusy)
+def handle_writer_busy(e):
+    response = jsonify({'message': 'Database busy, please retry'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+@app.errorhandler(HasherBusy)
+def handle_hasher_busy(e):
+    response = jsonify({'message': 'Server busy, please retry'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 @app.route("/health")
 def health_check():
     """Health check endpoint for Kubernetes liveness probe."""
@@ -247,9 +570,12 @@ def health_check():
     except Exception as e:
         return jsonify({"status": "unhealthy", "error": str(e)}), 500
 
-# Initialize database when app starts
-with app.app_context():
-    init_db()
+# Importing this module must stay free of side effects: the password hashing
+# forkserver re-imports the main module, so the database is set up here instead
+def create_app():
+    with app.app_context():
+        init_db()
+    return app
 
 if __name__ == "__main__":
-    app.run("0.0.0.0", port=5050)
+    create_app().run("0.0.0.0", port=5050)
@@ -1,75 +1,235 @@
-from flask import Flask, jsonify, g, request, make_response
+from flask import Flask, jsonify, g, request, make_response, Response, stream_with_context
 import pymysql
 import jwt
 from functools import wraps
 import datetime
 import os
-import requests
 import json
-from werkzeug.security import generate_password_hash, check_password_hash
 import uuid
 from flask_cors import CORS
+from db_pool import ConnectionPool, PoolExhausted
+from password_hasher import PasswordHasher, HasherBusy
+from auth_cache import AuthCache
+from translation_cache import TranslationCache, MySQLTranslationStore, normalize_text
+from translation_providers import TranslationEngine, default_providers
+from provider_scoreboard import ProviderScoreboard
+from pagination import PageRequest, InvalidPageRequest
+from search import SearchRequest
+import migrations
+from item_batch import apply_batch, InvalidBatch
+from item_repository import ItemRepository, clean_fields, DATE_FORMAT
+from sync import InvalidSyncCursor, parse_since, list_etag
+from serialization import json_response
+from http_middleware import HTTPMiddleware
+from item_transfer import (InvalidTransfer, FORMATS, transfer_format, iter_rows, export_lines,
+                           parse_ndjson, parse_csv, import_records)
+from reminders import ReminderScheduler, sink_from_config
+from metrics import Metrics
+from request_profiler import RequestProfiler, phase, record_query
+from rate_limiter import RateLimiter, MemoryBucketStore, MySQLBucketStore, ROUTE_CLASSES, parse_limit
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+CORS(app, expose_headers=['ETag', 'X-Sync-Cursor'])  # Enable CORS for all routes
+# Prometheus metrics at /metrics; installed first so its after_request hook sees the final status
+metrics = Metrics()
+metrics.init_app(app, token=os.environ.get('METRICS_TOKEN'))
+# Opt-in per-request profiling: sampled, or forced with X-Profile plus x-admin-token
+request_profiler = RequestProfiler(
+    directory=os.environ.get('PROFILE_DIR'),
+    sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+    slow_threshold=float(os.environ.get('PROFILE_SLOW_THRESHOLD', 1.0)),
+    capacity=int(os.environ.get('PROFILE_CAPACITY', 200)),
+    mode=os.environ.get('PROFILE_MODE', 'timeline'),
+    admin_token=os.environ.get('ADMIN_TOKEN')
+)
+request_profiler.init_app(app)
+metrics.on_query = record_query
+# Compression, conditional GETs and cache headers for all routes
+HTTPMiddleware(app, min_size=int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+               level=int(os.environ.get('COMPRESSION_LEVEL', 6)))
 
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_secret_key')
 app.config['MYSQL_HOST'] = os.environ.get('MYSQL_HOST', 'mysql')
 app.config['MYSQL_USER'] = os.environ.get('MYSQL_USER', 'todouser')
 app.config['MYSQL_PASSWORD'] = os.environ.get('MYSQL_PASSWORD', 'todopassword')
 app.config['MYSQL_DB'] = os.environ.get('MYSQL_DB', 'tododb')
+app.config['MYSQL_POOL_SIZE'] = int(os.environ.get('MYSQL_POOL_SIZE', 10))
+app.config['MYSQL_POOL_TIMEOUT'] = float(os.environ.get('MYSQL_POOL_TIMEOUT', 5))
+app.config['MYSQL_POOL_MAX_IDLE'] = int(os.environ.get('MYSQL_POOL_MAX_IDLE', 300))
+app.config['MYSQL_POOL_MAX_LIFETIME'] = int(os.environ.get('MYSQL_POOL_MAX_LIFETIME', 3600))
+app.config['MYSQL_POOL_PING_INTERVAL'] = int(os.environ.get('MYSQL_POOL_PING_INTERVAL', 30))
+app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+# Migrations run once per deploy via `python migrations.py --backend mysql upgrade`
+app.config['AUTO_MIGRATE'] = os.environ.get('AUTO_MIGRATE', 'false').lower() == 'true'
+app.config['ITEM_IMPORT_CHUNK_SIZE'] = int(os.environ.get('ITEM_IMPORT_CHUNK_SIZE', 500))
+app.config['ITEM_IMPORT_MAX_ROWS'] = int(os.environ.get('ITEM_IMPORT_MAX_ROWS', 100000))
+app.config['REMINDERS_ENABLED'] = os.environ.get('REMINDERS_ENABLED', 'true').lower() == 'true'
+app.config['TRANSLATION_BATCH_MAX_TEXTS'] = int(os.environ.get('TRANSLATION_BATCH_MAX_TEXTS', 200))
+app.config['TRANSLATION_BATCH_MAX_LANGUAGES'] = int(os.environ.get('TRANSLATION_BATCH_MAX_LANGUAGES', 10))
+
+def _connect():
+    """Open a new MySQL connection for the pool."""
+    return pymysql.connect(
+        host=app.config['MYSQL_HOST'],
+        user=app.config['MYSQL_USER'],
+        password=app.config['MYSQL_PASSWORD'],
+        database=app.config['MYSQL_DB'],
+        cursorclass=metrics.cursor_class(pymysql.cursors.DictCursor),
+        # Report matched rather than changed rows, so rowcount confirms ownership
+        client_flag=pymysql.constants.CLIENT.FOUND_ROWS
+    )
+
+db_pool = ConnectionPool(
+    _connect,
+    max_size=app.config['MYSQL_POOL_SIZE'],
+    timeout=app.config['MYSQL_POOL_TIMEOUT'],
+    max_idle_time=app.config['MYSQL_POOL_MAX_IDLE'],
+    max_lifetime=app.config['MYSQL_POOL_MAX_LIFETIME'],
+    ping_interval=app.config['MYSQL_POOL_PING_INTERVAL']
+)
+
+metrics.add_collector('db_pool', db_pool.stats,
+                      gauges=('size', 'max_size', 'idle', 'in_use', 'waiting', 'recent_wait'),
+                      counters=('created', 'closed', 'checkouts', 'timeouts', 'health_check_failures',
+                                'wait_time_total'))
+
+item_repository = ItemRepository('%s', 'mysql')
+
+password_hasher = PasswordHasher(
+    method=os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256'),
+    workers=int(os.environ['PASSWORD_HASH_WORKERS']) if os.environ.get('PASSWORD_HASH_WORKERS') else None,
+    max_pending=int(os.environ['PASSWORD_HASH_MAX_PENDING']) if os.environ.get('PASSWORD_HASH_MAX_PENDING') else None,
+    timeout=float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+)
+
+auth_cache = AuthCache(
+    max_tokens=int(os.environ.get('AUTH_CACHE_MAX_TOKENS', 10000)),
+    max_users=int(os.environ.get('AUTH_CACHE_MAX_USERS', 10000)),
+    user_ttl=float(os.environ.get('AUTH_CACHE_USER_TTL', 30))
+)
+
+provider_scoreboard = ProviderScoreboard(
+    failure_threshold=int(os.environ.get('TRANSLATION_BREAKER_THRESHOLD', 5)),
+    cooldown=float(os.environ.get('TRANSLATION_BREAKER_COOLDOWN', 30)),
+    max_cooldown=float(os.environ.get('TRANSLATION_BREAKER_MAX_COOLDOWN', 600)),
+    listener=metrics.record_translation
+)
+
+translation_engine = TranslationEngine(
+    providers=default_providers(os.environ.get('TRANSLATION_PROVIDER_BASE_URL')),
+    scoreboard=provider_scoreboard,
+    concurrency=int(os.environ.get('TRANSLATION_CONCURRENCY', 2)),
+    hedge_delay=float(os.environ.get('TRANSLATION_HEDGE_DELAY', 0.3)),
+    provider_timeout=float(os.environ.get('TRANSLATION_PROVIDER_TIMEOUT', 3)),
+    overall_timeout=float(os.environ.get('TRANSLATION_TIMEOUT', 6)),
+    max_workers=int(os.environ.get('TRANSLATION_WORKERS', 32))
+)
+
+NO_TRANSLATION_SERVICE = 'No translation available'
 
 def get_db():
-    """Connect to the MySQL database."""
+    """Check a MySQL connection out of the pool for this request."""
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = pymysql.connect(
-            host=app.config['MYSQL_HOST'],
-            user=app.config['MYSQL_USER'],
-            password=app.config['MYSQL_PASSWORD'],
-            database=app.config['MYSQL_DB'],
-            cursorclass=pymysql.cursors.DictCursor
-        )
+        db = g._database = db_pool.acquire()
     return db
 
+def release_db():
+    """Return this request's connection to the pool; ``get_db`` checks out a new one if needed."""
+    db = g.pop('_database', None)
+    if db is not None:
+        db_pool.release(db)
+
 @app.teardown_appcontext
 def close_connection(exception):
-    """Close the database connection at the end of the request."""
-    db = getattr(g, '_database', None)
-    if db is not None:
-        db.close()
+    """Return the database connection to the pool at the end of the request."""
+    release_db()
+
+translation_cache = TranslationCache(
+    store=MySQLTranslationStore(
+        get_db,
+        ttl=int(os.environ.get('TRANSLATION_CACHE_DB_TTL', 30 * 24 * 3600))
+    ),
+    max_size=int(os.environ.get('TRANSLATION_CACHE_SIZE', 5000)),
+    ttl=float(os.environ.get('TRANSLATION_CACHE_TTL', 3600))
+)
+
+# Token buckets per user and client IP for each route class, and load shedding.
+# RATE_LIMIT_STORE=database shares the buckets between replicas.
+rate_limiter = RateLimiter(
+    store=MySQLBucketStore(get_db, lease=int(os.environ.get('RATE_LIMIT_LEASE', 5)))
+    if os.environ.get('RATE_LIMIT_STORE', 'memory') == 'database' else MemoryBucketStore(),
+    limits={name: parse_limit(os.environ[f'RATE_LIMIT_{name.upper()}'])
+            for name in ROUTE_CLASSES if os.environ.get(f'RATE_LIMIT_{name.upper()}')},
+    ip_multiplier=float(os.environ.get('RATE_LIMIT_IP_MULTIPLIER', 4)),
+    trusted_proxies=int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0)),
+    enabled=os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+    max_in_flight=int(os.environ.get('SHED_MAX_IN_FLIGHT', 0)),
+    max_queue_time=float(os.environ.get('SHED_MAX_QUEUE_TIME', 0)),
+    shed_waiting=int(os.environ.get('SHED_MAX_WAITING', 0)),
+    shed_wait=float(os.environ.get('SHED_MAX_WAIT', 0))
+)
+rate_limiter.watch('db_pool', db_pool.load)
+rate_limiter.init_app(app)
+metrics.add_collector('rate_limiter', rate_limiter.stats, gauges=('in_flight', 'keys'),
+                      counters=('limited', 'shed', 'store_errors'))
+
+def load_reminders(start, end, after, limit):
+    """Load a batch of upcoming reminders on a pooled connection (scheduler thread)."""
+    with app.app_context():
+        return item_repository.pending_reminders(get_db().cursor(), start, end, after, limit)
+
+def claim_reminder(item_id, reminder_date):
+    """Mark a due reminder sent; returns the item or None (scheduler thread)."""
+    with app.app_context():
+        db = get_db()
+        reminder = item_repository.claim_reminder(db.cursor(), item_id, reminder_date)
+        db.commit()
+        return reminder
+
+reminder_scheduler = ReminderScheduler(
+    load_reminders,
+    claim_reminder,
+    sink_from_config(os.environ.get('REMINDER_SINK', 'log')),
+    window=int(os.environ.get('REMINDER_WINDOW_SECONDS', 3600)),
+    batch_size=int(os.environ.get('REMINDER_BATCH_SIZE', 1000)),
+    catchup=int(os.environ.get('REMINDER_CATCHUP_SECONDS', 3600))
+)
+
+@app.before_request
+def start_reminders():
+    """Start this worker process's reminder scheduler on its first request."""
+    if app.config['REMINDERS_ENABLED']:
+        reminder_scheduler.ensure_started()
 
 def init_db():
-    """Initialize the database tables if they don't exist."""
+    """Apply pending schema migrations, or warn about them when AUTO_MIGRATE is off."""
+    db = get_db()
+    if app.config['AUTO_MIGRATE']:
+        migrations.migrate(db, 'mysql')
+    else:
+        pending = migrations.pending_migrations(db, 'mysql')
+        if pending:
+            print(f"Warning: {len(pending)} schema migrations pending; "
+                  f"run 'python migrations.py --backend mysql upgrade'")
+
+def load_user(user_id):
+    """Fetch a user row by id."""
     db = get_db()
     cursor = db.cursor()
-    
-    # Create users table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id VARCHAR(36) PRIMARY KEY,
-        name VARCHAR(100) NOT NULL,
-        email VARCHAR(100) UNIQUE NOT NULL,
-        password VARCHAR(255) NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Create entries table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS entries (
-        id VARCHAR(36) PRIMARY KEY,
-        what_to_do TEXT NOT NULL,
-        due_date DATETIME,
-        reminder_date DATETIME,
-        status VARCHAR(20) DEFAULT 'pending',
-        user_id VARCHAR(36),
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-    )
-    ''')
-    
-    db.commit()
+    cursor.execute('SELECT * FROM users WHERE id = %s', (user_id,))
+    return cursor.fetchone()
+
+def authenticate(token):
+    """Return the user a JWT belongs to; raises if the token or the user is invalid."""
+    with phase('auth.token'):
+        data = auth_cache.verify_token(token, app.config['SECRET_KEY'])
+    with phase('auth.user'):
+        current_user = auth_cache.get_user(data['user_id'], load_user)
+    
+    if not current_user:
+        raise Exception('User not found')
+    return current_user
 
 def token_required(f):
     """Decorator to require a valid JWT token for API access."""
@@ -83,21 +243,24 @@ def token_required(f):
             return jsonify({'message': 'Token is missing!'}), 401
         
         try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            db = get_db()
-            cursor = db.cursor()
-            cursor.execute('SELECT * FROM users WHERE id = %s', (data['user_id'],))
-            current_user = cursor.fetchone()
-            
-            if not current_user:
-                raise Exception('User not found')
-                
+            current_user = authenticate(token)
         except Exception as e:
             return jsonify({'message': f'Token is invalid! {str(e)}'}), 401
         
+        rate_limiter.check_user(current_user['id'])
         return f(current_user, *args, **kwargs)
     return decorated
 
+def admin_required(f):
+    """Decorator to restrict operational endpoints to holders of ADMIN_TOKEN."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        admin_token = app.config['ADMIN_TOKEN']
+        if not admin_token or request.headers.get('x-admin-token') != admin_token:
+            return jsonify({'message': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated
+
 @app.route('/api/register', methods=['POST'])
 def register():
     """Register a new user."""
@@ -106,7 +269,7 @@ def register():
     if not data or not data.get('email') or not data.get('password') or not data.get('name'):
         return jsonify({'message': 'Missing required fields'}), 400
     
-    hashed_password = generate_password_hash(data['password'], method='pbkdf2:sha256')
+    hashed_password = password_hasher.hash(data['password'])
     user_id = str(uuid.uuid4())
     
     db = get_db()
@@ -117,6 +280,7 @@ def register():
             'INSERT INTO users (id, name, email, password) VALUES (%s, %s, %s, %s)',
             (user_id, data['name'], data['email'], hashed_password)
         )
+        cursor.execute('INSERT INTO sync_versions (user_id, version) VALUES (%s, 0)', (user_id,))
         db.commit()
         return jsonify({'message': 'User registered successfully'}), 201
     except pymysql.err.IntegrityError:
@@ -134,9 +298,21 @@ def login():
     cursor = db.cursor()
     cursor.execute('SELECT * FROM users WHERE email = %s', (auth['email'],))
     user = cursor.fetchone()
+    # Don't hold a pooled connection while the password is checked
+    release_db()
     
-    if not user or not check_password_hash(user['password'], auth['password']):
+    if not user:
+        return jsonify({'message': 'Invalid credentials'}), 401
+    with phase('auth.password'):
+        valid, new_hash = password_hasher.verify_and_update(user['password'], auth['password'])
+    if not valid:
         return jsonify({'message': 'Invalid credentials'}), 401
+    if new_hash:
+        # Hash parameters changed since this password was stored
+        db = get_db()
+        db.cursor().execute('UPDATE users SET password = %s WHERE id = %s AND password = %s',
+                            (new_hash, user['id'], user['password']))
+        db.commit()
     
     token = jwt.encode({
         'user_id': user['id'],
@@ -152,26 +328,47 @@ def login():
         }
     })
 
+def sync_response(payload, etag, version):
+    """Attach the listing's ETag and sync cursor; ``payload=None`` makes a 304."""
+    with phase('serialize'):
+        response = json_response(payload) if payload is not None else make_response('', 304)
+    response.set_etag(etag)
+    response.headers['X-Sync-Cursor'] = str(version)
+    return response
+
 @app.route("/api/items")
 @token_required
 def get_items(current_user):
-    """Get all todo items for the current user."""
+    """Get the current user's todo items, paginated by keyset or as changes since a sync cursor."""
+    try:
+        page = PageRequest(request.args)
+        since = parse_since(request.args.get('since'))
+    except (InvalidPageRequest, InvalidSyncCursor) as e:
+        return jsonify({'message': str(e)}), 400
+    
     db = get_db()
     cursor = db.cursor()
-    cursor.execute(
-        'SELECT id, what_to_do, due_date, reminder_date, status FROM entries WHERE user_id = %s',
-        (current_user['id'],)
-    )
-    entries = cursor.fetchall()
     
-    # Format dates for JSON serialization
-    for entry in entries:
-        if entry['due_date']:
-            entry['due_date'] = entry['due_date'].strftime('%Y-%m-%d %H:%M:%S')
-        if entry['reminder_date']:
-            entry['reminder_date'] = entry['reminder_date'].strftime('%Y-%m-%d %H:%M:%S')
-    
-    return jsonify(entries)
+    # Read the change counter before any rows so a racing write is resent, not missed
+    version = item_repository.sync_version(cursor, current_user['id'])
+    etag = list_etag(current_user['id'], version, request.query_string)
+    if request.if_none_match.contains_weak(etag):
+        return sync_response(None, etag, version)
+    
+    if since is not None:
+        if since > version:
+            return jsonify({'message': 'Unknown sync cursor, reload the full list'}), 410
+        entries, deleted = item_repository.changes_since(cursor, current_user['id'], since)
+    else:
+        entries, next_cursor = item_repository.page(cursor, page, current_user['id'])
+    
+    # Dates are formatted by the encoder; see serialization.py
+    if since is not None:
+        return sync_response({'items': entries, 'deleted': deleted, 'sync_cursor': str(version)}, etag, version)
+    if page.paginated:
+        return sync_response({'items': entries, 'next_cursor': next_cursor, 'sync_cursor': str(version)},
+                             etag, version)
+    return sync_response(entries, etag, version)
 
 @app.route("/api/items", methods=['POST'])
 @token_required
@@ -182,93 +379,145 @@ def add_item(current_user):
     if not data or not data.get('what_to_do'):
         return jsonify({'message': 'Task description is required'}), 400
     
-    item_id = str(uuid.uuid4())
     db = get_db()
-    cursor = db.cursor()
-    
-    cursor.execute(
-        'INSERT INTO entries (id, what_to_do, due_date, reminder_date, status, user_id) VALUES (%s, %s, %s, %s, %s, %s)',
-        (
-            item_id,
-            data['what_to_do'],
-            data.get('due_date'),
-            data.get('reminder_date'),
-            'pending',
-            current_user['id']
-        )
-    )
+    item_id = item_repository.create(db.cursor(), current_user['id'], data['what_to_do'],
+                                     data.get('due_date'), data.get('reminder_date'))
     db.commit()
+    if data.get('reminder_date'):
+        reminder_scheduler.item_changed(item_id, data['reminder_date'])
     
     return jsonify({'message': 'Task added successfully', 'id': item_id}), 201
 
+@app.route("/api/items/search")
+@token_required
+def search_items(current_user):
+    """Search the current user's tasks by description, best matches first."""
+    try:
+        search = SearchRequest(request.args)
+    except InvalidPageRequest as e:
+        return jsonify({'message': str(e)}), 400
+    
+    cursor = get_db().cursor()
+    version = item_repository.sync_version(cursor, current_user['id'])
+    etag = list_etag(current_user['id'], version, b'search?' + request.query_string)
+    if request.if_none_match.contains_weak(etag):
+        return sync_response(None, etag, version)
+    
+    entries, next_cursor = item_repository.search(cursor, search, current_user['id'])
+    return sync_response({'items': entries, 'next_cursor': next_cursor, 'sync_cursor': str(version)},
+                         etag, version)
+
+@app.route("/api/items/stats")
+@token_required
+def item_stats(current_user):
+    """Task counts by status and the number of overdue tasks, from per-user counters."""
+    # Due dates are in the client's local time, so a client can send its own clock
+    now = datetime.datetime.now()
+    if request.args.get('now'):
+        try:
+            now = datetime.datetime.fromisoformat(request.args['now'])
+        except ValueError:
+            return jsonify({'message': 'now must be an ISO 8601 date and time'}), 400
+    
+    stats = item_repository.stats(get_db().cursor(), current_user['id'], now.strftime(DATE_FORMAT))
+    return jsonify(stats)
+
+@app.route("/api/items/batch", methods=['POST'])
+@token_required
+def batch_items(current_user):
+    """Apply mixed create/update/delete operations in one transaction."""
+    data = request.get_json() or {}
+    
+    db = get_db()
+    try:
+        results = apply_batch(db, db.cursor(), item_repository, current_user['id'], data.get('operations'),
+                              on_reminder=reminder_scheduler.item_changed)
+    except InvalidBatch as e:
+        return jsonify({'message': str(e)}), 400
+    
+    return jsonify({'results': results})
+
+@app.route("/api/items/export", methods=['GET'])
+@token_required
+def export_items(current_user):
+    """Stream all of the user's tasks as NDJSON or CSV from a server-side cursor."""
+    try:
+        fmt = transfer_format(request.args.get('format'))
+    except InvalidTransfer as e:
+        return jsonify({'message': str(e)}), 400
+    
+    cursor = get_db().cursor(metrics.cursor_class(pymysql.cursors.SSDictCursor))
+    item_repository.export(cursor, current_user['id'])
+    response = Response(stream_with_context(export_lines(iter_rows(cursor), fmt)), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=tasks.{fmt}'
+    return response
+
+@app.route("/api/items/import", methods=['POST'])
+@token_required
+def import_items(current_user):
+    """Import tasks from an NDJSON or CSV upload in chunked transactions, streaming a report."""
+    try:
+        fmt = transfer_format(request.args.get('format'), request.content_type)
+    except InvalidTransfer as e:
+        return jsonify({'message': str(e)}), 400
+    
+    def insert_chunk(rows):
+        db = get_db()
+        try:
+            item_repository.create_many(db.cursor(), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    
+    records = parse_csv(request.stream) if fmt == 'csv' else parse_ndjson(request.stream)
+    reports = import_records(records, item_repository, current_user['id'], insert_chunk,
+                             chunk_size=app.config['ITEM_IMPORT_CHUNK_SIZE'],
+                             max_rows=app.config['ITEM_IMPORT_MAX_ROWS'],
+                             on_reminder=reminder_scheduler.item_changed)
+    return Response(stream_with_context(json.dumps(report) + '\n' for report in reports),
+                    mimetype='application/x-ndjson')
+
 @app.route("/api/items/<item_id>", methods=['PUT'])
 @token_required
 def update_item(current_user, item_id):
-    """Update an existing todo item."""
+    """Update an existing todo item with one ownership-checked statement."""
     data = request.get_json()
     
     db = get_db()
     cursor = db.cursor()
-    cursor.execute(
-        'SELECT * FROM entries WHERE id = %s AND user_id = %s',
-        (item_id, current_user['id'])
-    )
-    item = cursor.fetchone()
+    fields = clean_fields(data)
+    if fields:
+        found = item_repository.update(cursor, current_user['id'], item_id, fields)
+    else:
+        found = item_repository.exists(cursor, current_user['id'], item_id)
     
-    if not item:
+    if not found:
         return jsonify({'message': 'Item not found'}), 404
     
-    update_fields = []
-    params = []
-    
-    if 'status' in data:
-        update_fields.append('status = %s')
-        params.append(data['status'])
-    
-    if 'what_to_do' in data:
-        update_fields.append('what_to_do = %s')
-        params.append(data['what_to_do'])
-    
-    if 'due_date' in data:
-        update_fields.append('due_date = %s')
-        params.append(data['due_date'])
-    
-    if 'reminder_date' in data:
-        update_fields.append('reminder_date = %s')
-        params.append(data['reminder_date'])
-    
-    if update_fields:
-        query = f"UPDATE entries SET {', '.join(update_fields)} WHERE id = %s"
-        params.append(item_id)
-        cursor.execute(query, params)
-        db.commit()
+    db.commit()
+    if 'reminder_date' in fields:
+        reminder_scheduler.item_changed(item_id, fields['reminder_date'])
     
     return jsonify({'message': 'Item updated successfully'})
 
 @app.route("/api/items/<item_id>", methods=['DELETE'])
 @token_required
 def delete_item(current_user, item_id):
-    """Delete a todo item."""
+    """Delete a todo item with one ownership-checked statement."""
     db = get_db()
-    cursor = db.cursor()
-    cursor.execute(
-        'SELECT * FROM entries WHERE id = %s AND user_id = %s',
-        (item_id, current_user['id'])
-    )
-    item = cursor.fetchone()
-    
-    if not item:
+    if not item_repository.delete(db.cursor(), current_user['id'], item_id):
         return jsonify({'message': 'Item not found'}), 404
     
-    cursor.execute('DELETE FROM entries WHERE id = %s', (item_id,))
     db.commit()
+    reminder_scheduler.item_deleted(item_id)
     
     return jsonify({'message': 'Item deleted successfully'})
 
 @app.route("/api/translate", methods=['POST'])
 @token_required
 def translate_text(current_user):
-    """Translate text using public translation APIs."""
+    """Translate text, serving repeated requests from the translation cache."""
     data = request.get_json()
     
     if not data or not data.get('text') or not data.get('target_language'):
@@ -277,321 +526,148 @@ def translate_text(current_user):
     original_text = data['text']
     target_lang = data['target_language']
     
+    with phase('translate.cache'):
+        cached, tier = translation_cache.get(original_text, target_lang)
+    if cached is not None:
+        return jsonify({
+            'original_text': original_text,
+            'translated_text': cached['translated_text'],
+            'source_language': cached['source_language'],
+            'target_language': target_lang,
+            'service': cached['service'],
+            'cached': True,
+            'cache_tier': tier
+        })
+
+    # Don't hold a pooled connection while the providers are called
+    release_db()
+    with phase('translate.providers'):
+        result = translate_with_providers(original_text, target_lang)
+    if result['service'] != NO_TRANSLATION_SERVICE:
+        with phase('translate.cache_store'):
+            translation_cache.set(original_text, target_lang, result)
+    
+    result['cached'] = False
+    return jsonify(result)
+
+def translate_with_providers(original_text, target_lang):
+    """Translate text using public translation APIs."""
     print(f"Translating: '{original_text}' to {target_lang}")
     
-    # Ensure we're using standard language codes for all APIs
-    # MyMemory API language codes
-    mymemory_lang_map = {
-        'en': 'en',
-        'fr': 'fr',
-        'es': 'es', 
-        'it': 'it',
-        'de': 'de',
-        'zh-CN': 'zh',  # MyMemory uses 'zh' for Chinese
-        'ja': 'ja',
-        'ko': 'ko',
-        'ru': 'ru'
-    }
-    
-    # Google Translate language codes
-    google_lang_map = {
-        'en': 'en',
-        'fr': 'fr',
-        'es': 'es',
-        'it': 'it',
-        'de': 'de',
-        'zh-CN': 'zh',  # Google sometimes uses just 'zh'
-        'ja': 'ja',
-        'ko': 'ko',
-        'ru': 'ru'
-    }
-    
-    # LingoJAM language codes
-    lingo_lang_map = {
-        'en': 'english',
-        'fr': 'french',
-        'es': 'spanish',
-        'it': 'italian',
-        'de': 'german',
-        'zh-CN': 'chinese',
-        'ja': 'japanese',
-        'ko': 'korean',
-        'ru': 'russian'
+    result = translation_engine.translate(original_text, target_lang)
+    if result is not None:
+        return result
+    return untranslated_result(original_text, target_lang)
+
+def untranslated_result(original_text, target_lang):
+    """Response body used when every translation provider failed."""
+    # If all translation services fail, we return the original text
+    print("All translation APIs failed")
+    return {
+        'original_text': original_text,
+        'translated_text': original_text,  # Return original if all APIs fail
+        'source_language': 'en',
+        'target_language': target_lang,
+        'service': NO_TRANSLATION_SERVICE
     }
+
+@app.route("/api/translate/batch", methods=['POST'])
+@token_required
+def translate_batch(current_user):
+    """Translate many texts into one or more languages, streaming NDJSON results in order.
+
+    Duplicate texts are translated once, cached ones are served from the
+    translation cache and the rest are packed into as few provider calls as
+    each provider allows.  Invalid items get an error line of their own.
+    """
+    data = request.get_json()
     
-    # Import urllib.parse for URL encoding
-    import urllib.parse
-    encoded_text = urllib.parse.quote(original_text)
-    
-    # 1. First attempt: MyMemory Translation API
-    try:
-        mm_lang = mymemory_lang_map.get(target_lang, target_lang)
-        url = f"https://api.mymemory.translated.net/get?q={encoded_text}&langpair=en|{mm_lang}"
-        
-        print(f"Trying MyMemory API: {url}")
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            result = response.json()
-            
-            if result and 'responseData' in result and 'translatedText' in result['responseData']:
-                translated_text = result['responseData']['translatedText']
-                
-                # Sometimes the API returns HTML entities, let's fix that
-                import html
-                translated_text = html.unescape(translated_text)
-                
-                # Check if we got a sensible translation (not just the original text)
-                if translated_text.lower() != original_text.lower():
-                    return jsonify({
-                        'original_text': original_text,
-                        'translated_text': translated_text,
-                        'source_language': 'en',
-                        'target_language': target_lang,
-                        'service': 'MyMemory Translation API'
-                    })
-    except Exception as e:
-        print(f"MyMemory API exception: {str(e)}")
-    
-    # 2. Direct method for Asian languages and Russian
-    if target_lang in ['zh-CN', 'ja', 'ko', 'ru']:
-        try:
-            # Use a different approach for these languages
-            # This approach works very well for Asian languages and Russian
-            target = target_lang.split('-')[0] if '-' in target_lang else target_lang
-            
-            # Using a simpler URL format that works well with these languages
-            url = f"https://translate.googleapis.com/translate_a/single?client=gtx&sl=en&tl={target}&dt=t&q={encoded_text}"
-            
-            print(f"Trying specialized API for {target_lang}: {url}")
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            response = requests.get(url, headers=headers)
-            
-            if response.status_code == 200:
-                try:
-                    # Parse the response
-                    content = response.text
-                    
-                    # Sometimes the response might not be valid JSON, so we'll parse it carefully
-                    import json
-                    result = json.loads(content)
-                    
-                    if result and isinstance(result, list) and len(result) > 0 and isinstance(result[0], list):
-                        # Extract the translation from Google's nested array format
-                        translated_parts = []
-                        for item in result[0]:
-                            if item and len(item) > 0 and isinstance(item[0], str):
-                                translated_parts.append(item[0])
-                        
-                        translated_text = ''.join(translated_parts)
-                        
-                        # If we got a valid translation, return it
-                        if translated_text and translated_text.strip():
-                            return jsonify({
-                                'original_text': original_text,
-                                'translated_text': translated_text,
-                                'source_language': 'en',
-                                'target_language': target_lang,
-                                'service': 'Google Translate (Specialized)'
-                            })
-                except Exception as e:
-                    print(f"Specialized translation parsing error: {str(e)}")
-        except Exception as e:
-            print(f"Specialized translation API exception: {str(e)}")
-    
-    # 3. General Google Translate API (unofficial)
-    try:
-        google_lang = google_lang_map.get(target_lang, target_lang)
-        url = f"https://translate.googleapis.com/translate_a/single?client=gtx&sl=en&tl={google_lang}&dt=t&q={encoded_text}"
-        
-        print(f"Trying Google Translate API: {url}")
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 200:
-            try:
-                result = response.json()
-                if result and isinstance(result, list) and len(result) > 0 and isinstance(result[0], list):
-                    # Extract the translation from Google's nested array format
-                    translated_parts = [part[0] for part in result[0] if part and len(part) > 0]
-                    translated_text = ''.join(translated_parts)
-                    
-                    # Check if we got a sensible translation
-                    if translated_text.lower() != original_text.lower():
-                        return jsonify({
-                            'original_text': original_text,
-                            'translated_text': translated_text,
-                            'source_language': 'auto',
-                            'target_language': target_lang,
-                            'service': 'Google Translate'
-                        })
-            except Exception as e:
-                print(f"Google Translate parsing error: {str(e)}")
-    except Exception as e:
-        print(f"Google Translate API exception: {str(e)}")
-    
-    # 3. Third attempt: LingoJAM API
-    try:
-        if target_lang in lingo_lang_map:
-            lingo_lang = lingo_lang_map[target_lang]
-            
-            url = f"https://lingojam.com/api/api.php?action=translate&from=english&to={lingo_lang}&text={encoded_text}"
-            print(f"Trying LingoJAM API: {url}")
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            response = requests.get(url, headers=headers)
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result and 'translatedText' in result:
-                    translated_text = result['translatedText']
-                    
-                    # Check if we got a sensible translation
-                    if translated_text.lower() != original_text.lower():
-                        return jsonify({
-                            'original_text': original_text,
-                            'translated_text': translated_text,
-                            'source_language': 'en',
-                            'target_language': target_lang,
-                            'service': 'LingoJAM Translation'
-                        })
-    except Exception as e:
-        print(f"LingoJAM API exception: {str(e)}")
-    
-    # 4. Fourth attempt: LibreTranslate API
-    try:
-        url = "https://libretranslate.com/translate"
-        payload = {
-            "q": original_text,
-            "source": "en",
-            "target": target_lang,
-            "format": "text",
-            "api_key": ""  # LibreTranslate may require an API key for some instances
-        }
-        
-        print(f"Trying LibreTranslate API")
-        headers = {
-            'Content-Type': 'application/json',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+    if not data or not isinstance(data.get('texts'), list):
+        return jsonify({'message': 'A list of texts is required'}), 400
+    
+    texts = data['texts']
+    target_langs = data.get('target_languages') or data.get('target_language')
+    if isinstance(target_langs, str):
+        target_langs = [target_langs]
+    if not target_langs or not isinstance(target_langs, list):
+        return jsonify({'message': 'At least one target language is required'}), 400
+    
+    target_langs = list(dict.fromkeys(target_langs))
+    if len(texts) > app.config['TRANSLATION_BATCH_MAX_TEXTS']:
+        return jsonify({'message': f"At most {app.config['TRANSLATION_BATCH_MAX_TEXTS']} texts per batch"}), 400
+    if len(target_langs) > app.config['TRANSLATION_BATCH_MAX_LANGUAGES']:
+        return jsonify({'message': f"At most {app.config['TRANSLATION_BATCH_MAX_LANGUAGES']} languages per batch"}), 400
+    
+    def generate():
+        # (normalized text, language) -> (result or None, cache tier or None)
+        resolved = {}
+        # language -> {normalized text: first original text}
+        pending = {lang: {} for lang in target_langs}
         
-        response = requests.post(url, json=payload, headers=headers)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if 'translatedText' in result:
-                translated_text = result['translatedText']
-                
-                # Check if we got a sensible translation
-                if translated_text.lower() != original_text.lower():
-                    return jsonify({
-                        'original_text': original_text,
-                        'translated_text': translated_text,
-                        'source_language': 'en',
-                        'target_language': target_lang,
-                        'service': 'LibreTranslate'
-                    })
-    except Exception as e:
-        print(f"LibreTranslate API exception: {str(e)}")
-    
-    # Special handling for Asian languages and Russian as final attempt
-    if target_lang in ['zh-CN', 'ja', 'ko', 'ru']:
-        try:
-            # Target language code processing
-            if target_lang == 'zh-CN':
-                target_code = 'zh'
+        # One lookup for every distinct text and language; misses hit the database together
+        lookups = {}
+        for lang in target_langs:
+            for text in texts:
+                if isinstance(text, str) and text.strip():
+                    lookups.setdefault((normalize_text(text), lang), text)
+        cached = translation_cache.get_many([(text, lang) for (key, lang), text in lookups.items()])
+        for ((key, lang), text), (result, tier) in zip(lookups.items(), cached):
+            if result is not None:
+                resolved[(key, lang)] = (result, tier)
             else:
-                target_code = target_lang
-                
-            # Using yet another endpoint that's particularly good for these languages
-            url = f"https://translation.googleapis.com/language/translate/v2?key=&q={encoded_text}&source=en&target={target_code}"
-            
-            print(f"Trying final specialized endpoint for {target_lang}: {url}")
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Referer': 'https://translate.google.com/',
-                'Accept': 'application/json'
-            }
-            
-            response = requests.get(url, headers=headers)
-            content = response.text
-            
-            # Parse the response - handle it carefully as it may not be JSON
+                pending[lang][key] = text
+        
+        def resolve(lang):
+            batch = pending.pop(lang)
+            if not batch:
+                return
+            # Don't hold a pooled connection while the providers are called
+            release_db()
             try:
-                if "data" in content:
-                    import re
-                    # Try to extract the translation using regex for reliability
-                    match = re.search(r'"translatedText":\s*"([^"]+)"', content)
-                    if match:
-                        translated_text = match.group(1)
-                        
-                        # Fix any escaped characters
-                        import html
-                        translated_text = html.unescape(translated_text)
-                        
-                        if translated_text and translated_text.strip():
-                            return jsonify({
-                                'original_text': original_text,
-                                'translated_text': translated_text,
-                                'source_language': 'en',
-                                'target_language': target_lang,
-                                'service': 'Google Cloud Translation API (Special)'
-                            })
+                translated = translation_engine.translate_batch(list(batch.values()), lang)
             except Exception as e:
-                print(f"Special endpoint parsing error: {str(e)}")
-        except Exception as e:
-            print(f"Special endpoint exception: {str(e)}")
-    
-    # Final general attempt: another fallback method
-    try:
-        # Constructing a backup URL for translation
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+                print(f"Batch translation error: {str(e)}")
+                translated = {}
+            for key, text in batch.items():
+                result = translated.get(text)
+                if result is not None:
+                    translation_cache.set(text, lang, result)
+                resolved[(key, lang)] = (result, None)
         
-        # Using another approach for Google Translate
-        url = f"https://clients5.google.com/translate_a/t?client=dict-chrome-ex&sl=en&tl={target_lang}&q={encoded_text}"
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 200:
-            try:
-                # This API has a different response format
-                result = response.json()
-                if isinstance(result, list) and len(result) > 0:
-                    translated_text = result[0]
-                    
-                    # Check if we got a sensible translation
-                    if translated_text.lower() != original_text.lower():
-                        return jsonify({
-                            'original_text': original_text,
-                            'translated_text': translated_text,
+        for index, text in enumerate(texts):
+            for lang in target_langs:
+                if not isinstance(text, str) or not text.strip():
+                    line = {'index': index, 'target_language': lang, 'error': 'Text must be a non-empty string'}
+                else:
+                    key = normalize_text(text)
+                    if (key, lang) not in resolved:
+                        resolve(lang)
+                    result, tier = resolved[(key, lang)]
+                    if result is None:
+                        line = {
+                            'index': index,
+                            'original_text': text,
+                            'translated_text': text,
                             'source_language': 'en',
-                            'target_language': target_lang,
-                            'service': 'Google Translate (Alternative)'
-                        })
-            except Exception as e:
-                print(f"Alternative parsing error: {str(e)}")
-    except Exception as e:
-        print(f"Final fallback exception: {str(e)}")
-    
-    # If all translation services fail, we return the original text
-    print("All translation APIs failed")
-    return jsonify({
-        'original_text': original_text,
-        'translated_text': original_text,  # Return original if all APIs fail
-        'source_language': 'en',
-        'target_language': target_lang,
-        'service': 'No translation available'
-    })
+                            'target_language': lang,
+                            'service': NO_TRANSLATION_SERVICE,
+                            'cached': False
+                        }
+                    else:
+                        line = {
+                            'index': index,
+                            'original_text': text,
+                            'translated_text': result['translated_text'],
+                            'source_language': result['source_language'],
+                            'target_language': lang,
+                            'service': result['service'],
+                            'cached': tier is not None
+                        }
+                        if tier is not None:
+                            line['cache_tier'] = tier
+                yield json.dumps(line) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 def advanced_word_translation(text, target_lang):
     """This function is kept as a stub for backward compatibility."""
@@ -609,6 +685,114 @@ def get_user_profile(current_user):
         'email': current_user['email']
     })
 
+@app.route("/api/user", methods=['PUT'])
+@token_required
+def update_user_profile(current_user):
+    """Update the current user's name, email or password."""
+    data = request.get_json() or {}
+    
+    update_fields = []
+    params = []
+    
+    if data.get('name'):
+        update_fields.append('name = %s')
+        params.append(data['name'])
+    
+    if data.get('email'):
+        update_fields.append('email = %s')
+        params.append(data['email'])
+    
+    if data.get('password'):
+        update_fields.append('password = %s')
+        params.append(password_hasher.hash(data['password']))
+    
+    if not update_fields:
+        return jsonify({'message': 'Nothing to update'}), 400
+    
+    db = get_db()
+    cursor = db.cursor()
+    try:
+        params.append(current_user['id'])
+        cursor.execute(f"UPDATE users SET {', '.join(update_fields)} WHERE id = %s", params)
+        db.commit()
+    except pymysql.err.IntegrityError:
+        return jsonify({'message': 'Email already in use'}), 409
+    finally:
+        auth_cache.invalidate_user(current_user['id'])
+    
+    return jsonify({'message': 'User updated successfully'})
+
+@app.route("/api/user", methods=['DELETE'])
+@token_required
+def delete_user(current_user):
+    """Delete the current user; their entries and sync state go with them via ON DELETE CASCADE."""
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute('DELETE FROM users WHERE id = %s', (current_user['id'],))
+    db.commit()
+    auth_cache.invalidate_user(current_user['id'])
+    
+    return jsonify({'message': 'User deleted successfully'})
+
+@app.route("/api/admin/stats", methods=['GET'])
+@admin_required
+def admin_stats():
+    """Operational counters for the database pool and caches."""
+    return jsonify({
+        'db_pool': db_pool.stats(),
+        'auth_cache': auth_cache.stats(),
+        'translation_cache': translation_cache.stats(),
+        'reminders': reminder_scheduler.stats(),
+        'password_hasher': password_hasher.stats(),
+        'rate_limiter': rate_limiter.stats()
+    })
+
+@app.route("/api/admin/profiles", methods=['GET'])
+@admin_required
+def admin_profiles():
+    """Summaries of the newest saved request profiles."""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({'profiles': request_profiler.list(limit)})
+
+@app.route("/api/admin/profiles/<profile_id>", methods=['GET'])
+@admin_required
+def admin_profile(profile_id):
+    """One saved request profile: phase timeline and cProfile or stack samples."""
+    report = request_profiler.get(profile_id)
+    if report is None:
+        return jsonify({'message': 'Profile not found'}), 404
+    return jsonify(report)
+
+@app.route("/api/admin/translation/providers", methods=['GET'])
+@admin_required
+def admin_translation_providers():
+    """Per-provider breaker state, per-language stats and the current ranking."""
+    languages = request.args.getlist('language') or sorted(
+        {lang for stats in provider_scoreboard.snapshot().values() for lang in stats['languages']}
+    )
+    return jsonify({
+        'providers': provider_scoreboard.snapshot(),
+        'ranking': {
+            lang: [p.name for p in translation_engine.candidates(lang)] for lang in languages
+        }
+    })
+
+@app.errorhandler(PoolExhausted)
+def handle_pool_exhausted(e):
+    """Shed the request when no database connection could be checked out."""
+    response = jsonify({'message': 'Database busy, please retry'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+@app.errorhandler(HasherBusy)
+def handle_hasher_busy(e):
+    """Shed logins and registrations while the password hashing pool is saturated."""
+    response = jsonify({'message': 'Server busy, please retry'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
 @app.route("/health")
 def health_check():
     """Health check endpoint for Kubernetes liveness probe."""
@@ -621,13 +805,16 @@ def health_check():
     except Exception as e:
         return jsonify({"status": "unhealthy", "error": str(e)}), 500
 
-# Initialize database when app starts
-with app.app_context():
-    try:
-        init_db()
-        print("Database initialized successfully!")
-    except Exception as e:
-        print(f"Error initializing database: {e}")
+def create_app():
+    """Check the database schema and return the app; call once per process before serving."""
+    # Not done at import: the password hashing forkserver re-imports the main module
+    with app.app_context():
+        try:
+            init_db()
+            print("Database schema checked successfully!")
+        except Exception as e:
+            print(f"Error initializing database: {e}")
+    return app
 
 if __name__ == "__main__":
-    app.run("0.0.0.0", port=5001)
\ No newline at end of file
+    create_app().run("0.0.0.0", port=5001)
\ No newline at end of file
@@ -0,0 +1,433 @@
+"""ASGI serving mode for the API.
+
+Run one process that keeps many slow translations in flight::
+
+    API_BACKEND=mysql uvicorn asgi:app --host 0.0.0.0 --port 5050
+
+``POST /api/translate`` is served natively on the event loop.  Provider calls
+go through ``AsyncTranslationEngine`` (aiohttp), so a request waiting on
+external HTTP holds no thread.  Token checks and translation cache lookups
+still use the backend's blocking database code, so they run on a small thread
+pool inside a Flask app context, which checks a pooled connection out and
+back in as usual.  The backend's rate limits and load shedding apply to it
+as to the Flask routes.
+
+Every other route, and every route of the SQLite backend, is passed to the
+backend's Flask app through a WSGI bridge on that same thread pool.  Routes,
+``token_required`` semantics and JSON shapes are therefore identical in both
+serving modes.  Request bodies such as imports are streamed to the app as it
+reads them, and streamed responses such as NDJSON are forwarded chunk by
+chunk, with a few chunks of buffering either way.
+"""
+import asyncio
+import functools
+import importlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import ClientDisconnected
+
+from rate_limiter import Overloaded, RateLimited, client_ip, queue_time
+from translation_providers import AsyncTranslationEngine
+
+BACKENDS = {'mysql': 'api_backend_mysql', 'sqlite': 'api_backend'}
+
+
+# Chunks buffered each way between the event loop and a bridged request's
+# worker thread; a side that gets this far ahead waits for the other
+BRIDGE_QUEUE_SIZE = 8
+
+
+async def _unless_closed(awaitable, closed):
+    """Await ``awaitable`` unless ``closed`` is set first; returns ``(done, result)``."""
+    task = asyncio.ensure_future(awaitable)
+    waiter = asyncio.ensure_future(closed.wait())
+    try:
+        await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        waiter.cancel()
+    if task.done():
+        return True, task.result()
+    task.cancel()
+    return False, None
+
+
+class _InputStream(io.RawIOBase):
+    """``wsgi.input`` that pulls request body chunks from the event loop as the app reads."""
+
+    def __init__(self, next_chunk):
+        self._next_chunk = next_chunk
+        self._chunk = b''
+        self._offset = 0
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._offset >= len(self._chunk):
+            if self._eof:
+                return 0
+            chunk = self._next_chunk()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._chunk, self._offset = chunk, 0
+        n = min(len(buffer), len(self._chunk) - self._offset)
+        buffer[:n] = self._chunk[self._offset:self._offset + n]
+        self._offset += n
+        return n
+
+
+class WSGIBridge(object):
+    """Serve an ASGI HTTP request with a WSGI app running on ``executor``.
+
+    The request body is streamed to the app and the response streamed back
+    through bounded queues, so neither side buffers more than a few chunks.
+    When the client disconnects the app's next read or write raises
+    ``ClientDisconnected`` and the response iterator is closed.
+    """
+
+    def __init__(self, wsgi_app, executor):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+
+    def environ(self, scope, stream):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'REMOTE_ADDR': client[0],
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BufferedReader(stream),
+            # The stream ends with the body, chunked or not
+            'wsgi.input_terminated': True,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[name] = value
+            else:
+                key = f'HTTP_{name}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def _run(self, environ, events, wait):
+        """Run the WSGI app in a worker thread, passing its response to ``events``."""
+        def put(event):
+            wait(events.put(event))
+
+        started = []
+
+        def send_body(data):
+            if started:
+                put(('start',) + started.pop())
+            put(('body', data))
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [(int(status.split(' ', 1)[0]), headers)]
+            return send_body
+
+        try:
+            result = self.wsgi_app(environ, start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        send_body(chunk)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            if started:
+                put(('start',) + started.pop())
+            put(('end',))
+        except ClientDisconnected:
+            pass
+        except Exception as e:
+            try:
+                put(('error', e))
+            except ClientDisconnected:
+                pass
+
+    async def _receive(self, receive, body, closed):
+        """Feed request body chunks to ``body``, then watch for the client disconnecting."""
+        more_body = True
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                closed.set()
+                return
+            if not more_body:
+                continue
+            chunk = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            # Stop reading from the client while the app is behind
+            if chunk and not (await _unless_closed(body.put(chunk), closed))[0]:
+                return
+            if not more_body and not (await _unless_closed(body.put(None), closed))[0]:
+                return
+
+    def _wait(self, loop, closed, awaitable):
+        """From the worker thread, block on ``awaitable`` on the loop until the client goes away."""
+        if closed.is_set():
+            awaitable.close()
+            raise ClientDisconnected()
+        done, result = asyncio.run_coroutine_threadsafe(_unless_closed(awaitable, closed), loop).result()
+        if not done:
+            raise ClientDisconnected()
+        return result
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        closed = asyncio.Event()
+        body = asyncio.Queue(BRIDGE_QUEUE_SIZE)
+        events = asyncio.Queue(BRIDGE_QUEUE_SIZE)
+        wait = functools.partial(self._wait, loop, closed)
+        receiver = loop.create_task(self._receive(receive, body, closed))
+        stream = _InputStream(lambda: wait(body.get()))
+        loop.run_in_executor(self.executor, self._run, self.environ(scope, stream), events, wait)
+        try:
+            started = False
+            while True:
+                done, event = await _unless_closed(events.get(), closed)
+                if not done:
+                    # Client gone: the worker stops at its next read or write
+                    return
+                if event[0] == 'start':
+                    started = True
+                    await send({'type': 'http.response.start', 'status': event[1],
+                                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                                            for k, v in event[2]]})
+                elif event[0] == 'body':
+                    await send({'type': 'http.response.body', 'body': event[1], 'more_body': True})
+                elif event[0] == 'end':
+                    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                    return
+                else:
+                    print(f"WSGI bridge error: {event[1]}")
+                    if not started:
+                        await send_json(send, 500, {'message': 'Internal server error'})
+                    else:
+                        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                    return
+        finally:
+            # Also releases a worker still reading a body the app never finished
+            closed.set()
+            receiver.cancel()
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def send_json(send, status, payload, extra_headers=()):
+    # Same encoding as Flask's jsonify: sorted keys, compact, trailing newline
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8') + b'\n'
+    headers = [(b'content-type', b'application/json'),
+               (b'content-length', str(len(body)).encode('ascii'))]
+    headers.extend(extra_headers)
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class APIApplication(object):
+    """ASGI app: native async routes first, everything else through the WSGI bridge."""
+
+    def __init__(self, backend, threads=32, max_connections=512):
+        self.backend = backend
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+        self.bridge = WSGIBridge(backend.app.wsgi_app, self.executor)
+        self.engine = None
+        self.routes = {}
+        if hasattr(backend, 'translation_engine'):
+            self.engine = AsyncTranslationEngine.from_engine(backend.translation_engine,
+                                                             max_connections=max_connections)
+            self.routes[('POST', '/api/translate')] = self.translate
+        # Matches the CORS(app) setup of the Flask backends
+        self.cors_headers = [(b'access-control-allow-origin', b'*'),
+                             (b'access-control-expose-headers', b'ETag, X-Sync-Cursor')]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            await self.bridge(scope, receive, send)
+            return
+        await self.timed(handler, scope, receive, send)
+
+    async def timed(self, handler, scope, receive, send):
+        """Run a native route, recording it in the backend's request metrics and in-flight count."""
+        metrics = self.backend.metrics
+        route = scope['path']
+        status = []
+
+        async def send_and_record(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            await send(message)
+
+        metrics.in_flight.inc(route)
+        # Counted against SHED_MAX_IN_FLIGHT like the Flask routes
+        self.backend.rate_limiter.enter()
+        start = time.perf_counter()
+        try:
+            await handler(scope, receive, send_and_record)
+        except Exception as e:
+            print(f"Error in {route}: {e}")
+            await send_json(send_and_record, 500, {'message': f'Internal server error: {e}'},
+                            self.cors_headers)
+        finally:
+            self.backend.rate_limiter.exit()
+            metrics.in_flight.dec(route)
+            metrics.observe_request(route, scope['method'], status[0] if status else 500,
+                                    time.perf_counter() - start)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.close()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _in_app_context(self, func, *args):
+        with self.backend.app.app_context():
+            return func(*args)
+
+    async def run_sync(self, func, *args):
+        """Run blocking backend code (database, caches) on the thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor,
+                                          functools.partial(self._in_app_context, func, *args))
+
+    async def authenticate(self, scope, send):
+        """``token_required`` for native routes; returns the user or None after replying 401."""
+        token = None
+        for name, value in scope.get('headers', []):
+            if name == b'x-access-token':
+                token = value.decode('latin-1')
+        if not token:
+            await send_json(send, 401, {'message': 'Token is missing!'}, self.cors_headers)
+            return None
+        try:
+            return await self.run_sync(self.backend.authenticate, token)
+        except Exception as e:
+            await send_json(send, 401, {'message': f'Token is invalid! {str(e)}'}, self.cors_headers)
+            return None
+
+    async def admit(self, scope, send, route_class, user_id=None):
+        """The backend's shedding and per-IP limit, or per-user limit with ``user_id``.
+
+        Returns False after replying 429 or 503.
+        """
+        limiter = self.backend.rate_limiter
+        if user_id is None:
+            headers = {name: value.decode('latin-1') for name, value in scope.get('headers', [])}
+            ip = client_ip((scope.get('client') or ('', 0))[0], headers.get(b'x-forwarded-for'),
+                           limiter.trusted_proxies)
+            check = functools.partial(limiter.admit, route_class, ip, queue_time(headers.get(b'x-request-start')))
+        else:
+            check = functools.partial(limiter.admit_user, route_class, user_id)
+        try:
+            if limiter.store.shared:
+                await self.run_sync(check)
+            else:
+                check()
+        except RateLimited as e:
+            await send_json(send, 429, {'message': 'Too many requests, please retry later'},
+                            self.cors_headers + [(b'retry-after', e.retry_after_header.encode('latin-1'))])
+            return False
+        except Overloaded:
+            await send_json(send, 503, {'message': 'Server busy, please retry'},
+                            self.cors_headers + [(b'retry-after', b'1')])
+            return False
+        return True
+
+    async def translate(self, scope, receive, send):
+        """Async version of ``translate_text`` with the same responses."""
+        body = await read_body(receive)
+        if not await self.admit(scope, send, 'translation'):
+            return
+        current_user = await self.authenticate(scope, send)
+        if current_user is None:
+            return
+        if not await self.admit(scope, send, 'translation', current_user['id']):
+            return
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or not data.get('text') or not data.get('target_language'):
+            await send_json(send, 400, {'message': 'Text and target language are required'},
+                            self.cors_headers)
+            return
+
+        original_text = data['text']
+        target_lang = data['target_language']
+        cache = self.backend.translation_cache
+        cached, tier = await self.run_sync(cache.get, original_text, target_lang)
+        if cached is not None:
+            await send_json(send, 200, {
+                'original_text': original_text,
+                'translated_text': cached['translated_text'],
+                'source_language': cached['source_language'],
+                'target_language': target_lang,
+                'service': cached['service'],
+                'cached': True,
+                'cache_tier': tier
+            }, self.cors_headers)
+            return
+
+        print(f"Translating: '{original_text}' to {target_lang}")
+        result = await self.engine.translate(original_text, target_lang)
+        if result is None:
+            result = self.backend.untranslated_result(original_text, target_lang)
+        else:
+            await self.run_sync(cache.set, original_text, target_lang, result)
+        result['cached'] = False
+        await send_json(send, 200, result, self.cors_headers)
+
+
+def create_app(backend_name=None):
+    backend_name = backend_name or os.environ.get('API_BACKEND', 'mysql')
+    backend = importlib.import_module(BACKENDS[backend_name])
+    backend.create_app()
+    return APIApplication(
+        backend,
+        threads=int(os.environ.get('ASGI_THREADS', 32)),
+        max_connections=int(os.environ.get('TRANSLATION_HTTP_CONNECTIONS', 512))
+    )
+
+
+app = create_app()
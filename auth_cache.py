@@ -0,0 +1,61 @@
+"""Caches used by ``token_required`` to avoid work on every authenticated request.
+
+Two tiers are kept per process:
+
+* verified tokens: raw JWT string -> decoded payload, so the HS256 signature is
+  checked once per token rather than once per request.  Entries never outlive
+  the token's own ``exp`` claim.
+* users: ``user_id`` -> user row, so the ``users`` lookup is skipped on hits.
+  Entries are dropped by ``invalidate_user`` whenever the user changes or is
+  deleted, and expire after ``user_ttl`` seconds so other processes pick up
+  changes made elsewhere.
+"""
+import time
+
+import jwt
+
+from ttl_cache import TTLCache
+
+
+class AuthCache(object):
+    """Verified-token and user-row caches with hit/miss counters."""
+
+    def __init__(self, max_tokens=10000, token_ttl=300, max_users=10000, user_ttl=30):
+        self.tokens = TTLCache(max_size=max_tokens, ttl=token_ttl)
+        self.users = TTLCache(max_size=max_users, ttl=user_ttl)
+
+    def verify_token(self, token, secret_key):
+        """Decode ``token``, reusing a previous signature check when possible."""
+        cached = self.tokens.get(token)
+        if cached is not None:
+            payload, verified_with = cached
+            if verified_with == secret_key and payload.get('exp', float('inf')) > time.time():
+                return payload
+            self.tokens.pop(token)
+
+        payload = jwt.decode(token, secret_key, algorithms=["HS256"])
+        ttl = self.tokens.ttl
+        if 'exp' in payload:
+            ttl = min(ttl, payload['exp'] - time.time())
+        self.tokens.set(token, (payload, secret_key), ttl=ttl)
+        return payload
+
+    def get_user(self, user_id, loader):
+        """Return the cached user row, calling ``loader(user_id)`` on a miss."""
+        user = self.users.get(user_id)
+        if user is None:
+            user = loader(user_id)
+            if user is not None:
+                user = dict(user)
+                self.users.set(user_id, user)
+        return user
+
+    def invalidate_user(self, user_id):
+        """Forget the cached row for ``user_id`` after it changed or was deleted."""
+        self.users.pop(user_id)
+
+    def stats(self):
+        return {
+            'tokens': self.tokens.stats(),
+            'users': self.users.stats(),
+        }
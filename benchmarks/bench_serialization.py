@@ -0,0 +1,117 @@
+"""Micro-benchmark: item listing serialization, old path vs ``serialization.py``.
+
+Compares, at 1k/10k/100k rows:
+
+* ``mysql-loop``: ``strftime`` on both dates in a Python loop, then ``jsonify``
+  (the previous ``api_backend_mysql.get_items``);
+* ``sqlite-dict``: a ``dict(...)`` per ``sqlite3.Row``, then ``jsonify`` (the
+  previous ``api_backend.get_items``);
+* ``json_response`` on the same ``DictCursor``-style dicts and ``sqlite3.Row``
+  objects, with the whole streamed body consumed.
+
+Run from the repository root::
+
+    python benchmarks/bench_serialization.py [--rows 1000,10000,100000] [--repeat 5]
+"""
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask, jsonify  # noqa: E402
+
+import serialization  # noqa: E402
+from serialization import json_response  # noqa: E402
+
+
+def mysql_rows(count):
+    base = datetime.datetime(2024, 1, 1, 9, 0, 0)
+    return [{
+        'id': str(uuid.uuid4()),
+        'what_to_do': f'Task number {i}',
+        'due_date': base + datetime.timedelta(hours=i),
+        'reminder_date': base + datetime.timedelta(hours=i, minutes=-30) if i % 3 else None,
+        'status': 'done' if i % 4 == 0 else 'pending',
+    } for i in range(count)]
+
+
+def sqlite_rows(count):
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute('CREATE TABLE entries (id TEXT, what_to_do TEXT, due_date TEXT, reminder_date TEXT, status TEXT)')
+    conn.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?)', [
+        (row['id'], row['what_to_do'], row['due_date'].strftime('%Y-%m-%d %H:%M:%S'),
+         row['reminder_date'].strftime('%Y-%m-%d %H:%M:%S') if row['reminder_date'] else None, row['status'])
+        for row in mysql_rows(count)])
+    return conn.execute('SELECT id, what_to_do, due_date, reminder_date, status FROM entries').fetchall()
+
+
+def mysql_loop(rows):
+    # Rows are copied so every repeat formats datetimes, as a fresh fetch would
+    entries = [dict(row) for row in rows]
+    for entry in entries:
+        if entry['due_date']:
+            entry['due_date'] = entry['due_date'].strftime('%Y-%m-%d %H:%M:%S')
+        if entry['reminder_date']:
+            entry['reminder_date'] = entry['reminder_date'].strftime('%Y-%m-%d %H:%M:%S')
+    return jsonify(entries).get_data()
+
+
+def sqlite_dict(rows):
+    tdlist = [dict(id=row['id'], what_to_do=row['what_to_do'], due_date=row['due_date'],
+                   reminder_date=row['reminder_date'], status=row['status']) for row in rows]
+    return jsonify(tdlist).get_data()
+
+
+def fast(rows):
+    return b''.join(json_response(rows).response)
+
+
+def timed(func, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(rows)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', default='1000,10000,100000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    app = Flask(__name__)
+    print(f"encoder: {'orjson' if serialization.orjson is not None else 'json (orjson not installed)'}")
+    print(f"{'rows':>8}  {'case':<22}{'best ms':>10}{'speedup':>10}")
+    with app.app_context():
+        for count in (int(n) for n in args.rows.split(',')):
+            dict_rows = mysql_rows(count)
+            row_objects = sqlite_rows(count)
+            # Both paths must produce the same JSON document
+            assert json.loads(fast(dict_rows)) == json.loads(mysql_loop(dict_rows))
+            assert json.loads(fast(row_objects)) == json.loads(sqlite_dict(row_objects))
+            cases = [
+                ('mysql-loop + jsonify', mysql_loop, dict_rows, None),
+                ('json_response (dicts)', fast, dict_rows, 0),
+                ('sqlite-dict + jsonify', sqlite_dict, row_objects, None),
+                ('json_response (Rows)', fast, row_objects, 2),
+            ]
+            results = []
+            for name, func, rows, baseline in cases:
+                best = timed(func, rows, args.repeat)
+                results.append(best)
+                speedup = f'{results[baseline] / best:.1f}x' if baseline is not None else ''
+                print(f'{count:>8}  {name:<22}{best * 1000:>10.1f}{speedup:>10}')
+
+
+if __name__ == '__main__':
+    main()
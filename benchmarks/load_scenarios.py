@@ -0,0 +1,342 @@
+"""Load scenarios against either backend, with throughput, latency and query counts.
+
+Scenarios:
+
+* ``login``: a login storm over random benchmark users (password hashing);
+* ``list``: list-heavy reads, a mix of first pages, second pages (keyset
+  cursor) and full listings;
+* ``crud``: mixed page reads, creates, updates and deletes;
+* ``stats``: dashboards polling ``GET /api/items/stats``;
+* ``translate``: ``POST /api/translate`` over a fixed vocabulary and five
+  languages, so repeats hit the cache and misses go to the stub providers
+  (``stub_provider.py``).  The SQLite backend calls Google Cloud directly, so
+  this scenario is skipped for it in-process.
+
+Each scenario sends ``--requests`` requests (``--login-requests`` for logins)
+from ``--concurrency`` threads.  Each thread draws its operations from its own
+seeded generator, so every run sends the same mix.  The report gives
+throughput, p50/p95/p99 latency, errors by status, and database queries per
+request.  Query counts are the change in ``db_query_duration_seconds_count``
+from ``/metrics`` over the scenario.
+
+By default the backend runs in this process on a server with a fixed thread pool
+(``--server-threads``, one connection per request), with data
+from ``seed_data.py`` (seeded on first use) and, for MySQL, stub
+providers::
+
+    python benchmarks/load_scenarios.py --backend sqlite --database /tmp/bench.db
+    python benchmarks/load_scenarios.py --backend mysql               # local MySQL, MYSQL_* settings
+    python benchmarks/load_scenarios.py --url http://localhost:5050   # a server seeded with seed_data.py
+
+``--json out.json`` saves the results; ``--compare baseline.json`` prints the
+change against an earlier run and exits with 1 when a scenario's throughput
+dropped, or its p95 rose, by more than ``--tolerance``.
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests  # noqa: E402
+
+import seed_data  # noqa: E402
+from stub_provider import StubProviderServer  # noqa: E402
+
+SCENARIOS = ('login', 'list', 'crud', 'stats', 'translate')
+BACKENDS = {'sqlite': 'api_backend', 'mysql': 'api_backend_mysql'}
+LANGUAGES = ('fr', 'es', 'de', 'it', 'ja')
+QUERY_COUNT = re.compile(r'^db_query_duration_seconds_count\{statement="([^"]*)"\} (\d+)', re.M)
+PAGE_SIZE = 50
+
+
+def start_backend(args):
+    """Run the backend in this process; returns its base URL."""
+    os.environ['REMINDERS_ENABLED'] = 'false'
+    os.environ.setdefault('PROFILE_SAMPLE_RATE', '0')
+    # A login storm from one client IP is exactly what the limits are for
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    if args.backend == 'sqlite':
+        os.environ['DATABASE'] = args.database
+        if args.reseed or not os.path.exists(args.database):
+            conn = seed_data.reset(seed_data.migrations.connect('sqlite', args.database), 'sqlite', args.database)
+            seed_data.migrations.migrate(conn, 'sqlite', log=lambda message: None)
+            seed_data.seed(conn, 'sqlite', args.users, args.entries, args.seed)
+            conn.close()
+    else:
+        stub = StubProviderServer(seed=args.seed).start()
+        os.environ['TRANSLATION_PROVIDER_BASE_URL'] = stub.url
+        if args.reseed:
+            conn = seed_data.reset(seed_data.migrations.connect('mysql'), 'mysql')
+            seed_data.migrations.migrate(conn, 'mysql', log=lambda message: None)
+            seed_data.seed(conn, 'mysql', args.users, args.entries, args.seed)
+            conn.close()
+    backend = importlib.import_module(BACKENDS[args.backend])
+    backend.create_app()
+
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    class PooledServer(BaseWSGIServer):
+        # A fixed pool, like gunicorn's threads, so thread start-up is not measured
+        def __init__(self, *a, **kw):
+            BaseWSGIServer.__init__(self, *a, **kw)
+            self.pool = ThreadPoolExecutor(args.server_threads, thread_name_prefix='bench-server')
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._process, request, client_address)
+
+        def _process(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledServer('127.0.0.1', 0, backend.app, handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def query_counts(url, token=None):
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    try:
+        response = requests.get(f'{url}/metrics', headers=headers, timeout=10)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    return {statement: int(count) for statement, count in QUERY_COUNT.findall(response.text)}
+
+
+def login(session, url, index):
+    response = session.post(f'{url}/api/login', timeout=60,
+                            json={'email': seed_data.user_email(index), 'password': seed_data.PASSWORD})
+    response.raise_for_status()
+    return response.json()['token']
+
+
+class Worker(object):
+    """One client thread: a session, a token, a seeded generator and its timings."""
+
+    def __init__(self, url, scenario, index, args, token):
+        self.url = url
+        self.scenario = scenario
+        self.args = args
+        self.rng = random.Random(args.seed * 1000 + index)
+        self.session = requests.Session()
+        self.headers = {'x-access-token': token} if token else {}
+        self.latencies = []
+        self.statuses = {}
+        self.created = []
+        self.cursor = None
+
+    def request(self, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.url + path, headers=self.headers, timeout=60, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 'error'
+        self.latencies.append(time.perf_counter() - start)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        return response if status == 200 or status == 201 else None
+
+    def op_login(self):
+        index = self.rng.randrange(self.args.users)
+        self.request('POST', '/api/login',
+                     json={'email': seed_data.user_email(index), 'password': seed_data.PASSWORD})
+
+    def op_list(self):
+        roll = self.rng.random()
+        if roll < 0.25 and self.cursor:
+            self.request('GET', f'/api/items?limit={PAGE_SIZE}&cursor={self.cursor}')
+        elif roll < 0.5:
+            self.request('GET', '/api/items')
+        else:
+            response = self.request('GET', f'/api/items?limit={PAGE_SIZE}')
+            if response is not None:
+                self.cursor = response.json().get('next_cursor')
+
+    def op_crud(self):
+        roll = self.rng.random()
+        if roll < 0.4:
+            self.request('GET', f'/api/items?limit={PAGE_SIZE}')
+        elif roll < 0.65 or not self.created:
+            response = self.request('POST', '/api/items', json={
+                'what_to_do': f'Bench task {self.rng.randrange(10 ** 6)}',
+                'due_date': f'2025-02-{self.rng.randrange(1, 28):02d} 10:00'})
+            if response is not None:
+                self.created.append(response.json()['id'])
+        elif roll < 0.85:
+            item_id = self.rng.choice(self.created)
+            self.request('PUT', f'/api/items/{item_id}',
+                          json={'status': self.rng.choice(('done', 'pending'))})
+        else:
+            item_id = self.created.pop(self.rng.randrange(len(self.created)))
+            self.request('DELETE', f'/api/items/{item_id}')
+
+    def op_stats(self):
+        self.request('GET', '/api/items/stats')
+
+    def op_translate(self):
+        self.request('POST', '/api/translate', json={
+            'text': f'benchmark phrase number {self.rng.randrange(self.args.vocabulary)}',
+            'target_language': self.rng.choice(LANGUAGES)})
+
+    def run(self, count):
+        op = getattr(self, 'op_' + self.scenario)
+        for _ in range(count):
+            op()
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_scenario(url, scenario, args):
+    count = args.login_requests if scenario == 'login' else args.requests
+    setup = requests.Session()
+    tokens = [None] * args.concurrency
+    if scenario != 'login':
+        # Workers act as different users; logging them in is not timed
+        tokens = [login(setup, url, i % args.users) for i in range(args.concurrency)]
+    workers = [Worker(url, scenario, i, args, tokens[i]) for i in range(args.concurrency)]
+    before = query_counts(url, args.metrics_token)
+    threads = [threading.Thread(target=worker.run, args=(count // args.concurrency + (i < count % args.concurrency),))
+               for i, worker in enumerate(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    after = query_counts(url, args.metrics_token)
+
+    latencies = sorted(latency for worker in workers for latency in worker.latencies)
+    statuses = {}
+    for worker in workers:
+        for status, n in worker.statuses.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + n
+    result = {
+        'requests': len(latencies),
+        'errors': sum(n for status, n in statuses.items() if status not in ('200', '201')),
+        'statuses': statuses,
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+    if before is not None and after is not None:
+        # The scrapes themselves run no queries
+        queries = {statement: after[statement] - before.get(statement, 0) for statement in after
+                   if after[statement] > before.get(statement, 0)}
+        result['queries'] = dict(sorted(queries.items(), key=lambda item: -item[1]))
+        result['queries_per_request'] = round(sum(queries.values()) / len(latencies), 2) if latencies else None
+    return result
+
+
+def print_report(results, out):
+    out.write(f"{'scenario':<10} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'queries/req':>11}\n")
+    for name, r in results.items():
+        qpr = r.get('queries_per_request')
+        out.write(f"{name:<10} {r['requests']:>8} {r['errors']:>6} {r['throughput']:>8} {r['p50_ms']:>8} "
+                  f"{r['p95_ms']:>8} {r['p99_ms']:>8} {'-' if qpr is None else qpr:>11}\n")
+        if r.get('queries'):
+            top = ', '.join(f'{statement} {n}' for statement, n in list(r['queries'].items())[:5])
+            out.write(f"{'':<10} queries: {top}\n")
+        if r['errors']:
+            out.write(f"{'':<10} statuses: {r['statuses']}\n")
+
+
+def compare(results, baseline, tolerance, out):
+    """Print the change against ``baseline``; returns True when a scenario regressed."""
+    regressed = False
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        throughput = (r['throughput'] - base['throughput']) / base['throughput']
+        p95 = (r['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0.0
+        bad = throughput < -tolerance or p95 > tolerance
+        regressed = regressed or bad
+        out.write(f"{name:<10} req/s {throughput:+.0%}  p95 {p95:+.0%}{'  REGRESSION' if bad else ''}\n")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run load scenarios against an API backend.')
+    parser.add_argument('--backend', default='sqlite', choices=tuple(BACKENDS))
+    parser.add_argument('--url', help='Benchmark a running server instead of starting the backend here')
+    parser.add_argument('--database', default='bench.db', help='SQLite database (seeded if missing)')
+    parser.add_argument('--reseed', action='store_true', help='Recreate the benchmark data first')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--entries', type=int, default=200, help='Tasks per user')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per scenario')
+    parser.add_argument('--login-requests', type=int, default=200, help='Requests for the login scenario')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--server-threads', type=int, default=32, help='Threads of the in-process server')
+    parser.add_argument('--vocabulary', type=int, default=200, help='Distinct texts in the translate scenario')
+    parser.add_argument('--metrics-token', default=os.environ.get('METRICS_TOKEN'))
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--compare', help='Baseline results file from an earlier --json run')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--verbose', action='store_true', help="Keep the backend's own output")
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    out = sys.stdout
+    if args.url:
+        url = args.url.rstrip('/')
+    else:
+        if 'translate' in scenarios and args.backend == 'sqlite':
+            out.write('Skipping translate: the SQLite backend calls Google Cloud Translation directly\n')
+            scenarios.remove('translate')
+        if not args.verbose:
+            # The backends print() per request; keep the report readable
+            sys.stdout = open(os.devnull, 'w')
+        url = start_backend(args)
+
+    results = {}
+    for scenario in scenarios:
+        results[scenario] = run_scenario(url, scenario, args)
+    sys.stdout = out
+
+    print_report(results, out)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': {key: getattr(args, key) for key in
+                                  ('backend', 'url', 'users', 'entries', 'seed', 'requests',
+                                   'login_requests', 'concurrency', 'vocabulary')},
+                       'scenarios': results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['scenarios']
+        if compare(results, baseline, args.tolerance, out):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""Deterministic benchmark data: N users with M tasks each.
+
+The same ``--seed``, ``--users`` and ``--entries`` always produce the same
+rows, ids included, so runs on different machines or commits see identical
+data.  The schema is brought up to date with ``migrations.py`` first.  User
+``i`` is ``bench-<i>@example.com`` with password ``PASSWORD``; all users
+share one password hash, computed once with ``PASSWORD_HASH_METHOD``.
+
+Run from the repository root::
+
+    python benchmarks/seed_data.py --backend sqlite --database /tmp/bench.db --users 100 --entries 1000
+    python benchmarks/seed_data.py --backend mysql --users 100 --entries 1000   # MYSQL_* settings
+
+``--reset`` first removes the SQLite file, or the benchmark users and their
+rows from MySQL.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+import migrations  # noqa: E402
+from item_repository import DATE_FORMAT  # noqa: E402
+from password_hasher import normalize_method  # noqa: E402
+
+PASSWORD = 'bench-password'
+BASE_DATE = datetime.datetime(2025, 1, 1, 9, 0, 0)
+CHUNK_ROWS = 1000
+VERBS = ('Buy', 'Call', 'Email', 'Fix', 'Plan', 'Review', 'Write', 'Clean', 'Book', 'Pay')
+OBJECTS = ('groceries', 'the dentist', 'the report', 'the bike', 'a trip', 'the invoice',
+           'the garden', 'tickets', 'rent', 'the slides', 'mom', 'the car')
+
+
+def user_email(index):
+    return f'bench-{index}@example.com'
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def generate(users, entries, seed=1):
+    """Yield ``(user_row, entry_rows)`` for every user, deterministically."""
+    rng = random.Random(seed)
+    for index in range(users):
+        user_id = _uuid(rng)
+        rows = []
+        for n in range(entries):
+            due = BASE_DATE + datetime.timedelta(minutes=rng.randrange(-60 * 24 * 60, 60 * 24 * 60))
+            reminder = due - datetime.timedelta(minutes=rng.choice((15, 60, 24 * 60))) if rng.random() < 0.3 else None
+            rows.append((
+                _uuid(rng),
+                f'{rng.choice(VERBS)} {rng.choice(OBJECTS)} #{n}',
+                due.strftime(DATE_FORMAT),
+                reminder.strftime(DATE_FORMAT) if reminder else None,
+                'done' if rng.random() < 0.25 else 'pending',
+                user_id,
+            ))
+        yield (user_id, f'Bench User {index}', user_email(index)), rows
+
+
+def reset(conn, backend, database=None):
+    if backend == 'sqlite':
+        conn.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(database + suffix):
+                os.remove(database + suffix)
+        return migrations.connect('sqlite', database)
+    cursor = conn.cursor()
+    bench_users = "SELECT id FROM users WHERE email LIKE 'bench-%%@example.com'"
+    for table in ('entries', 'entry_tombstones', 'sync_versions'):
+        cursor.execute(f'DELETE FROM {table} WHERE user_id IN ({bench_users})')
+    cursor.execute("DELETE FROM users WHERE email LIKE 'bench-%%@example.com'")
+    conn.commit()
+    return conn
+
+
+def seed(conn, backend, users, entries, seed=1, log=print):
+    """Insert the generated rows; returns ``(users, entries)`` inserted."""
+    mark = '?' if backend == 'sqlite' else '%s'
+    password_hash = generate_password_hash(
+        PASSWORD, method=normalize_method(os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')))
+    user_sql = f'INSERT INTO users (id, name, email, password) VALUES ({mark}, {mark}, {mark}, {mark})'
+    version_sql = f'INSERT INTO sync_versions (user_id, version) VALUES ({mark}, 0)'
+    entry_sql = (f'INSERT INTO entries (id, what_to_do, due_date, reminder_date, status, user_id) '
+                 f'VALUES ({mark}, {mark}, {mark}, {mark}, {mark}, {mark})')
+    cursor = conn.cursor()
+    pending = []
+    inserted = 0
+    for index, (user, rows) in enumerate(generate(users, entries, seed)):
+        cursor.execute(user_sql, user + (password_hash,))
+        cursor.execute(version_sql, (user[0],))
+        pending.extend(rows)
+        if len(pending) >= CHUNK_ROWS or index == users - 1:
+            cursor.executemany(entry_sql, pending)
+            inserted += len(pending)
+            pending = []
+            conn.commit()
+            log(f'Seeded {index + 1}/{users} users, {inserted} tasks')
+    conn.commit()
+    return users, inserted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seed deterministic benchmark data.')
+    parser.add_argument('--backend', default='sqlite', choices=('sqlite', 'mysql'))
+    parser.add_argument('--database', default='bench.db', help='SQLite database file')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--entries', type=int, default=1000, help='Tasks per user')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true', help='Remove earlier benchmark data first')
+    args = parser.parse_args(argv)
+
+    conn = migrations.connect(args.backend, args.database)
+    try:
+        if args.reset:
+            conn = reset(conn, args.backend, args.database)
+        migrations.migrate(conn, args.backend, log=lambda message: None)
+        start = time.monotonic()
+        users, inserted = seed(conn, args.backend, args.users, args.entries, args.seed)
+        print(f'Seeded {users} users and {inserted} tasks in {time.monotonic() - start:.1f}s')
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""Local stand-in for the public translation providers.
+
+Serves ``/<provider name>`` in each provider's own request and response
+format, so the real ``translation_providers`` parsing runs against it.  Every
+provider has a latency and failure profile (``PROFILES``): a log-normal
+latency around its median, a share of ``500`` errors, and a share of calls
+that hang past the provider timeout.  Latencies and failures come from a
+seeded generator.  A "translation" is the text with the target language
+appended, which the engine accepts as a real answer.
+
+Point the MySQL backend at it with ``TRANSLATION_PROVIDER_BASE_URL``::
+
+    python benchmarks/stub_provider.py --port 8099 &
+    TRANSLATION_PROVIDER_BASE_URL=http://127.0.0.1:8099 python api_backend_mysql.py
+
+``load_scenarios.py`` starts one itself for in-process runs.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# provider name -> (median latency in seconds, error rate, hang rate)
+PROFILES = {
+    'mymemory': (0.08, 0.05, 0.0),
+    'google': (0.05, 0.02, 0.01),
+    'lingojam': (0.2, 0.2, 0.0),
+    'libretranslate': (0.3, 0.1, 0.02),
+    'google_cloud_special': (0.15, 0.5, 0.0),
+    'google_alternative': (0.1, 0.3, 0.05),
+}
+HANG_SECONDS = 10
+
+
+def translate(text, lang):
+    return f'{text} [{lang}]'
+
+
+def _texts_and_lang(name, query, body):
+    """Input texts and target language of a request in provider ``name``'s format."""
+    if name == 'mymemory':
+        return [query['q'][0]], query['langpair'][0].split('|')[1]
+    if name == 'google':
+        return query['q'][0].split('\n'), query['tl'][0]
+    if name == 'lingojam':
+        return [query['text'][0]], query['to'][0]
+    if name == 'libretranslate':
+        payload = json.loads(body)
+        texts = payload['q']
+        return texts if isinstance(texts, list) else [texts], payload['target']
+    if name == 'google_cloud_special':
+        return query['q'], query['target'][0]
+    return query['q'], query['tl'][0]
+
+
+def _response(name, texts, lang):
+    translated = [translate(text, lang) for text in texts]
+    if name == 'mymemory':
+        return {'responseData': {'translatedText': translated[0]}}
+    if name == 'google':
+        return [[['\n'.join(translated), '\n'.join(texts), None, None]]]
+    if name == 'lingojam':
+        return {'translatedText': translated[0]}
+    if name == 'libretranslate':
+        return {'translatedText': translated}
+    if name == 'google_cloud_special':
+        return {'data': {'translations': [{'translatedText': t} for t in translated]}}
+    return translated
+
+
+class StubProviderServer(object):
+    """Threaded HTTP server imitating every provider in ``PROFILES``."""
+
+    def __init__(self, host='127.0.0.1', port=0, seed=1, latency_scale=1.0, failure_scale=1.0):
+        self.latency_scale = latency_scale
+        self.failure_scale = failure_scale
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {name: 0 for name in PROFILES}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.handle(self, b'')
+
+            def do_POST(self):
+                stub.handle(self, self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://{host}:{self.server.server_address[1]}'
+
+    def _draw(self, name):
+        median, error_rate, hang_rate = PROFILES[name]
+        with self._lock:
+            self.calls[name] += 1
+            roll = self._random.random()
+            latency = median * math.exp(self._random.gauss(0, 0.5))
+        if roll < hang_rate * self.failure_scale:
+            return HANG_SECONDS, False
+        return latency * self.latency_scale, roll < (hang_rate + error_rate) * self.failure_scale
+
+    def handle(self, handler, body):
+        url = urlparse(handler.path)
+        name = url.path.strip('/')
+        if name not in PROFILES:
+            self._send(handler, 404, {'error': 'unknown provider'})
+            return
+        latency, failed = self._draw(name)
+        time.sleep(latency)
+        if failed:
+            self._send(handler, 500, {'error': 'simulated failure'})
+            return
+        try:
+            texts, lang = _texts_and_lang(name, parse_qs(url.query), body)
+        except (KeyError, IndexError, ValueError):
+            self._send(handler, 400, {'error': 'bad request'})
+            return
+        self._send(handler, 200, _response(name, texts, lang))
+
+    def _send(self, handler, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        try:
+            handler.send_response(status)
+            handler.send_header('Content-Type', 'application/json')
+            handler.send_header('Content-Length', str(len(data)))
+            handler.end_headers()
+            handler.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The engine abandoned a hung or hedged call
+            pass
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='stub-provider', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve stub translation providers.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='Multiply every latency')
+    parser.add_argument('--failure-scale', type=float, default=1.0, help='Multiply every error and hang rate')
+    args = parser.parse_args(argv)
+    stub = StubProviderServer(args.host, args.port, args.seed, args.latency_scale, args.failure_scale)
+    print(f"Stub providers at {stub.url}/<provider name>: {', '.join(PROFILES)}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
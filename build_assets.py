@@ -0,0 +1,118 @@
+"""Build the frontend pages into fingerprinted static files.
+
+Each page in ``templates/`` keeps its markup, but every inline ``<style>``
+and ``<script>`` block is moved into its own file named after a hash of its
+content (``index.3f2a1b9c0d4e.js``) and referenced from the same spot, so
+load order is unchanged.  Every output file also gets a ``.gz`` copy
+compressed at the highest level.  ``todolist.py`` serves the result:
+fingerprinted assets never change under their name and are cached for a
+year, and the small HTML pages are revalidated with their ``ETag``.
+
+Run it after changing a template and as part of the image build::
+
+    python build_assets.py [--templates templates] [--output static/dist]
+
+A ``manifest.json`` in the output lists the pages, the assets with their
+content types, and a hash of each source template; ``todolist.py`` falls
+back to rendering the template when the build is missing or out of date.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import textwrap
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(ROOT, 'templates')
+OUTPUT_DIR = os.path.join(ROOT, 'static', 'dist')
+ASSET_URL = '/assets/'
+MANIFEST = 'manifest.json'
+
+# Only attribute-less blocks are inline code; <script src=...> stays as it is
+INLINE_BLOCK = re.compile(r'(?P<indent>[ \t]*)<(?P<tag>style|script)>(?P<body>.*?)</(?P=tag)>', re.S)
+CONTENT_TYPES = {
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8',
+    '.html': 'text/html; charset=utf-8',
+}
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def template_pages(templates_dir=TEMPLATES_DIR):
+    """Yield ``(page, raw_bytes)`` for each ``.html`` template."""
+    for page in sorted(os.listdir(templates_dir)):
+        if page.endswith('.html'):
+            with open(os.path.join(templates_dir, page), 'rb') as f:
+                yield page, f.read()
+
+
+def source_digests(templates_dir=TEMPLATES_DIR):
+    """Fingerprint of every template, as recorded in the manifest's ``sources``."""
+    return {page: fingerprint(raw) for page, raw in template_pages(templates_dir)}
+
+
+def write_file(directory, name, data):
+    """Write ``data`` and its gzip copy."""
+    with open(os.path.join(directory, name), 'wb') as f:
+        f.write(data)
+    with open(os.path.join(directory, name + '.gz'), 'wb') as f:
+        # mtime=0 keeps the output identical between builds of the same input
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+
+
+def build_page(source, page, output_dir, assets):
+    """Split one template into assets; returns the rewritten HTML."""
+    stem = os.path.splitext(page)[0]
+
+    def extract(match):
+        body = textwrap.dedent(match.group('body')).strip('\n')
+        if not body.strip():
+            return match.group(0)
+        ext = '.css' if match.group('tag') == 'style' else '.js'
+        data = (body + '\n').encode('utf-8')
+        name = f'{stem}.{fingerprint(data)}{ext}'
+        write_file(output_dir, name, data)
+        assets[name] = CONTENT_TYPES[ext]
+        indent = match.group('indent')
+        if ext == '.css':
+            return f'{indent}<link rel="stylesheet" href="{ASSET_URL}{name}">'
+        return f'{indent}<script src="{ASSET_URL}{name}"></script>'
+
+    return INLINE_BLOCK.sub(extract, source)
+
+
+def build(templates_dir=TEMPLATES_DIR, output_dir=OUTPUT_DIR, log=print):
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+    manifest = {'pages': {}, 'assets': {}, 'sources': {}}
+    for page, raw in template_pages(templates_dir):
+        html = build_page(raw.decode('utf-8'), page, output_dir, manifest['assets']).encode('utf-8')
+        write_file(output_dir, page, html)
+        manifest['pages'][page] = CONTENT_TYPES['.html']
+        manifest['sources'][page] = fingerprint(raw)
+        log(f'Built {page}: {len(raw)} -> {len(html)} bytes of HTML')
+    with open(os.path.join(output_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    log(f"Wrote {len(manifest['pages'])} pages and {len(manifest['assets'])} assets to {output_dir}")
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build fingerprinted frontend assets.')
+    parser.add_argument('--templates', default=TEMPLATES_DIR, help='Directory with the page templates')
+    parser.add_argument('--output', default=OUTPUT_DIR, help='Output directory (replaced on every build)')
+    args = parser.parse_args(argv)
+    build(args.templates, args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,33 @@
+import sqlite3
+import uuid
+
+import pytest
+
+import migrations
+from item_repository import ItemRepository
+
+
+@pytest.fixture
+def db():
+    """An in-memory SQLite database with every migration applied."""
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    migrations.migrate(conn, 'sqlite', log=lambda message: None)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def repository():
+    return ItemRepository('?')
+
+
+@pytest.fixture
+def make_user(db):
+    def make_user():
+        user_id = str(uuid.uuid4())
+        db.execute('INSERT INTO users (id, name, email, password) VALUES (?, ?, ?, ?)',
+                   (user_id, 'Test', f'{user_id}@example.com', 'x'))
+        db.commit()
+        return user_id
+    return make_user
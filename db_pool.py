@@ -0,0 +1,252 @@
+"""A small thread-safe, fork-aware connection pool.
+
+The pool hands out raw DB-API connections created by a ``connect`` callable
+and takes them back at the end of a request.  It keeps at most ``max_size``
+connections per process, health-checks connections that have been idle for a
+while before handing them out, closes connections that sat idle for too long
+or outlived ``max_lifetime``, and exposes counters through ``stats()``.
+``load()`` reports the current queue and the recent checkout wait, for load
+shedding in front of the pool.
+
+A process that forks (e.g. gunicorn with ``--preload``) never reuses the
+parent's sockets: the first checkout in the child drops the inherited
+connections without closing them and starts with an empty pool.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+
+# Checkout waits are averaged over roughly this many seconds by load()
+RECENT_WAIT_WINDOW = 2.0
+RECENT_WAIT_WEIGHT = 0.1
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection became available within the checkout timeout."""
+
+
+class _Meta(object):
+    __slots__ = ('created_at', 'last_used')
+
+    def __init__(self, now):
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool(object):
+    """Bounded pool of DB-API connections."""
+
+    def __init__(self, connect, max_size=10, timeout=5.0, max_idle_time=300,
+                 max_lifetime=3600, ping_interval=30):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle_time = max_idle_time
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition(threading.Lock())
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = deque()  # (conn, meta); most recently used on the right
+        self._in_use = {}
+        self._size = 0  # open connections plus reserved slots being opened
+        self._waiting = 0
+        self._recent_wait = 0.0
+        self._recent_at = time.monotonic()
+        self._counters = {
+            'created': 0,
+            'closed': 0,
+            'checkouts': 0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+        }
+
+    def _check_pid(self):
+        # Sockets inherited across fork() belong to the parent; forget them.
+        if self._pid != os.getpid():
+            self._reset_state()
+
+    def _expired(self, meta, now):
+        if self.max_lifetime and now - meta.created_at > self.max_lifetime:
+            return True
+        if self.max_idle_time and now - meta.last_used > self.max_idle_time:
+            return True
+        return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _evict_idle_locked(self, now):
+        """Drop expired connections from the idle queue; return them for closing."""
+        expired = []
+        kept = deque()
+        while self._idle:
+            conn, meta = self._idle.popleft()
+            if self._expired(meta, now):
+                expired.append(conn)
+                self._size -= 1
+                self._counters['closed'] += 1
+            else:
+                kept.append((conn, meta))
+        self._idle = kept
+        return expired
+
+    def _healthy(self, conn, meta, now):
+        if now - meta.last_used < self.ping_interval:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        """Check a connection out of the pool, opening one if there is room."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        while True:
+            to_close = []
+            with self._cond:
+                self._check_pid()
+                now = time.monotonic()
+                to_close = self._evict_idle_locked(now)
+                candidate = None
+                reserved = False
+                if self._idle:
+                    candidate = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    reserved = True
+                else:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        self._record_wait_locked(self.timeout, now)
+                        raise PoolExhausted(
+                            'No database connection available within %.1fs' % self.timeout)
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+            for conn in to_close:
+                self._close(conn)
+
+            if candidate is not None:
+                conn, meta = candidate
+                if not self._healthy(conn, meta, time.monotonic()):
+                    self._close(conn)
+                    with self._cond:
+                        self._size -= 1
+                        self._counters['closed'] += 1
+                        self._counters['health_check_failures'] += 1
+                        self._cond.notify()
+                    continue
+                return self._checked_out(conn, meta, start)
+
+            if reserved:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._counters['created'] += 1
+                return self._checked_out(conn, _Meta(time.monotonic()), start)
+
+    def _recent_wait_locked(self, now):
+        # Fades while nobody checks out, so a burst of waits does not linger
+        return self._recent_wait * math.exp(-(now - self._recent_at) / RECENT_WAIT_WINDOW)
+
+    def _record_wait_locked(self, waited, now):
+        recent = self._recent_wait_locked(now)
+        self._recent_wait = recent + (waited - recent) * RECENT_WAIT_WEIGHT
+        self._recent_at = now
+
+    def _checked_out(self, conn, meta, start):
+        now = time.monotonic()
+        waited = now - start
+        with self._cond:
+            self._in_use[conn] = meta
+            self._record_wait_locked(waited, now)
+            self._counters['checkouts'] += 1
+            self._counters['wait_time_total'] += waited
+            if waited > self._counters['wait_time_max']:
+                self._counters['wait_time_max'] = waited
+        return conn
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, rolling back any open transaction."""
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            meta = self._in_use.pop(conn, None)
+        if meta is None:
+            # Not ours (e.g. opened before a fork); just close it.
+            self._close(conn)
+            return
+
+        now = time.monotonic()
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        if discard or (self.max_lifetime and now - meta.created_at > self.max_lifetime):
+            self._close(conn)
+            with self._cond:
+                self._size -= 1
+                self._counters['closed'] += 1
+                self._cond.notify()
+            return
+
+        meta.last_used = now
+        with self._cond:
+            self._idle.append((conn, meta))
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection; in-use connections are closed on release."""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._counters['closed'] += len(idle)
+        for conn, _ in idle:
+            self._close(conn)
+
+    def load(self):
+        """Return ``(waiting, recent_wait)``: threads queued for a connection and the recent average wait."""
+        with self._cond:
+            self._check_pid()
+            return self._waiting, self._recent_wait_locked(time.monotonic())
+
+    def stats(self):
+        """Return a snapshot of pool gauges and counters."""
+        with self._cond:
+            self._check_pid()
+            stats = dict(self._counters)
+            stats.update({
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'waiting': self._waiting,
+                'recent_wait': self._recent_wait_locked(time.monotonic()),
+                'pid': self._pid,
+            })
+        checkouts = stats['checkouts']
+        stats['wait_time_avg'] = stats['wait_time_total'] / checkouts if checkouts else 0.0
+        return stats
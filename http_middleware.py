@@ -0,0 +1,129 @@
+"""Compression and conditional caching for every API response.
+
+``HTTPMiddleware(app)`` registers an ``after_request`` hook, so it applies to
+all routes without per-route changes:
+
+* **Conditional GETs.** Routes that know a cheap version of their data set
+  their own ``ETag`` and answer ``If-None-Match`` before doing any work (the
+  task listing uses the user's sync counter).  Other successful ``GET``
+  responses get a weak ``ETag`` hashed from the body, and a matching
+  ``If-None-Match`` turns them into a bodiless ``304``.
+* **Cache headers.** Responses to requests carrying credentials are never
+  stored by shared caches: they get ``Vary`` on the credential header, and
+  ``Cache-Control: private, no-cache`` (revalidate before reuse) when they
+  have an ``ETag``, ``no-store`` otherwise.  Routes that set
+  ``Cache-Control`` themselves keep it.
+* **Compression.** JSON, NDJSON and text bodies of at least ``min_size``
+  bytes are gzip- or deflate-encoded, as negotiated with ``Accept-Encoding``.
+  Streamed responses are compressed as they are produced.  The compressor is
+  flushed whenever the producer was slow to deliver a chunk (or 64 KiB of
+  input are buffered), so NDJSON progress lines still arrive as they happen
+  while a fast export compresses as well as a whole body would.  A compressed
+  response's ``ETag`` is made weak, since the bytes differ per encoding;
+  ``If-None-Match`` is compared weakly everywhere, so a client's stored
+  ``ETag`` keeps matching.
+"""
+import time
+import zlib
+
+from flask import request
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'application/javascript', 'text/')
+CREDENTIAL_HEADERS = ('x-access-token', 'x-admin-token', 'Authorization')
+FLUSH_AFTER_SECONDS = 0.05
+FLUSH_AFTER_BYTES = 65536
+
+
+class HTTPMiddleware(object):
+    """Conditional GET, cache headers and response compression for ``app``."""
+
+    def __init__(self, app=None, min_size=1024, level=6):
+        self.min_size = min_size
+        self.level = level
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.process)
+
+    def process(self, response):
+        if request.method in ('GET', 'HEAD') and response.status_code == 200:
+            self._conditional(response)
+        self._cache_headers(response)
+        self._compress(response)
+        return response
+
+    def _conditional(self, response):
+        if response.is_streamed or 'no-store' in response.headers.get('Cache-Control', ''):
+            return
+        if 'ETag' not in response.headers:
+            response.add_etag(weak=True)
+        response.make_conditional(request)
+
+    def _cache_headers(self, response):
+        credentials = [name for name in CREDENTIAL_HEADERS if name in request.headers]
+        if not credentials:
+            return
+        for name in credentials:
+            response.vary.add(name)
+        if 'Cache-Control' not in response.headers:
+            if 'ETag' in response.headers:
+                response.headers['Cache-Control'] = 'private, no-cache'
+            else:
+                response.headers['Cache-Control'] = 'no-store'
+
+    def _compress(self, response):
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return
+        if 'Content-Encoding' in response.headers or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES):
+            return
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(['gzip', 'deflate'])
+        if encoding is None:
+            return
+        if response.is_streamed:
+            self._compress_stream(response, encoding)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return
+            compressor = self._compressor(encoding)
+            response.set_data(compressor.compress(data) + compressor.flush())
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+    def _compressor(self, encoding):
+        # wbits 16+ writes a gzip wrapper; plain wbits is the zlib format HTTP calls "deflate"
+        wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+        return zlib.compressobj(self.level, zlib.DEFLATED, wbits)
+
+    def _compress_stream(self, response, encoding):
+        compressor = self._compressor(encoding)
+        original = response.response
+        chunks = response.iter_encoded()
+
+        def generate():
+            buffered = 0
+            last = time.monotonic()
+            try:
+                for chunk in chunks:
+                    # A slow producer (e.g. import progress) is flushed at once so
+                    # its output is not held back waiting for more input
+                    slow = time.monotonic() - last > FLUSH_AFTER_SECONDS
+                    data = compressor.compress(chunk)
+                    buffered += len(chunk)
+                    if slow or buffered >= FLUSH_AFTER_BYTES:
+                        data += compressor.flush(zlib.Z_SYNC_FLUSH)
+                        buffered = 0
+                    if data:
+                        yield data
+                    last = time.monotonic()
+                yield compressor.flush()
+            finally:
+                if hasattr(original, 'close'):
+                    original.close()
+
+        response.response = generate()
+        response.headers.pop('Content-Length', None)
@@ -0,0 +1,127 @@
+"""Mixed create/update/delete operations on entries in one transaction.
+
+``POST /api/items/batch`` takes a list of operations::
+
+    {"operations": [
+        {"op": "create", "what_to_do": "Buy milk", "due_date": "2023-05-01 10:00"},
+        {"op": "update", "id": "<item id>", "status": "done"},
+        {"op": "delete", "id": "<item id>"}
+    ]}
+
+Operations are validated up front, ownership of every referenced item is
+checked with a single ``IN`` query, and the writes are grouped into one
+``executemany`` per statement shape (creates, updates touching the same
+columns, deletes) inside a single transaction.  Each operation gets its own
+result, so an invalid or unknown item does not fail the rest of the batch.
+
+Because writes are grouped by statement shape, operations do not run in
+request order.  A batch may therefore reference each item id at most once;
+one that updates and deletes the same item, say, is rejected as a whole.
+"""
+from item_repository import UPDATABLE_FIELDS, clean_fields
+
+MAX_OPERATIONS = 500
+
+
+class InvalidBatch(ValueError):
+    """Raised when the request body is not a list of operations."""
+
+
+def apply_batch(db, cursor, repository, user_id, operations, max_operations=MAX_OPERATIONS,
+                on_reminder=None):
+    """Apply ``operations`` for ``user_id`` and commit; returns one result dict per operation.
+
+    ``db`` is the connection (committed or rolled back here), ``cursor`` a
+    cursor on it and ``repository`` the backend's ``ItemRepository``.
+    ``on_reminder(item_id, reminder_date)`` is called after the commit for
+    every created or updated item whose reminder date was set.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise InvalidBatch('operations must be a non-empty list')
+    if len(operations) > max_operations:
+        raise InvalidBatch(f'At most {max_operations} operations per batch')
+
+    results = [None] * len(operations)
+    creates = []
+    updates = {}  # tuple of fields -> [(index, item_id, values)]
+    reminders = []  # [(item_id, reminder_date)]
+    deletes = []  # [(index, item_id)]
+    referenced = set()
+
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict):
+            results[index] = {'index': index, 'status': 400, 'message': 'Operation must be an object'}
+            continue
+        kind = op.get('op')
+        if kind == 'create':
+            if not op.get('what_to_do'):
+                results[index] = {'index': index, 'op': kind, 'status': 400,
+                                  'message': 'Task description is required'}
+                continue
+            creates.append((index, repository.new_row(user_id, op['what_to_do'], op.get('due_date'),
+                                                      op.get('reminder_date'))))
+        elif kind in ('update', 'delete'):
+            item_id = op.get('id')
+            if not isinstance(item_id, str) or not item_id:
+                results[index] = {'index': index, 'op': kind, 'status': 400, 'message': 'Item id is required'}
+                continue
+            if item_id in referenced:
+                raise InvalidBatch(f'Item {item_id} appears in more than one operation')
+            referenced.add(item_id)
+            if kind == 'delete':
+                deletes.append((index, item_id))
+                continue
+            fields = clean_fields(op)
+            if not fields:
+                results[index] = {'index': index, 'op': kind, 'id': item_id, 'status': 400,
+                                  'message': 'Nothing to update'}
+                continue
+            names = tuple(f for f in UPDATABLE_FIELDS if f in fields)
+            updates.setdefault(names, []).append((index, item_id, [fields[f] for f in names]))
+        else:
+            results[index] = {'index': index, 'status': 400,
+                              'message': "op must be one of 'create', 'update' or 'delete'"}
+
+    try:
+        owned = repository.owned_ids(cursor, user_id, referenced)
+
+        if creates:
+            repository.create_many(cursor, [row for _, row in creates])
+            for index, row in creates:
+                results[index] = {'index': index, 'op': 'create', 'id': row[0], 'status': 201}
+                if row[3] is not None:
+                    reminders.append((row[0], row[3]))
+
+        for names, group in updates.items():
+            rows = []
+            for index, item_id, values in group:
+                if item_id in owned:
+                    rows.append(values + [item_id, user_id])
+                    results[index] = {'index': index, 'op': 'update', 'id': item_id, 'status': 200}
+                    if 'reminder_date' in names:
+                        reminders.append((item_id, values[names.index('reminder_date')]))
+                else:
+                    results[index] = {'index': index, 'op': 'update', 'id': item_id, 'status': 404,
+                                      'message': 'Item not found'}
+            if rows:
+                repository.update_many(cursor, names, rows)
+
+        deleted = []
+        for index, item_id in deletes:
+            if item_id in owned:
+                deleted.append(item_id)
+                results[index] = {'index': index, 'op': 'delete', 'id': item_id, 'status': 200}
+            else:
+                results[index] = {'index': index, 'op': 'delete', 'id': item_id, 'status': 404,
+                                  'message': 'Item not found'}
+        if deleted:
+            repository.delete_many(cursor, user_id, list(dict.fromkeys(deleted)))
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if on_reminder is not None:
+        for item_id, reminder_date in reminders:
+            on_reminder(item_id, reminder_date)
+    return results
@@ -0,0 +1,219 @@
+"""Queries on ``entries`` shared by the SQLite and MySQL backends.
+
+Every mutation is a single statement scoped by ``WHERE id = ? AND user_id = ?``
+whose affected row count tells the caller whether the item exists and
+belongs to the user, so no ``SELECT`` is needed before a write.  Change
+tracking for delta sync is done by triggers on ``entries`` (migration 005),
+so it costs no extra round trip either.
+
+The SQL text for each statement shape is built once per repository and
+reused.  ``sqlite3`` keeps compiled statements per connection keyed by their
+text, so reused text skips re-parsing; on MySQL it saves rebuilding the
+string on every request.
+"""
+import datetime
+import uuid
+
+from pagination import ENTRY_COLUMNS, fetch_page
+from search import fetch_search
+
+UPDATABLE_FIELDS = ('status', 'what_to_do', 'due_date', 'reminder_date')
+DATE_FIELDS = ('due_date', 'reminder_date')
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def field_value(field, value):
+    # Empty dates are stored as NULL so they sort with undated tasks; the rest
+    # are stored in one format so that SQLite's text comparisons order them
+    if field in DATE_FIELDS:
+        if not value:
+            return None
+        try:
+            return datetime.datetime.fromisoformat(value).strftime(DATE_FORMAT)
+        except (TypeError, ValueError):
+            return value
+    return value
+
+
+def clean_fields(data):
+    """Return the updatable fields present in ``data``, dates normalized."""
+    return {f: field_value(f, data[f]) for f in UPDATABLE_FIELDS if f in data}
+
+
+class ItemRepository(object):
+    """Entry statements for one driver's parameter ``placeholder`` (``?`` or ``%s``)."""
+
+    def __init__(self, placeholder, dialect='sqlite'):
+        self.placeholder = placeholder
+        self.dialect = dialect
+        self._statements = {}
+
+    def _sql(self, key, build):
+        sql = self._statements.get(key)
+        if sql is None:
+            sql = self._statements[key] = build(self.placeholder)
+        return sql
+
+    # --- Reads ------------------------------------------------------------
+
+    def page(self, cursor, page, user_id):
+        """Return ``(rows, next_cursor)`` for a ``PageRequest``."""
+        def run(sql, params):
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        return fetch_page(page, user_id, self.placeholder, run)
+
+    def search(self, cursor, search, user_id):
+        """Return ``(rows, next_cursor)`` for a ``SearchRequest``, best matches first."""
+        def run(sql, params):
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        return fetch_search(search, user_id, self.dialect, self.placeholder, run)
+
+    def stats(self, cursor, user_id, now):
+        """Return task counts by status and the number of pending tasks due before ``now``.
+
+        The status counts are the user's rows in ``task_counts``, kept by
+        triggers (migration 008); the overdue count is one range of the
+        ``(user_id, status, due_date, id)`` index.
+        """
+        cursor.execute(self._sql('task_counts', lambda p: (
+            f'SELECT status, tasks FROM task_counts WHERE user_id = {p}')), (user_id,))
+        by_status = {'pending': 0, 'done': 0}
+        for row in cursor.fetchall():
+            if row['tasks'] or row['status'] in by_status:
+                by_status[row['status']] = row['tasks']
+        cursor.execute(self._sql('overdue', lambda p: (
+            f"SELECT COUNT(*) AS overdue FROM entries "
+            f"WHERE user_id = {p} AND status = 'pending' AND due_date < {p}")), (user_id, now))
+        return {'total': sum(by_status.values()), 'by_status': by_status,
+                'overdue': cursor.fetchone()['overdue']}
+
+    def exists(self, cursor, user_id, item_id):
+        cursor.execute(self._sql('exists', lambda p: f'SELECT 1 FROM entries WHERE id = {p} AND user_id = {p}'),
+                       (item_id, user_id))
+        return cursor.fetchone() is not None
+
+    def owned_ids(self, cursor, user_id, item_ids):
+        """Return the subset of ``item_ids`` that belong to ``user_id``, in one query."""
+        ids = sorted(set(item_ids))
+        if not ids:
+            return set()
+        sql = self._sql(('owned', len(ids)), lambda p: (
+            f"SELECT id FROM entries WHERE user_id = {p} AND id IN ({', '.join([p] * len(ids))})"))
+        cursor.execute(sql, [user_id] + ids)
+        return {row['id'] for row in cursor.fetchall()}
+
+    def sync_version(self, cursor, user_id):
+        """Return the user's change counter (0 when nothing was ever written)."""
+        cursor.execute(self._sql('sync_version', lambda p: f'SELECT version FROM sync_versions WHERE user_id = {p}'),
+                       (user_id,))
+        row = cursor.fetchone()
+        return row['version'] if row else 0
+
+    def changes_since(self, cursor, user_id, since):
+        """Return ``(rows, deleted_ids)`` changed after version ``since``."""
+        cursor.execute(self._sql('changed', lambda p: (
+            f'SELECT {ENTRY_COLUMNS} FROM entries WHERE user_id = {p} AND version > {p} ORDER BY version, id')),
+            (user_id, since))
+        rows = cursor.fetchall()
+        cursor.execute(self._sql('deleted', lambda p: (
+            f'SELECT id FROM entry_tombstones WHERE user_id = {p} AND version > {p} ORDER BY version, id')),
+            (user_id, since))
+        return rows, [row['id'] for row in cursor.fetchall()]
+
+    def pending_reminders(self, cursor, start, end, after, limit):
+        """Return unsent reminders with ``start <= reminder_date < end``, by ``(reminder_date, id)``.
+
+        ``after`` is the ``(reminder_date, id)`` of the last row of the previous
+        batch, or None for the first one.
+        """
+        if after is None:
+            sql = self._sql('reminders', lambda p: (
+                f'SELECT id, reminder_date FROM entries '
+                f'WHERE reminder_date >= {p} AND reminder_date < {p} AND reminder_sent_at IS NULL '
+                f'ORDER BY reminder_date, id LIMIT {p}'))
+            cursor.execute(sql, (start, end, limit))
+        else:
+            sql = self._sql('reminders_after', lambda p: (
+                f'SELECT id, reminder_date FROM entries '
+                f'WHERE reminder_date >= {p} AND (reminder_date > {p} OR id > {p}) '
+                f'AND reminder_date < {p} AND reminder_sent_at IS NULL '
+                f'ORDER BY reminder_date, id LIMIT {p}'))
+            cursor.execute(sql, (after[0], after[0], after[1], end, limit))
+        return cursor.fetchall()
+
+    def export(self, cursor, user_id):
+        """Run the export query on ``cursor``; the caller fetches the rows in batches."""
+        cursor.execute(self._sql('export', lambda p: (
+            f'SELECT {ENTRY_COLUMNS} FROM entries WHERE user_id = {p} ORDER BY id')), (user_id,))
+
+    # --- Writes -----------------------------------------------------------
+
+    def _insert_sql(self):
+        return self._sql('insert', lambda p: (
+            f'INSERT INTO entries (id, what_to_do, due_date, reminder_date, status, user_id) '
+            f'VALUES ({p}, {p}, {p}, {p}, {p}, {p})'))
+
+    def new_row(self, user_id, what_to_do, due_date=None, reminder_date=None, status='pending'):
+        """Return the insert parameters for a new item; the id is ``row[0]``."""
+        return (str(uuid.uuid4()), what_to_do, field_value('due_date', due_date),
+                field_value('reminder_date', reminder_date), status, user_id)
+
+    def create(self, cursor, user_id, what_to_do, due_date=None, reminder_date=None):
+        """Insert a pending item and return its id."""
+        row = self.new_row(user_id, what_to_do, due_date, reminder_date)
+        cursor.execute(self._insert_sql(), row)
+        return row[0]
+
+    def create_many(self, cursor, rows):
+        cursor.executemany(self._insert_sql(), rows)
+
+    def _update_sql(self, fields):
+        # A new reminder date re-arms the reminder
+        rearm = ', reminder_sent_at = NULL' if 'reminder_date' in fields else ''
+        return self._sql(('update', fields), lambda p: (
+            f"UPDATE entries SET {', '.join(f'{f} = {p}' for f in fields)}{rearm} "
+            f"WHERE id = {p} AND user_id = {p}"))
+
+    def update(self, cursor, user_id, item_id, fields):
+        """Apply ``fields`` (from ``clean_fields``); returns False if the user has no such item."""
+        names = tuple(f for f in UPDATABLE_FIELDS if f in fields)
+        cursor.execute(self._update_sql(names), [fields[f] for f in names] + [item_id, user_id])
+        return cursor.rowcount > 0
+
+    def update_many(self, cursor, names, rows):
+        """Run one ``executemany`` for updates touching the same ``names``.
+
+        Each row is the field values in ``names`` order followed by item id and user id.
+        """
+        cursor.executemany(self._update_sql(names), rows)
+
+    def _delete_sql(self):
+        return self._sql('delete', lambda p: f'DELETE FROM entries WHERE id = {p} AND user_id = {p}')
+
+    def delete(self, cursor, user_id, item_id):
+        """Delete the item; returns False if the user has no such item."""
+        cursor.execute(self._delete_sql(), (item_id, user_id))
+        return cursor.rowcount > 0
+
+    def delete_many(self, cursor, user_id, item_ids):
+        cursor.executemany(self._delete_sql(), [(item_id, user_id) for item_id in item_ids])
+
+    def claim_reminder(self, cursor, item_id, reminder_date):
+        """Mark the reminder sent and return the item, or None if it no longer applies.
+
+        The ``UPDATE`` only matches while the item still has this
+        ``reminder_date``, is not done and was not sent yet, so exactly one
+        caller wins even across processes.
+        """
+        cursor.execute(self._sql('claim_reminder', lambda p: (
+            f"UPDATE entries SET reminder_sent_at = CURRENT_TIMESTAMP WHERE id = {p} AND reminder_date = {p} "
+            f"AND reminder_sent_at IS NULL AND status <> 'done'")), (item_id, reminder_date))
+        if cursor.rowcount == 0:
+            return None
+        cursor.execute(self._sql('reminder_item', lambda p: (
+            f'SELECT id, user_id, what_to_do, due_date, reminder_date, status FROM entries WHERE id = {p}')),
+            (item_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
@@ -0,0 +1,207 @@
+"""Streaming export and bulk import of a user's entries.
+
+``GET /api/items/export?format=ndjson|csv`` walks the user's rows from a
+server-side cursor (``SSDictCursor`` on MySQL; ``sqlite3`` cursors step
+lazily anyway) in ``fetchmany`` batches and writes them out as they arrive,
+so memory use does not grow with the number of tasks.
+
+``POST /api/items/import`` reads an NDJSON or CSV upload line by line.  Valid
+records are inserted with one ``executemany`` per chunk of ``chunk_size``
+rows, each chunk in its own transaction, so a large import never holds the
+writer (or a long transaction) for its whole duration.  The response is an
+NDJSON stream of report lines::
+
+    {"line": 7, "error": "what_to_do is required"}
+    {"progress": {"lines": 500, "imported": 499, "failed": 1}}
+    {"done": true, "lines": 1200, "imported": 1198, "failed": 2}
+
+Chunks committed before a database error stay imported; the last line then
+has ``"done": false``.
+
+Imported tasks always get new ids; ``id`` columns in the upload are ignored,
+so an export can be imported into another account.
+"""
+import csv
+import datetime
+import io
+import json
+
+from item_repository import DATE_FIELDS, DATE_FORMAT
+
+EXPORT_FIELDS = ('id', 'what_to_do', 'due_date', 'reminder_date', 'status')
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+STATUSES = ('pending', 'done')
+
+
+class InvalidTransfer(ValueError):
+    """Raised for an unknown format or an unusable upload."""
+
+
+def transfer_format(value, content_type=None):
+    """Pick ``ndjson`` or ``csv`` from a ``format`` parameter or the upload's content type."""
+    if not value and content_type:
+        value = 'csv' if content_type.split(';')[0].strip() == 'text/csv' else 'ndjson'
+    value = value or 'ndjson'
+    if value not in FORMATS:
+        raise InvalidTransfer("format must be 'ndjson' or 'csv'")
+    return value
+
+
+def iter_rows(cursor, batch_size=500):
+    """Yield the rows of an executed query ``batch_size`` at a time, closing ``cursor`` at the end."""
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+    finally:
+        # An unbuffered MySQL cursor must be drained before its connection is reused
+        cursor.close()
+
+
+def _export_record(row):
+    record = {}
+    for field in EXPORT_FIELDS:
+        value = row[field]
+        if isinstance(value, datetime.datetime):
+            value = value.strftime(DATE_FORMAT)
+        record[field] = value
+    return record
+
+
+def export_lines(rows, fmt):
+    """Encode rows as NDJSON lines or CSV (header first), one string per row."""
+    if fmt == 'ndjson':
+        for row in rows:
+            yield json.dumps(_export_record(row)) + '\n'
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        record = _export_record(row)
+        writer.writerow(['' if record[f] is None else record[f] for f in EXPORT_FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header only: nothing to export
+        yield buffer.getvalue()
+
+
+def parse_ndjson(stream, max_line_bytes=65536):
+    """Yield ``(line_number, record, error)`` for each non-blank line of ``stream``."""
+    line_number = 0
+    while True:
+        line = stream.readline(max_line_bytes + 1)
+        if not line:
+            return
+        line_number += 1
+        if len(line) > max_line_bytes and not line.endswith(b'\n'):
+            # Skip the rest of the oversized line
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line_bytes)
+            yield line_number, None, f'Line longer than {max_line_bytes} bytes'
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, None, 'Invalid JSON'
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, 'Each line must be a JSON object'
+            continue
+        yield line_number, record, None
+
+
+def parse_csv(stream):
+    """Yield ``(line_number, record, error)`` for each row after the header of a CSV ``stream``."""
+    text = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    try:
+        for record in reader:
+            yield reader.line_num, record, None
+    except (csv.Error, UnicodeDecodeError) as e:
+        yield reader.line_num, None, f'Invalid CSV: {e}'
+
+
+def validate_record(record):
+    """Return ``(what_to_do, due_date, reminder_date, status)`` or raise ``ValueError``."""
+    what_to_do = record.get('what_to_do')
+    if not isinstance(what_to_do, str) or not what_to_do.strip():
+        raise ValueError('what_to_do is required')
+    dates = []
+    for field in DATE_FIELDS:
+        value = record.get(field)
+        if value in (None, ''):
+            dates.append(None)
+            continue
+        try:
+            dates.append(datetime.datetime.fromisoformat(value).strftime(DATE_FORMAT))
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be a date like 2024-05-01 10:00')
+    status = record.get('status') or 'pending'
+    if status not in STATUSES:
+        raise ValueError(f"status must be one of {', '.join(STATUSES)}")
+    return what_to_do, dates[0], dates[1], status
+
+
+def import_records(records, repository, user_id, insert_chunk, chunk_size=500, max_rows=100000,
+                   on_reminder=None):
+    """Insert parsed ``records`` in chunks; yields report dicts (see module docstring).
+
+    ``insert_chunk(rows)`` inserts a list of ``repository.new_row`` tuples in
+    one transaction.  ``on_reminder(item_id, reminder_date)`` is called for
+    imported tasks with a reminder once their chunk is committed.
+    """
+    lines = imported = failed = 0
+    chunk = []
+
+    def flush():
+        try:
+            insert_chunk(chunk)
+        except Exception as e:
+            print(f"Import failed for user {user_id}: {e}")
+            return False
+        if on_reminder is not None:
+            for row in chunk:
+                if row[3] is not None:
+                    on_reminder(row[0], row[3])
+        return True
+
+    def stopped():
+        return [{'line': lines, 'error': 'Import stopped by a database error; later lines were not imported'},
+                {'done': False, 'lines': lines, 'imported': imported, 'failed': failed}]
+
+    for line_number, record, error in records:
+        lines = line_number
+        if error is None and imported + len(chunk) >= max_rows:
+            yield {'line': line_number, 'error': f'At most {max_rows} tasks per import'}
+            break
+        if error is None:
+            try:
+                what_to_do, due_date, reminder_date, status = validate_record(record)
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            failed += 1
+            yield {'line': line_number, 'error': error}
+            continue
+        chunk.append(repository.new_row(user_id, what_to_do, due_date, reminder_date, status))
+        if len(chunk) >= chunk_size:
+            if not flush():
+                yield from stopped()
+                return
+            imported += len(chunk)
+            chunk = []
+            yield {'progress': {'lines': lines, 'imported': imported, 'failed': failed}}
+    if chunk:
+        if not flush():
+            yield from stopped()
+            return
+        imported += len(chunk)
+    yield {'done': True, 'lines': lines, 'imported': imported, 'failed': failed}
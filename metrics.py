@@ -0,0 +1,317 @@
+"""Prometheus metrics for the API backends.
+
+``Metrics`` keeps a few in-process series and serves them at ``/metrics`` in
+the Prometheus text format (version 0.0.4):
+
+* ``http_request_duration_seconds{route,method,status}``: histogram of
+  request latency, labelled with the route's rule (``/api/items/<int:item_id>``)
+  rather than the path, so the number of series stays bounded;
+* ``http_requests_in_flight{route}``: gauge of requests being handled;
+* ``db_query_duration_seconds{statement}``: histogram per statement, labelled
+  with its verb and table (``SELECT entries``); its ``_count`` is the number
+  of queries.  Cursors created from ``cursor_class`` / ``sqlite_connection_class``
+  are timed;
+* ``translation_duration_seconds{provider,language,outcome}``: histogram of
+  provider calls, fed by ``ProviderScoreboard(listener=...)``;
+* gauges and counters read from ``stats()`` dicts (connection pool, SQLite
+  writer) by collectors at scrape time, so they cost nothing in between.
+
+Recording is a dict lookup, a ``bisect`` and an increment under a lock per
+series, cheap enough to leave on.  Each metric keeps at most ``max_series``
+label combinations; any further ones are counted under ``other``.
+
+The numbers are per process: with several workers, each scrape reports the
+worker that served it.
+"""
+import bisect
+import functools
+import re
+import sqlite3
+import threading
+import time
+
+from flask import Response, g, request
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TRANSLATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0)
+
+_VERB = re.compile(r'\s*\(?\s*(\w+)(?:\s+(?:UNIQUE\s+)?(\w+))?')
+_DDL = ('CREATE', 'DROP', 'ALTER')
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?)\s+[`"]?(\w+)', re.I)
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_label(sql):
+    """Verb and table of a SQL statement, e.g. ``SELECT entries``; verb and kind for DDL."""
+    verb = _VERB.match(sql)
+    if verb is None:
+        return 'other'
+    name = verb.group(1).upper()
+    if name in _DDL and verb.group(2):
+        # Schema changes by object kind: CREATE INDEX, DROP TRIGGER
+        return f'{name} {verb.group(2).upper()}'
+    table = _TABLE.search(sql)
+    return f'{name} {table.group(1)}' if table else name
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name, help, labels=(), max_series=1000):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.max_series = max_series
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _get(self, values):
+        # Called with the lock held
+        series = self._series.get(values)
+        if series is None:
+            if len(self._series) >= self.max_series:
+                values = ('other',) * len(self.labels)
+                series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = self._new()
+        return series
+
+    def _new(self):
+        return [0.0]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = [(values, list(series)) for values, series in self._series.items()]
+        for values, series in sorted(items):
+            lines.extend(self._samples(values, series))
+        return lines
+
+    def _samples(self, values, series):
+        return [f'{self.name}{_format_labels(self.labels, values)} {_format_value(series[0])}']
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, *values, amount=1):
+        with self._lock:
+            self._get(values)[0] += amount
+
+    def dec(self, *values, amount=1):
+        with self._lock:
+            self._get(values)[0] -= amount
+
+    def set(self, value, *values):
+        with self._lock:
+            self._get(values)[0] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, max_series=1000):
+        _Metric.__init__(self, name, help, labels, max_series)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new(self):
+        # One count per bucket plus +Inf, then the sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value, *values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._get(values)
+            series[index] += 1
+            series[-1] += value
+
+    def _samples(self, values, series):
+        names = self.labels + ('le',)
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), series):
+            total += count
+            lines.append(f'{self.name}_bucket{_format_labels(names, values + (_format_value(bound),))} {total}')
+        labels = _format_labels(self.labels, values)
+        lines.append(f'{self.name}_sum{labels} {_format_value(series[-1])}')
+        lines.append(f'{self.name}_count{labels} {total}')
+        return lines
+
+
+class Metrics(object):
+    """The backend's metrics and the ``/metrics`` route."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, max_series=1000):
+        self.requests = Histogram('http_request_duration_seconds',
+                                  'Request latency by route, method and status code.',
+                                  ('route', 'method', 'status'), buckets, max_series)
+        self.in_flight = Gauge('http_requests_in_flight', 'Requests currently being handled.',
+                               ('route',), max_series)
+        self.queries = Histogram('db_query_duration_seconds', 'Database query latency by statement.',
+                                 ('statement',), buckets, max_series)
+        self.translations = Histogram('translation_duration_seconds',
+                                      'Translation provider call latency by provider, language and outcome.',
+                                      ('provider', 'language', 'outcome'), TRANSLATION_BUCKETS, max_series)
+        self._metrics = [self.requests, self.in_flight, self.queries, self.translations]
+        self._collectors = []
+        self._cursor_classes = {}
+        # Called as on_query(sql, seconds) after every timed statement
+        self.on_query = None
+        self.started_at = time.time()
+
+    def init_app(self, app, path='/metrics', token=None):
+        """Time every request of ``app`` and serve the metrics at ``path``.
+
+        Call it before registering other ``after_request`` hooks, so the status
+        recorded is the final one.  With ``token`` set, scrapes must send
+        ``Authorization: Bearer <token>``.
+        """
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+        def metrics_endpoint():
+            if token and request.headers.get('Authorization') != f'Bearer {token}':
+                return Response('Unauthorized\n', status=401, mimetype='text/plain')
+            response = Response(self.render(), content_type=CONTENT_TYPE)
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+
+        app.add_url_rule(path, 'metrics', metrics_endpoint, methods=['GET'])
+
+    def _route(self):
+        rule = request.url_rule
+        return rule.rule if rule is not None else 'unmatched'
+
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+        self.in_flight.inc(self._route())
+
+    def _after_request(self, response):
+        start = g.get('_metrics_start')
+        if start is not None:
+            # Streamed bodies are timed up to their first byte
+            self.requests.observe(time.perf_counter() - start, self._route(), request.method,
+                                  str(response.status_code))
+        return response
+
+    def _teardown_request(self, exception):
+        if g.pop('_metrics_start', None) is not None:
+            self.in_flight.dec(self._route())
+
+    def observe_request(self, route, method, status, seconds):
+        """Record a request served outside Flask (the ASGI native routes)."""
+        self.requests.observe(seconds, route, method, str(status))
+
+    def record_translation(self, provider, language, outcome, latency):
+        """``ProviderScoreboard`` listener; also called for direct provider calls."""
+        self.translations.observe(latency, provider, language, outcome)
+
+    def observe_query(self, sql, seconds):
+        self.queries.observe(seconds, statement_label(sql))
+        if self.on_query is not None:
+            self.on_query(sql, seconds)
+
+    def cursor_class(self, base):
+        """Subclass of a DB-API cursor class whose ``execute``/``executemany`` are timed."""
+        cls = self._cursor_classes.get(base)
+        if cls is not None:
+            return cls
+        metrics = self
+
+        class TimedCursor(base):
+            _in_executemany = False
+
+            def execute(self, sql, *args):
+                if self._in_executemany:
+                    # pymysql's executemany runs through execute
+                    return base.execute(self, sql, *args)
+                start = time.perf_counter()
+                try:
+                    return base.execute(self, sql, *args)
+                finally:
+                    metrics.observe_query(sql, time.perf_counter() - start)
+
+            def executemany(self, sql, *args):
+                start = time.perf_counter()
+                self._in_executemany = True
+                try:
+                    return base.executemany(self, sql, *args)
+                finally:
+                    self._in_executemany = False
+                    metrics.observe_query(sql, time.perf_counter() - start)
+
+        TimedCursor.__name__ = 'Timed' + base.__name__
+        cls = self._cursor_classes[base] = TimedCursor
+        return cls
+
+    def sqlite_connection_class(self):
+        """``sqlite3.Connection`` subclass whose cursors, and ``execute`` shortcuts, are timed."""
+        cursor_class = self.cursor_class(sqlite3.Cursor)
+
+        class TimedConnection(sqlite3.Connection):
+            def cursor(self, factory=cursor_class):
+                return sqlite3.Connection.cursor(self, factory)
+
+            def execute(self, sql, parameters=()):
+                return self.cursor().execute(sql, parameters)
+
+            def executemany(self, sql, parameters):
+                return self.cursor().executemany(sql, parameters)
+
+        return TimedConnection
+
+    def add_collector(self, prefix, stats, gauges=(), counters=()):
+        """Export numbers from a ``stats()`` callable at scrape time.
+
+        Each key in ``gauges`` becomes ``<prefix>_<key>``, each key in
+        ``counters`` ``<prefix>_<key>_total``.
+        """
+        self._collectors.append((prefix, stats, gauges, counters))
+
+    def _collect(self):
+        lines = []
+        for prefix, stats, gauges, counters in self._collectors:
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Metrics collector {prefix} failed: {e}")
+                continue
+            for kind, keys in (('gauge', gauges), ('counter', counters)):
+                for key in keys:
+                    name = f'{prefix}_{key}'
+                    if kind == 'counter' and not name.endswith('_total'):
+                        name += '_total'
+                    lines.append(f'# HELP {name} {key} from {prefix} stats.')
+                    lines.append(f'# TYPE {name} {kind}')
+                    lines.append(f'{name} {_format_value(values[key])}')
+        return lines
+
+    def render(self):
+        """All metrics in the Prometheus text format."""
+        lines = ['# HELP process_start_time_seconds Start time of the process since the epoch.',
+                 '# TYPE process_start_time_seconds gauge',
+                 f'process_start_time_seconds {_format_value(self.started_at)}']
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        lines.extend(self._collect())
+        return '\n'.join(lines) + '\n'
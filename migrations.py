@@ -0,0 +1,727 @@
+"""Versioned schema migrations for the SQLite and MySQL backends.
+
+Migrations are ordered, numbered steps recorded in a ``schema_migrations``
+table.  Every step is written to be idempotent (tables are created with
+``IF NOT EXISTS``, columns and indexes are only added when missing) so a
+run that was interrupted half-way can simply be repeated.  On MySQL, indexes
+are added with ``ALGORITHM=INPLACE, LOCK=NONE`` so reads and writes continue
+while they build.
+
+Run migrations once per deploy from the command line::
+
+    python migrations.py --backend sqlite --database todolist.db upgrade
+    python migrations.py --backend mysql status
+
+The MySQL connection settings come from the same ``MYSQL_*`` environment
+variables the API uses.  Concurrent runners are serialized with an exclusive
+SQLite transaction or a MySQL named lock.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+
+VERSION_TABLE = 'schema_migrations'
+MYSQL_LOCK_NAME = 'todolist_schema_migrations'
+
+
+class Migration(object):
+    def __init__(self, version, name, apply):
+        self.version = version
+        self.name = name
+        self.apply = apply
+
+
+class SQLiteSchema(object):
+    """Schema helpers for an ``sqlite3`` connection."""
+    dialect = 'sqlite'
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=()):
+        return self.conn.execute(sql, params)
+
+    def has_table(self, table):
+        return self.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                            (table,)).fetchone() is not None
+
+    def has_column(self, table, column):
+        return any(row[1] == column for row in self.execute(f'PRAGMA table_info({table})'))
+
+    def has_index(self, table, index_name):
+        return self.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                            (index_name,)).fetchone() is not None
+
+    def create_index(self, table, index_name, columns, unique=False):
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        self.execute(f'CREATE {kind} IF NOT EXISTS {index_name} ON {table} ({columns})')
+
+    def drop_index(self, table, index_name):
+        self.execute(f'DROP INDEX IF EXISTS {index_name}')
+
+    def add_column(self, table, column, definition):
+        if not self.has_column(table, column):
+            self.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    def ensure_version_table(self):
+        self.execute(f'''
+        CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        self.conn.commit()
+
+    def applied_versions(self):
+        return {row[0] for row in self.execute(f'SELECT version FROM {VERSION_TABLE}')}
+
+    @contextmanager
+    def migration(self, migration):
+        """Apply ``migration`` atomically; yields False if another runner already did."""
+        # BEGIN IMMEDIATE takes the write lock, so concurrent runners queue here
+        self.execute('BEGIN IMMEDIATE')
+        try:
+            if migration.version in self.applied_versions():
+                self.conn.rollback()
+                yield False
+                return
+            yield True
+            self.execute(f'INSERT INTO {VERSION_TABLE} (version, name) VALUES (?, ?)',
+                         (migration.version, migration.name))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    @contextmanager
+    def lock(self):
+        yield
+
+
+class MySQLSchema(object):
+    """Schema helpers for a ``pymysql`` connection using ``DictCursor``."""
+    dialect = 'mysql'
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=()):
+        cursor = self.conn.cursor()
+        cursor.execute(sql, params)
+        return cursor
+
+    def has_table(self, table):
+        return self.execute(
+            'SELECT 1 FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s',
+            (table,)
+        ).fetchone() is not None
+
+    def has_column(self, table, column):
+        return self.execute(
+            'SELECT 1 FROM information_schema.columns '
+            'WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s',
+            (table, column)
+        ).fetchone() is not None
+
+    def has_index(self, table, index_name):
+        return self.execute(
+            'SELECT 1 FROM information_schema.statistics '
+            'WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1',
+            (table, index_name)
+        ).fetchone() is not None
+
+    def create_index(self, table, index_name, columns, unique=False):
+        if self.has_index(table, index_name):
+            return
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        # Online DDL: the table stays readable and writable while the index builds
+        self.execute(f'ALTER TABLE {table} ADD {kind} {index_name} ({columns}), '
+                     f'ALGORITHM=INPLACE, LOCK=NONE')
+
+    def drop_index(self, table, index_name):
+        if self.has_index(table, index_name):
+            self.execute(f'ALTER TABLE {table} DROP INDEX {index_name}, ALGORITHM=INPLACE, LOCK=NONE')
+
+    def add_column(self, table, column, definition):
+        if not self.has_column(table, column):
+            self.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+    def ensure_version_table(self):
+        self.execute(f'''
+        CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        self.conn.commit()
+
+    def applied_versions(self):
+        return {row['version'] for row in self.execute(f'SELECT version FROM {VERSION_TABLE}').fetchall()}
+
+    @contextmanager
+    def migration(self, migration):
+        """Apply ``migration``; DDL commits implicitly, so steps must be idempotent."""
+        if migration.version in self.applied_versions():
+            yield False
+            return
+        yield True
+        self.execute(f'INSERT INTO {VERSION_TABLE} (version, name) VALUES (%s, %s)',
+                     (migration.version, migration.name))
+        self.conn.commit()
+
+    @contextmanager
+    def lock(self, timeout=300):
+        acquired = self.execute('SELECT GET_LOCK(%s, %s) AS acquired',
+                                (MYSQL_LOCK_NAME, timeout)).fetchone()['acquired']
+        if acquired != 1:
+            raise RuntimeError('Timed out waiting for the schema migration lock')
+        try:
+            yield
+        finally:
+            self.execute('SELECT RELEASE_LOCK(%s)', (MYSQL_LOCK_NAME,))
+
+
+# --- Migrations -------------------------------------------------------------
+
+def _initial_schema(schema):
+    if schema.dialect == 'sqlite':
+        # Very old development databases have an entries table without ids or
+        # owners; keep its rows aside instead of failing on every query.
+        if schema.has_table('entries') and not schema.has_column('entries', 'user_id'):
+            schema.execute('ALTER TABLE entries RENAME TO entries_legacy')
+        schema.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL
+        )
+        ''')
+        schema.execute('''
+        CREATE TABLE IF NOT EXISTS entries (
+            id TEXT PRIMARY KEY,
+            what_to_do TEXT NOT NULL,
+            due_date TEXT,
+            reminder_date TEXT,
+            status TEXT DEFAULT 'pending',
+            user_id TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''')
+    else:
+        schema.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id VARCHAR(36) PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        schema.execute('''
+        CREATE TABLE IF NOT EXISTS entries (
+            id VARCHAR(36) PRIMARY KEY,
+            what_to_do TEXT NOT NULL,
+            due_date DATETIME,
+            reminder_date DATETIME,
+            status VARCHAR(20) DEFAULT 'pending',
+            user_id VARCHAR(36),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        ''')
+        schema.execute('''
+        CREATE TABLE IF NOT EXISTS translation_cache (
+            cache_key CHAR(64) PRIMARY KEY,
+            source_text TEXT NOT NULL,
+            target_language VARCHAR(16) NOT NULL,
+            translated_text TEXT NOT NULL,
+            source_language VARCHAR(16),
+            service VARCHAR(64),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+
+
+def _entries_listing_indexes(schema):
+    # Composite indexes backing keyset pagination of GET /api/items
+    schema.create_index('entries', 'idx_entries_user_status_due', 'user_id, status, due_date, id')
+    schema.create_index('entries', 'idx_entries_user_due', 'user_id, due_date, id')
+    schema.create_index('entries', 'idx_entries_user_id', 'user_id, id')
+
+
+def _entries_reminder_index(schema):
+    schema.create_index('entries', 'idx_entries_reminder', 'reminder_date')
+
+
+def _entries_change_tracking(schema):
+    # Per-user change counter, row versions and tombstones for delta sync
+    if schema.dialect == 'sqlite':
+        schema.add_column('entries', 'version', 'INTEGER NOT NULL DEFAULT 0')
+        schema.add_column('entries', 'updated_at', 'TEXT')
+        schema.execute('''
+        CREATE TABLE IF NOT EXISTS sync_versions (
+            user_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        schema.execute('''
+        CREATE TABLE IF NOT EXISTS entry_tombstones (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            deleted_at TEXT
+        )
+        ''')
+    else:
+        schema.add_column('entries', 'version', 'BIGINT NOT NULL DEFAULT 0')
+        schema.add_column('entries', 'updated_at', 'TIMESTAMP NULL DEFAULT NULL')
+        schema.execute('''
+        CREATE TABLE IF NOT EXISTS sync_versions (
+            user_id VARCHAR(36) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        ''')
+        schema.execute('''
+        CREATE TABLE IF NOT EXISTS entry_tombstones (
+            id VARCHAR(36) PRIMARY KEY,
+            user_id VARCHAR(36) NOT NULL,
+            version BIGINT NOT NULL,
+            deleted_at TIMESTAMP NULL DEFAULT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        ''')
+    schema.create_index('entries', 'idx_entries_user_version', 'user_id, version')
+    schema.create_index('entry_tombstones', 'idx_tombstones_user_version', 'user_id, version')
+    # Existing rows become version 1, so a sync from cursor 0 returns everything
+    schema.execute('UPDATE entries SET version = 1 WHERE version = 0')
+    schema.execute('INSERT INTO sync_versions (user_id, version) '
+                   'SELECT id, 1 FROM users WHERE id NOT IN (SELECT user_id FROM sync_versions)')
+
+
+SQLITE_CHANGE_TRIGGERS = {
+    'entries_sync_insert': '''
+    CREATE TRIGGER IF NOT EXISTS entries_sync_insert AFTER INSERT ON entries
+    BEGIN
+        INSERT OR IGNORE INTO sync_versions (user_id, version) VALUES (NEW.user_id, 0);
+        UPDATE sync_versions SET version = version + 1 WHERE user_id = NEW.user_id;
+        UPDATE entries SET version = (SELECT version FROM sync_versions WHERE user_id = NEW.user_id),
+                           updated_at = CURRENT_TIMESTAMP
+        WHERE id = NEW.id;
+    END
+    ''',
+    'entries_sync_update': '''
+    CREATE TRIGGER IF NOT EXISTS entries_sync_update
+    AFTER UPDATE OF what_to_do, due_date, reminder_date, status ON entries
+    BEGIN
+        INSERT OR IGNORE INTO sync_versions (user_id, version) VALUES (NEW.user_id, 0);
+        UPDATE sync_versions SET version = version + 1 WHERE user_id = NEW.user_id;
+        UPDATE entries SET version = (SELECT version FROM sync_versions WHERE user_id = NEW.user_id),
+                           updated_at = CURRENT_TIMESTAMP
+        WHERE id = NEW.id;
+    END
+    ''',
+    'entries_sync_delete': '''
+    CREATE TRIGGER IF NOT EXISTS entries_sync_delete AFTER DELETE ON entries
+    BEGIN
+        INSERT OR IGNORE INTO sync_versions (user_id, version) VALUES (OLD.user_id, 0);
+        UPDATE sync_versions SET version = version + 1 WHERE user_id = OLD.user_id;
+        INSERT OR REPLACE INTO entry_tombstones (id, user_id, version, deleted_at)
+        SELECT OLD.id, OLD.user_id, version, CURRENT_TIMESTAMP FROM sync_versions WHERE user_id = OLD.user_id;
+    END
+    ''',
+}
+
+MYSQL_CHANGE_TRIGGERS = {
+    'entries_sync_insert': '''
+    CREATE TRIGGER entries_sync_insert BEFORE INSERT ON entries FOR EACH ROW
+    BEGIN
+        INSERT IGNORE INTO sync_versions (user_id, version) VALUES (NEW.user_id, 0);
+        UPDATE sync_versions SET version = version + 1 WHERE user_id = NEW.user_id;
+        SET NEW.version = (SELECT version FROM sync_versions WHERE user_id = NEW.user_id);
+        SET NEW.updated_at = CURRENT_TIMESTAMP;
+    END
+    ''',
+    'entries_sync_update': '''
+    CREATE TRIGGER entries_sync_update BEFORE UPDATE ON entries FOR EACH ROW
+    BEGIN
+        INSERT IGNORE INTO sync_versions (user_id, version) VALUES (NEW.user_id, 0);
+        UPDATE sync_versions SET version = version + 1 WHERE user_id = NEW.user_id;
+        SET NEW.version = (SELECT version FROM sync_versions WHERE user_id = NEW.user_id);
+        SET NEW.updated_at = CURRENT_TIMESTAMP;
+    END
+    ''',
+    'entries_sync_delete': '''
+    CREATE TRIGGER entries_sync_delete AFTER DELETE ON entries FOR EACH ROW
+    BEGIN
+        INSERT IGNORE INTO sync_versions (user_id, version) VALUES (OLD.user_id, 0);
+        UPDATE sync_versions SET version = version + 1 WHERE user_id = OLD.user_id;
+        REPLACE INTO entry_tombstones (id, user_id, version, deleted_at)
+        SELECT OLD.id, OLD.user_id, version, CURRENT_TIMESTAMP FROM sync_versions WHERE user_id = OLD.user_id;
+    END
+    ''',
+}
+
+
+def _entries_change_triggers(schema):
+    # Writes become one statement each: the triggers bump the user's change
+    # counter and stamp rows or tombstones inside the writing statement
+    if schema.dialect == 'sqlite':
+        for sql in SQLITE_CHANGE_TRIGGERS.values():
+            schema.execute(sql)
+    else:
+        for name, sql in MYSQL_CHANGE_TRIGGERS.items():
+            schema.execute(f'DROP TRIGGER IF EXISTS {name}')
+            schema.execute(sql)
+
+
+# Same as entries_sync_update above, but only counts changes to the synced
+# columns, so marking a reminder as sent does not resend the item
+MYSQL_SYNC_UPDATE_TRIGGER = '''
+    CREATE TRIGGER entries_sync_update BEFORE UPDATE ON entries FOR EACH ROW
+    BEGIN
+        IF NOT (NEW.what_to_do <=> OLD.what_to_do AND NEW.due_date <=> OLD.due_date
+                AND NEW.reminder_date <=> OLD.reminder_date AND NEW.status <=> OLD.status) THEN
+            INSERT IGNORE INTO sync_versions (user_id, version) VALUES (NEW.user_id, 0);
+            UPDATE sync_versions SET version = version + 1 WHERE user_id = NEW.user_id;
+            SET NEW.version = (SELECT version FROM sync_versions WHERE user_id = NEW.user_id);
+            SET NEW.updated_at = CURRENT_TIMESTAMP;
+        END IF;
+    END
+    '''
+
+
+def _entries_reminder_delivery(schema):
+    # Delivery state for the reminder scheduler, and an index it can page
+    # through by (reminder_date, id)
+    if schema.dialect == 'sqlite':
+        schema.add_column('entries', 'reminder_sent_at', 'TEXT')
+        # Dates entered as 'YYYY-MM-DDTHH:MM' sort wrongly against
+        # 'YYYY-MM-DD HH:MM:SS' as text; store them all in the latter form
+        for column in ('due_date', 'reminder_date'):
+            schema.execute(f"UPDATE entries SET {column} = strftime('%Y-%m-%d %H:%M:%S', {column}) "
+                           f"WHERE strftime('%Y-%m-%d %H:%M:%S', {column}) IS NOT NULL "
+                           f"AND {column} <> strftime('%Y-%m-%d %H:%M:%S', {column})")
+    else:
+        schema.add_column('entries', 'reminder_sent_at', 'DATETIME NULL DEFAULT NULL')
+        schema.execute('DROP TRIGGER IF EXISTS entries_sync_update')
+        schema.execute(MYSQL_SYNC_UPDATE_TRIGGER)
+    schema.create_index('entries', 'idx_entries_reminder_id', 'reminder_date, id')
+    schema.drop_index('entries', 'idx_entries_reminder')
+
+
+SQLITE_SEARCH_TRIGGERS = {
+    'entries_fts_insert': '''
+    CREATE TRIGGER IF NOT EXISTS entries_fts_insert AFTER INSERT ON entries
+    BEGIN
+        INSERT INTO entries_fts (rowid, what_to_do, owner)
+        VALUES (NEW.rowid, NEW.what_to_do, replace(NEW.user_id, '-', ''));
+    END
+    ''',
+    'entries_fts_update': '''
+    CREATE TRIGGER IF NOT EXISTS entries_fts_update AFTER UPDATE OF what_to_do, user_id ON entries
+    BEGIN
+        DELETE FROM entries_fts WHERE rowid = OLD.rowid;
+        INSERT INTO entries_fts (rowid, what_to_do, owner)
+        VALUES (NEW.rowid, NEW.what_to_do, replace(NEW.user_id, '-', ''));
+    END
+    ''',
+    'entries_fts_delete': '''
+    CREATE TRIGGER IF NOT EXISTS entries_fts_delete AFTER DELETE ON entries
+    BEGIN
+        DELETE FROM entries_fts WHERE rowid = OLD.rowid;
+    END
+    ''',
+}
+
+
+def _entries_full_text_search(schema):
+    # Indexes for GET /api/items/search; see search.py
+    if schema.dialect == 'sqlite':
+        # The owner is indexed as one token (the id without dashes) so a search
+        # can be restricted to one user inside the index
+        schema.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+            what_to_do, owner,
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+        """)
+        for sql in SQLITE_SEARCH_TRIGGERS.values():
+            schema.execute(sql)
+        # Rows are keyed by the entries rowid; fill from scratch so a repeated run
+        # does not index anything twice
+        schema.execute('DELETE FROM entries_fts')
+        schema.execute("INSERT INTO entries_fts (rowid, what_to_do, owner) "
+                       "SELECT rowid, what_to_do, replace(user_id, '-', '') FROM entries")
+    elif not schema.has_index('entries', 'idx_entries_fulltext'):
+        # FULLTEXT indexes cannot be built with LOCK=NONE: reads continue, writes
+        # wait for the build (the first one also rebuilds the table)
+        schema.execute('ALTER TABLE entries ADD FULLTEXT INDEX idx_entries_fulltext (what_to_do), '
+                       'ALGORITHM=INPLACE, LOCK=SHARED')
+
+
+# Replace the rowid-keyed search triggers of migration 007.  Rows carry the
+# entries id, since VACUUM may renumber the rowids of a table with a TEXT
+# primary key.  id is UNINDEXED, so a row is found through its owner's token
+# and then by id.  Tasks without an owner are never searched and not indexed.
+SQLITE_SEARCH_ID_TRIGGERS = {
+    'entries_fts_insert': '''
+    CREATE TRIGGER IF NOT EXISTS entries_fts_insert AFTER INSERT ON entries
+    WHEN NEW.user_id IS NOT NULL
+    BEGIN
+        INSERT INTO entries_fts (what_to_do, owner, id)
+        VALUES (NEW.what_to_do, replace(NEW.user_id, '-', ''), NEW.id);
+    END
+    ''',
+    'entries_fts_update': '''
+    CREATE TRIGGER IF NOT EXISTS entries_fts_update AFTER UPDATE OF what_to_do, user_id, id ON entries
+    BEGIN
+        DELETE FROM entries_fts
+        WHERE entries_fts MATCH 'owner : "' || IFNULL(replace(OLD.user_id, '-', ''), '') || '"'
+        AND id = OLD.id;
+        INSERT INTO entries_fts (what_to_do, owner, id)
+        SELECT NEW.what_to_do, replace(NEW.user_id, '-', ''), NEW.id WHERE NEW.user_id IS NOT NULL;
+    END
+    ''',
+    'entries_fts_delete': '''
+    CREATE TRIGGER IF NOT EXISTS entries_fts_delete AFTER DELETE ON entries
+    WHEN OLD.user_id IS NOT NULL
+    BEGIN
+        DELETE FROM entries_fts
+        WHERE entries_fts MATCH 'owner : "' || replace(OLD.user_id, '-', '') || '"'
+        AND id = OLD.id;
+    END
+    ''',
+}
+
+
+def _entries_search_by_id(schema):
+    # Rebuilds entries_fts with an id column; see SQLITE_SEARCH_ID_TRIGGERS.
+    # The MySQL FULLTEXT index is part of entries already.
+    if schema.dialect != 'sqlite':
+        return
+    for name in SQLITE_SEARCH_TRIGGERS:
+        schema.execute(f'DROP TRIGGER IF EXISTS {name}')
+    schema.execute('DROP TABLE IF EXISTS entries_fts')
+    schema.execute("""
+    CREATE VIRTUAL TABLE entries_fts USING fts5(
+        what_to_do, owner, id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """)
+    for sql in SQLITE_SEARCH_ID_TRIGGERS.values():
+        schema.execute(sql)
+    schema.execute("INSERT INTO entries_fts (what_to_do, owner, id) "
+                   "SELECT what_to_do, replace(user_id, '-', ''), id FROM entries WHERE user_id IS NOT NULL")
+
+
+# Per-user task counts by status for GET /api/items/stats, kept by the
+# writing statement itself like the sync counters.  A NULL status counts as ''.
+SQLITE_COUNT_TRIGGERS = {
+    'entries_counts_insert': '''
+    CREATE TRIGGER IF NOT EXISTS entries_counts_insert AFTER INSERT ON entries
+    BEGIN
+        INSERT INTO task_counts (user_id, status, tasks) VALUES (NEW.user_id, IFNULL(NEW.status, ''), 1)
+        ON CONFLICT (user_id, status) DO UPDATE SET tasks = tasks + 1;
+    END
+    ''',
+    'entries_counts_update': '''
+    CREATE TRIGGER IF NOT EXISTS entries_counts_update AFTER UPDATE OF status, user_id ON entries
+    WHEN OLD.status IS NOT NEW.status OR OLD.user_id IS NOT NEW.user_id
+    BEGIN
+        UPDATE task_counts SET tasks = tasks - 1 WHERE user_id = OLD.user_id AND status = IFNULL(OLD.status, '');
+        INSERT INTO task_counts (user_id, status, tasks) VALUES (NEW.user_id, IFNULL(NEW.status, ''), 1)
+        ON CONFLICT (user_id, status) DO UPDATE SET tasks = tasks + 1;
+    END
+    ''',
+    'entries_counts_delete': '''
+    CREATE TRIGGER IF NOT EXISTS entries_counts_delete AFTER DELETE ON entries
+    BEGIN
+        UPDATE task_counts SET tasks = tasks - 1 WHERE user_id = OLD.user_id AND status = IFNULL(OLD.status, '');
+    END
+    ''',
+}
+
+MYSQL_COUNT_TRIGGERS = {
+    'entries_counts_insert': '''
+    CREATE TRIGGER entries_counts_insert AFTER INSERT ON entries FOR EACH ROW
+    BEGIN
+        INSERT INTO task_counts (user_id, status, tasks) VALUES (NEW.user_id, IFNULL(NEW.status, ''), 1)
+        ON DUPLICATE KEY UPDATE tasks = tasks + 1;
+    END
+    ''',
+    'entries_counts_update': '''
+    CREATE TRIGGER entries_counts_update AFTER UPDATE ON entries FOR EACH ROW
+    BEGIN
+        IF NOT (NEW.status <=> OLD.status AND NEW.user_id <=> OLD.user_id) THEN
+            UPDATE task_counts SET tasks = tasks - 1
+            WHERE user_id = OLD.user_id AND status = IFNULL(OLD.status, '');
+            INSERT INTO task_counts (user_id, status, tasks) VALUES (NEW.user_id, IFNULL(NEW.status, ''), 1)
+            ON DUPLICATE KEY UPDATE tasks = tasks + 1;
+        END IF;
+    END
+    ''',
+    'entries_counts_delete': '''
+    CREATE TRIGGER entries_counts_delete AFTER DELETE ON entries FOR EACH ROW
+    BEGIN
+        UPDATE task_counts SET tasks = tasks - 1 WHERE user_id = OLD.user_id AND status = IFNULL(OLD.status, '');
+    END
+    ''',
+}
+
+
+def _entries_task_counts(schema):
+    if schema.dialect == 'sqlite':
+        schema.execute('''
+        CREATE TABLE IF NOT EXISTS task_counts (
+            user_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            tasks INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, status)
+        )
+        ''')
+        for sql in SQLITE_COUNT_TRIGGERS.values():
+            schema.execute(sql)
+    else:
+        # Entries removed by ON DELETE CASCADE fire no triggers; their counts
+        # go with the user through the same cascade
+        schema.execute('''
+        CREATE TABLE IF NOT EXISTS task_counts (
+            user_id VARCHAR(36) NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            tasks INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, status),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        ''')
+        for name, sql in MYSQL_COUNT_TRIGGERS.items():
+            schema.execute(f'DROP TRIGGER IF EXISTS {name}')
+            schema.execute(sql)
+    # Recount after the triggers exist, so writes from here on are counted once
+    schema.execute('DELETE FROM task_counts')
+    schema.execute("INSERT INTO task_counts (user_id, status, tasks) "
+                   "SELECT user_id, IFNULL(status, ''), COUNT(*) FROM entries "
+                   "WHERE user_id IS NOT NULL GROUP BY user_id, IFNULL(status, '')")
+
+
+def _rate_limits(schema):
+    # Token buckets shared by every replica when RATE_LIMIT_STORE=database;
+    # see rate_limiter.py
+    if schema.dialect == 'sqlite':
+        schema.execute('''
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            bucket TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        ''')
+    else:
+        schema.execute('''
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            bucket VARCHAR(191) NOT NULL PRIMARY KEY,
+            tokens DOUBLE NOT NULL,
+            updated_at DOUBLE NOT NULL
+        )
+        ''')
+    schema.create_index('rate_limits', 'idx_rate_limits_updated', 'updated_at')
+
+
+MIGRATIONS = [
+    Migration(1, 'initial_schema', _initial_schema),
+    Migration(2, 'entries_listing_indexes', _entries_listing_indexes),
+    Migration(3, 'entries_reminder_index', _entries_reminder_index),
+    Migration(4, 'entries_change_tracking', _entries_change_tracking),
+    Migration(5, 'entries_change_triggers', _entries_change_triggers),
+    Migration(6, 'entries_reminder_delivery', _entries_reminder_delivery),
+    Migration(7, 'entries_full_text_search', _entries_full_text_search),
+    Migration(8, 'entries_task_counts', _entries_task_counts),
+    Migration(9, 'rate_limits', _rate_limits),
+    Migration(10, 'entries_search_by_id', _entries_search_by_id),
+]
+
+
+# --- Runner -----------------------------------------------------------------
+
+def schema_for(conn, dialect):
+    if dialect == 'sqlite':
+        return SQLiteSchema(conn)
+    if dialect == 'mysql':
+        return MySQLSchema(conn)
+    raise ValueError(f'Unknown database dialect: {dialect}')
+
+
+def pending_migrations(conn, dialect):
+    """Return the migrations not yet applied to ``conn``."""
+    schema = schema_for(conn, dialect)
+    if not schema.has_table(VERSION_TABLE):
+        return list(MIGRATIONS)
+    applied = schema.applied_versions()
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def migrate(conn, dialect, target=None, log=print):
+    """Apply pending migrations up to ``target`` (default: latest); returns the versions applied."""
+    schema = schema_for(conn, dialect)
+    applied_now = []
+    with schema.lock():
+        schema.ensure_version_table()
+        for migration in MIGRATIONS:
+            if target is not None and migration.version > target:
+                break
+            start = time.monotonic()
+            with schema.migration(migration) as needed:
+                if needed:
+                    log(f"Applying migration {migration.version:03d} {migration.name}")
+                    migration.apply(schema)
+            if needed:
+                applied_now.append(migration.version)
+                log(f"Applied migration {migration.version:03d} in {time.monotonic() - start:.2f}s")
+    return applied_now
+
+
+def connect(backend, database=None):
+    """Open a connection for the CLI using the same settings as the API."""
+    if backend == 'sqlite':
+        return sqlite3.connect(database or os.environ.get('DATABASE', 'todolist.db'))
+    import pymysql
+    return pymysql.connect(
+        host=os.environ.get('MYSQL_HOST', 'mysql'),
+        user=os.environ.get('MYSQL_USER', 'todouser'),
+        password=os.environ.get('MYSQL_PASSWORD', 'todopassword'),
+        database=os.environ.get('MYSQL_DB', 'tododb'),
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply database schema migrations.')
+    parser.add_argument('command', nargs='?', default='upgrade', choices=('upgrade', 'status'))
+    parser.add_argument('--backend', default=os.environ.get('DB_BACKEND', 'sqlite'),
+                        choices=('sqlite', 'mysql'))
+    parser.add_argument('--database', help='SQLite database file (default: $DATABASE or todolist.db)')
+    parser.add_argument('--target', type=int, help='Stop after this migration version')
+    args = parser.parse_args(argv)
+
+    conn = connect(args.backend, args.database)
+    try:
+        if args.command == 'status':
+            pending = pending_migrations(conn, args.backend)
+            for migration in MIGRATIONS:
+                state = 'pending' if migration in pending else 'applied'
+                print(f"{migration.version:03d} {migration.name}: {state}")
+            return 1 if pending else 0
+        applied = migrate(conn, args.backend, target=args.target)
+        print(f"Schema up to date ({len(applied)} migrations applied)")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
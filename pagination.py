@@ -0,0 +1,161 @@
+"""Keyset pagination for the ``entries`` listing.
+
+Pages are ordered by ``(due_date, id)`` or by ``id`` alone, ascending or
+descending, and always put entries without a due date last.  A page is
+fetched with a range condition on the sort key rather than an ``OFFSET``, so
+with the composite indexes on ``(user_id, status, due_date, id)`` and
+``(user_id, due_date, id)`` every page is a single index range scan no matter
+how deep the client has paged.
+
+The cursor handed to clients is opaque: URL-safe base64 of
+``[phase, due_date, id]`` for the last row of the page, where ``phase`` is
+``'v'`` while walking rows that have a due date and ``'n'`` once the walk has
+moved on to the rows without one.  Search results (``search.py``) use the
+same cursor with phase ``'r'`` and the row's relevance score.
+"""
+import base64
+import datetime
+import json
+
+SORT_KEYS = ('due_date', 'id')
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+ENTRY_COLUMNS = 'id, what_to_do, due_date, reminder_date, status'
+
+
+class InvalidPageRequest(ValueError):
+    """Raised for malformed pagination or filter parameters."""
+
+
+def _date_key(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def encode_cursor(phase, due_date, item_id):
+    raw = json.dumps([phase, _date_key(due_date), item_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, phases=('v', 'n')):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        phase, due_date, item_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise InvalidPageRequest('Invalid cursor')
+    if phase not in phases or not isinstance(item_id, str):
+        raise InvalidPageRequest('Invalid cursor')
+    return phase, due_date, item_id
+
+
+class PageRequest(object):
+    """Validated listing parameters taken from the query string."""
+
+    def __init__(self, args):
+        self.paginated = 'limit' in args or 'cursor' in args
+        try:
+            self.limit = int(args.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise InvalidPageRequest('limit must be an integer')
+        if not 1 <= self.limit <= MAX_LIMIT:
+            raise InvalidPageRequest(f'limit must be between 1 and {MAX_LIMIT}')
+
+        self.sort = args.get('sort', 'due_date')
+        if self.sort not in SORT_KEYS:
+            raise InvalidPageRequest(f"sort must be one of {', '.join(SORT_KEYS)}")
+        self.order = args.get('order', 'asc')
+        if self.order not in ('asc', 'desc'):
+            raise InvalidPageRequest('order must be asc or desc')
+
+        self.status = args.get('status') or None
+        self.due_after = args.get('due_after') or None
+        self.due_before = args.get('due_before') or None
+        self.cursor = decode_cursor(args['cursor']) if args.get('cursor') else None
+
+
+def _filters(page, user_id, p):
+    clauses = [f'user_id = {p}']
+    params = [user_id]
+    if page.status is not None:
+        clauses.append(f'status = {p}')
+        params.append(page.status)
+    if page.due_after is not None:
+        clauses.append(f'due_date >= {p}')
+        params.append(page.due_after)
+    if page.due_before is not None:
+        clauses.append(f'due_date < {p}')
+        params.append(page.due_before)
+    return clauses, params
+
+
+def page_queries(page, user_id, placeholder):
+    """Return ``[(phase, sql, params)]`` to run in order until enough rows are read.
+
+    ``placeholder`` is the driver's parameter marker (``?`` or ``%s``).  For
+    paginated requests each statement ends in a ``LIMIT`` placeholder whose
+    value the caller appends to ``params``.
+    """
+    p = placeholder
+    limit = f' LIMIT {p}' if page.paginated else ''
+    cmp = '>' if page.order == 'asc' else '<'
+    direction = page.order.upper()
+    base, base_params = _filters(page, user_id, p)
+
+    if page.sort == 'id':
+        clauses, params = list(base), list(base_params)
+        if page.cursor is not None:
+            clauses.append(f'id {cmp} {p}')
+            params.append(page.cursor[2])
+        sql = (f"SELECT {ENTRY_COLUMNS} FROM entries WHERE {' AND '.join(clauses)} "
+               f"ORDER BY id {direction}{limit}")
+        return [('n', sql, params)]
+
+    queries = []
+    phase = page.cursor[0] if page.cursor is not None else 'v'
+    if phase == 'v':
+        clauses, params = list(base), list(base_params)
+        clauses.append('due_date IS NOT NULL')
+        if page.cursor is not None:
+            _, due_date, item_id = page.cursor
+            clauses.append(f'(due_date {cmp} {p} OR (due_date = {p} AND id {cmp} {p}))')
+            params.extend([due_date, due_date, item_id])
+        sql = (f"SELECT {ENTRY_COLUMNS} FROM entries WHERE {' AND '.join(clauses)} "
+               f"ORDER BY due_date {direction}, id {direction}{limit}")
+        queries.append(('v', sql, params))
+
+    # A due-date window never matches rows without a due date
+    if page.due_after is None and page.due_before is None:
+        clauses, params = list(base), list(base_params)
+        clauses.append('due_date IS NULL')
+        if page.cursor is not None and phase == 'n':
+            clauses.append(f'id {cmp} {p}')
+            params.append(page.cursor[2])
+        sql = (f"SELECT {ENTRY_COLUMNS} FROM entries WHERE {' AND '.join(clauses)} "
+               f"ORDER BY id {direction}{limit}")
+        queries.append(('n', sql, params))
+    return queries
+
+
+def fetch_page(page, user_id, placeholder, run):
+    """Run the page queries with ``run(sql, params)`` and return ``(rows, next_cursor)``.
+
+    ``run`` must return a list of rows that support ``row['column']``.
+    Without ``limit``/``cursor`` in the request every matching row is returned.
+    """
+    wanted = page.limit + 1 if page.paginated else None
+    rows = []
+    for phase, sql, params in page_queries(page, user_id, placeholder):
+        if wanted is not None:
+            params = params + [wanted - len(rows)]
+        rows.extend((phase, row) for row in run(sql, params))
+        if wanted is not None and len(rows) >= wanted:
+            break
+
+    next_cursor = None
+    if wanted is not None and len(rows) > page.limit:
+        rows = rows[:page.limit]
+        phase, row = rows[-1]
+        next_cursor = encode_cursor(phase, row['due_date'], row['id'])
+    return [row for _, row in rows], next_cursor
@@ -0,0 +1,147 @@
+"""Password hashing on a bounded process pool.
+
+``generate_password_hash`` and ``check_password_hash`` are deliberately slow
+and CPU-bound.  Run inline, a burst of logins keeps every request thread busy
+hashing (holding the GIL most of the time) and cheap reads queue behind them.
+``PasswordHasher`` runs them in a small pool of worker processes instead, so
+hashing uses separate cores and request threads only wait on a future.
+
+Admission control keeps the pool's queue short: once ``max_pending`` hashes
+are queued or running, further requests are rejected immediately with
+``HasherBusy`` rather than waiting behind work that cannot finish in time, and
+a request that waits longer than ``timeout`` is rejected the same way.
+
+The cost is configured with a Werkzeug method string such as
+``pbkdf2:sha256:600000`` or ``scrypt:32768:8:1``.  Hashes stored with other
+parameters keep working; ``verify_and_update`` hands the login route a new
+hash to store while it has the plain password at hand.
+
+The pool is created on first use in each process, so worker processes forked
+after import start their own.  By then the process runs request and
+background threads, so hashing workers are started from a fresh forkserver
+(or spawned where there is none) rather than forked from it: a child forked
+while another thread holds a lock, such as the logging or OpenSSL locks,
+can deadlock.  The forkserver and its workers import the main module, as
+multiprocessing does, so a main module that uses the hasher must do its
+setup behind a ``__main__`` guard; the backends keep theirs in
+``create_app()``.  With ``workers=0`` hashing runs inline.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool is saturated or a hash did not finish in time."""
+
+
+def normalize_method(method):
+    """Spell out Werkzeug's defaults so ``method`` matches the prefix of the hashes it makes."""
+    parts = method.split(':')
+    if parts[0] == 'pbkdf2':
+        defaults = ['pbkdf2', 'sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    elif parts[0] == 'scrypt':
+        defaults = ['scrypt', '32768', '8', '1']
+    else:
+        return method
+    return ':'.join(parts + defaults[len(parts):])
+
+
+def _worker_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class PasswordHasher(object):
+    """Bounded process pool for ``generate_password_hash`` / ``check_password_hash``."""
+
+    def __init__(self, method='pbkdf2:sha256:600000', workers=None, max_pending=None, timeout=10.0):
+        self.method = normalize_method(method)
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending if max_pending is not None else max(self.workers, 1) * 4
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._pending = 0
+        self._stats = {'hashes': 0, 'verifications': 0, 'rehashes': 0, 'rejected': 0, 'timeouts': 0}
+
+    def _executor(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            # Never submit to a pool inherited from the parent process
+            self._pool = None
+            self._pid = pid
+            self._pending = 0
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_worker_context())
+        return self._pool
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _run(self, func, *args):
+        if self.workers == 0:
+            return func(*args)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise HasherBusy('Too many password checks in progress')
+            future = self._executor().submit(func, *args)
+            self._pending += 1
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise HasherBusy('Timed out waiting for a password check')
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); start a fresh pool on the next call
+            with self._lock:
+                self._pool = None
+            raise HasherBusy('Password hashing pool restarted')
+
+    def hash(self, password):
+        with self._lock:
+            self._stats['hashes'] += 1
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        with self._lock:
+            self._stats['verifications'] += 1
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True when ``pwhash`` was made with other parameters than ``method``."""
+        return pwhash.split('$', 1)[0] != self.method
+
+    def verify_and_update(self, pwhash, password):
+        """Return ``(valid, new_hash)``; ``new_hash`` is set when the stored hash should be replaced."""
+        if not self.verify(pwhash, password):
+            return False, None
+        if not self.needs_rehash(pwhash):
+            return True, None
+        try:
+            new_hash = self.hash(password)
+        except HasherBusy:
+            # The login itself succeeded; upgrade the hash on a later login
+            return True, None
+        with self._lock:
+            self._stats['rehashes'] += 1
+        return True, new_hash
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = self._pending
+        stats['workers'] = self.workers
+        stats['max_pending'] = self.max_pending
+        stats['method'] = self.method
+        return stats
@@ -0,0 +1,221 @@
+"""Rolling per-provider statistics and circuit breakers for translation.
+
+For every (provider, target language) pair the scoreboard keeps a window of
+recent attempts: latency, whether the call succeeded, and whether the
+provider just echoed the input text back.  From these it derives an expected
+cost per useful answer, ``latency / success rate`` plus a penalty for likely
+failures, which ``rank`` uses to order the provider chain for each language.
+Providers without enough samples are ranked with a neutral prior so they
+still get tried.
+
+Each provider also has a circuit breaker.  After ``failure_threshold``
+consecutive errors or timeouts the breaker opens and the provider is skipped
+for ``cooldown`` seconds.  It is then half-open: one trial attempt is let
+through, which closes the breaker on success or re-opens it with a doubled
+cooldown (capped at ``max_cooldown``) on failure.
+"""
+import threading
+import time
+from collections import deque
+
+SUCCESS = 'success'
+UNCHANGED = 'unchanged'
+ERROR = 'error'
+TIMEOUT = 'timeout'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class _LanguageStats(object):
+    __slots__ = ('window', 'attempts', 'successes', 'unchanged', 'failures', 'latency_ewma')
+
+    def __init__(self, window_size):
+        self.window = deque(maxlen=window_size)  # (outcome, latency)
+        self.attempts = 0
+        self.successes = 0
+        self.unchanged = 0
+        self.failures = 0
+        self.latency_ewma = None
+
+    def record(self, outcome, latency, alpha):
+        self.window.append((outcome, latency))
+        self.attempts += 1
+        if outcome == SUCCESS:
+            self.successes += 1
+        elif outcome == UNCHANGED:
+            self.unchanged += 1
+        else:
+            self.failures += 1
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += alpha * (latency - self.latency_ewma)
+
+    def rates(self):
+        n = len(self.window)
+        successes = sum(1 for outcome, _ in self.window if outcome == SUCCESS)
+        unchanged = sum(1 for outcome, _ in self.window if outcome == UNCHANGED)
+        latencies = sorted(latency for _, latency in self.window)
+        return {
+            'samples': n,
+            # Laplace smoothing keeps one bad sample from ruling a provider out
+            'success_rate': (successes + 1.0) / (n + 2.0),
+            'unchanged_rate': unchanged / n if n else 0.0,
+            'latency_ewma': self.latency_ewma,
+            'latency_p50': latencies[n // 2] if n else None,
+            'latency_p95': latencies[min(n - 1, int(n * 0.95))] if n else None,
+        }
+
+
+class _Breaker(object):
+    __slots__ = ('state', 'consecutive_failures', 'opened_at', 'cooldown', 'trial_in_flight', 'trips')
+
+    def __init__(self, cooldown):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.cooldown = cooldown
+        self.trial_in_flight = False
+        self.trips = 0
+
+
+class ProviderScoreboard(object):
+    """Thread-safe rolling stats, ranking and circuit breakers."""
+
+    def __init__(self, window_size=50, min_samples=5, prior_latency=1.0,
+                 failure_threshold=5, cooldown=30.0, max_cooldown=600.0, ewma_alpha=0.2,
+                 listener=None):
+        self.window_size = window_size
+        self.min_samples = min_samples
+        self.prior_latency = prior_latency
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.ewma_alpha = ewma_alpha
+        # Called as listener(name, language, outcome, latency) for every recorded attempt
+        self.listener = listener
+        self._lock = threading.Lock()
+        self._stats = {}  # (provider, language) -> _LanguageStats
+        self._breakers = {}  # provider -> _Breaker
+
+    def _breaker(self, name):
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = _Breaker(self.base_cooldown)
+        return breaker
+
+    def _refresh(self, breaker, now):
+        if breaker.state == OPEN and now - breaker.opened_at >= breaker.cooldown:
+            breaker.state = HALF_OPEN
+            breaker.trial_in_flight = False
+
+    def allow(self, name):
+        """Return True if ``name`` may be called now; claims the half-open trial slot."""
+        with self._lock:
+            breaker = self._breaker(name)
+            self._refresh(breaker, time.monotonic())
+            if breaker.state == CLOSED:
+                return True
+            if breaker.state == HALF_OPEN and not breaker.trial_in_flight:
+                breaker.trial_in_flight = True
+                return True
+            return False
+
+    def record(self, name, language, outcome, latency):
+        """Record one finished attempt and update the provider's breaker."""
+        with self._lock:
+            key = (name, language)
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _LanguageStats(self.window_size)
+            stats.record(outcome, latency, self.ewma_alpha)
+
+            breaker = self._breaker(name)
+            now = time.monotonic()
+            self._refresh(breaker, now)
+            if outcome in (ERROR, TIMEOUT):
+                breaker.consecutive_failures += 1
+                if breaker.state == HALF_OPEN:
+                    breaker.cooldown = min(breaker.cooldown * 2, self.max_cooldown)
+                    self._trip(breaker, now)
+                elif breaker.state == CLOSED and breaker.consecutive_failures >= self.failure_threshold:
+                    breaker.cooldown = self.base_cooldown
+                    self._trip(breaker, now)
+            else:
+                # Any answer, even an unchanged one, proves the provider is up
+                breaker.consecutive_failures = 0
+                breaker.state = CLOSED
+                breaker.trial_in_flight = False
+                breaker.cooldown = self.base_cooldown
+        if self.listener is not None:
+            self.listener(name, language, outcome, latency)
+
+    def _trip(self, breaker, now):
+        breaker.state = OPEN
+        breaker.opened_at = now
+        breaker.trial_in_flight = False
+        breaker.trips += 1
+
+    def _score(self, name, language):
+        stats = self._stats.get((name, language))
+        if stats is None or len(stats.window) < self.min_samples:
+            return self.prior_latency
+        rates = stats.rates()
+        # Expected seconds per useful answer, plus a penalty for the hedge
+        # delay a wasted attempt costs the caller
+        return (rates['latency_ewma'] / rates['success_rate']
+                + (1 - rates['success_rate']) * self.prior_latency)
+
+    def rank(self, providers, language):
+        """Order ``providers`` by expected cost per useful answer for ``language``.
+
+        Providers whose breaker is open are moved to the end, soonest-to-close
+        first, so they are only reached when nothing else is left.
+        """
+        now = time.monotonic()
+        with self._lock:
+            usable = []
+            blocked = []
+            for index, provider in enumerate(providers):
+                breaker = self._breaker(provider.name)
+                self._refresh(breaker, now)
+                if breaker.state == OPEN:
+                    blocked.append((breaker.opened_at + breaker.cooldown, index, provider))
+                else:
+                    usable.append((self._score(provider.name, language), index, provider))
+        usable.sort(key=lambda item: (item[0], item[1]))
+        blocked.sort(key=lambda item: (item[0], item[1]))
+        return [p for _, _, p in usable] + [p for _, _, p in blocked]
+
+    def snapshot(self):
+        """Return breakers and per-language stats for the admin endpoint."""
+        now = time.monotonic()
+        with self._lock:
+            providers = {}
+            for name, breaker in self._breakers.items():
+                self._refresh(breaker, now)
+                providers[name] = {
+                    'breaker': {
+                        'state': breaker.state,
+                        'consecutive_failures': breaker.consecutive_failures,
+                        'cooldown': breaker.cooldown,
+                        'retry_in': max(0.0, breaker.opened_at + breaker.cooldown - now)
+                        if breaker.state == OPEN else 0.0,
+                        'trips': breaker.trips,
+                    },
+                    'languages': {},
+                }
+            for (name, language), stats in self._stats.items():
+                entry = providers.setdefault(name, {'breaker': None, 'languages': {}})
+                rates = stats.rates()
+                rates.update({
+                    'attempts': stats.attempts,
+                    'successes': stats.successes,
+                    'unchanged': stats.unchanged,
+                    'failures': stats.failures,
+                    'score': self._score(name, language),
+                })
+                entry['languages'][language] = rates
+        return providers
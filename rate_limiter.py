@@ -0,0 +1,393 @@
+"""Per-user and per-IP rate limits, and load shedding, in front of the API routes.
+
+Each ``/api`` request falls in a route class with its own token-bucket budget
+(``rate`` tokens per second, up to ``burst``):
+
+* ``auth``: login and registration, limited per client IP only;
+* ``translation``: ``/api/translate`` and ``/api/translate/batch``;
+* ``read``: other ``GET`` requests;
+* ``write``: other methods.
+
+The other classes are limited per user, once ``token_required`` knows who is
+calling, and per client IP at ``ip_multiplier`` times the user budget.  An
+exhausted bucket gets ``429`` with ``Retry-After``.  Health checks, metrics,
+admin routes and CORS preflights are never limited.
+
+Before the buckets, a request is shed with ``503`` and ``Retry-After: 1``
+when the process is overloaded:
+
+* ``max_in_flight`` requests are already being handled in this process;
+* the request waited more than ``max_queue_time`` seconds in front of the
+  app, according to the proxy's ``X-Request-Start`` header;
+* a watched resource (``watch()``: the MySQL pool, the SQLite writer) has
+  ``shed_waiting`` threads queued or a recent average wait of ``shed_wait``
+  seconds.
+
+Buckets live in a store: ``MemoryBucketStore`` per process, or a database
+store shared by every replica (``MySQLBucketStore``, ``SQLiteBucketStore``).
+A database store withdraws up to ``lease`` tokens per round trip and spends
+them locally for up to a second, returning what is left at the next round
+trip, and remembers refusals until the bucket refills.  Tokens leave the
+shared bucket before they are spent, so replicas together never exceed a
+budget.  If the store fails, requests are let through and the error is
+counted.
+"""
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from flask import g, jsonify, request
+
+ROUTE_CLASSES = ('auth', 'read', 'write', 'translation')
+DEFAULT_LIMITS = {'auth': (1.0, 20), 'read': (20.0, 100), 'write': (10.0, 50), 'translation': (2.0, 20)}
+AUTH_PATHS = ('/api/login', '/api/register')
+EXEMPT_PREFIXES = ('/api/admin/',)
+
+
+class RateLimited(Exception):
+    """Raised when a bucket is empty; ``retry_after`` is in seconds."""
+
+    def __init__(self, route_class, retry_after):
+        Exception.__init__(self, f'Rate limit exceeded for {route_class} requests')
+        self.route_class = route_class
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed before any work is done."""
+
+    def __init__(self, reason):
+        Exception.__init__(self, f'Server overloaded ({reason})')
+        self.reason = reason
+
+
+def parse_limit(value):
+    """``'20/100'`` -> ``(20.0, 100.0)``: tokens per second and burst."""
+    rate, _, burst = value.partition('/')
+    rate = float(rate)
+    burst = float(burst) if burst else max(1.0, rate)
+    if rate <= 0 or burst < 1:
+        raise ValueError(f'Invalid rate limit {value!r}: expected <rate>/<burst> with rate > 0 and burst >= 1')
+    return rate, burst
+
+
+def route_class(method, path):
+    """The route class of a request, or None for routes that are never limited."""
+    if method == 'OPTIONS' or not path.startswith('/api/') or path.startswith(EXEMPT_PREFIXES):
+        return None
+    if path in AUTH_PATHS:
+        return 'auth'
+    if path.startswith('/api/translate'):
+        return 'translation'
+    return 'read' if method in ('GET', 'HEAD') else 'write'
+
+
+def client_ip(remote_addr, forwarded_for=None, trusted_proxies=0):
+    """The client address, taken from ``X-Forwarded-For`` behind ``trusted_proxies`` proxies."""
+    if trusted_proxies and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+        if hops:
+            # Each trusted proxy appended the address it received the request from
+            return hops[-min(trusted_proxies, len(hops))]
+    return remote_addr or 'unknown'
+
+
+def queue_time(header, now=None):
+    """Seconds since the ``X-Request-Start`` stamp (``t=`` seconds, ms or µs), or None."""
+    if not header:
+        return None
+    try:
+        start = float(header.strip().lstrip('t='))
+    except ValueError:
+        return None
+    if start > 1e14:
+        start /= 1e6
+    elif start > 1e11:
+        start /= 1e3
+    return max(0.0, (time.time() if now is None else now) - start)
+
+
+def _refill(tokens, updated_at, rate, burst, now):
+    return min(burst, tokens + max(0.0, now - updated_at) * rate)
+
+
+class MemoryBucketStore(object):
+    """Token buckets in this process, the least recently used dropped beyond ``max_keys``."""
+    shared = False
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Take one token; returns 0 when allowed, else the seconds until one is available."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                if len(self._buckets) > self.max_keys:
+                    # A dropped bucket starts full again, which only errs on the lenient side
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            tokens = _refill(bucket[0], bucket[1], rate, burst, now)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0.0
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class _LeasedBucketStore(ABC):
+    """Shared buckets in the database, spent locally in leases of up to ``lease`` tokens."""
+    shared = True
+
+    def __init__(self, lease=5, lease_ttl=1.0, max_keys=100000, cleanup_every=1000, idle_ttl=3600):
+        self.lease = lease
+        self.lease_ttl = lease_ttl
+        self.max_keys = max_keys
+        self.cleanup_every = cleanup_every
+        # Rows idle this long hold full buckets and can be deleted; keep it above burst / rate
+        self.idle_ttl = idle_ttl
+        self._leases = OrderedDict()  # key -> [tokens, until, refused]
+        self._lock = threading.Lock()
+        self._withdrawals = 0
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        refund = 0
+        with self._lock:
+            lease = self._leases.pop(key, None)
+            if lease is not None:
+                if now < lease[1]:
+                    self._leases[key] = lease
+                    if lease[0] >= 1:
+                        lease[0] -= 1
+                        return 0.0
+                    if lease[2]:
+                        return lease[1] - now
+                else:
+                    # Unspent tokens of an expired lease go back to the shared bucket
+                    refund = lease[0]
+            self._withdrawals += 1
+            cleanup = self.cleanup_every and self._withdrawals % self.cleanup_every == 0
+        # Outside the lock: concurrent misses may each lease, which only holds tokens back briefly
+        granted, tokens = self._withdraw(key, rate, burst, min(self.lease, int(burst)), refund, now, cleanup)
+        wait = 0.0 if granted else (1 - tokens) / rate
+        with self._lock:
+            if granted:
+                self._leases[key] = [granted - 1, now + self.lease_ttl, False]
+            else:
+                self._leases[key] = [0, now + wait, True]
+            self._leases.move_to_end(key)
+            while len(self._leases) > self.max_keys:
+                self._leases.popitem(last=False)
+        return wait
+
+    @abstractmethod
+    def _withdraw(self, key, rate, burst, wanted, refund, now, cleanup):
+        """Add ``refund`` and take up to ``wanted`` whole tokens from the shared bucket.
+
+        Returns ``(granted, tokens left)``.
+        """
+
+    def __len__(self):
+        return len(self._leases)
+
+
+class MySQLBucketStore(_LeasedBucketStore):
+    """Shared buckets in the ``rate_limits`` MySQL table (migration 009)."""
+
+    def __init__(self, get_db, **kwargs):
+        _LeasedBucketStore.__init__(self, **kwargs)
+        self.get_db = get_db
+
+    def _withdraw(self, key, rate, burst, wanted, refund, now, cleanup):
+        db = self.get_db()
+        cursor = db.cursor()
+        try:
+            cursor.execute('INSERT IGNORE INTO rate_limits (bucket, tokens, updated_at) VALUES (%s, %s, %s)',
+                           (key, burst, now))
+            cursor.execute('SELECT tokens, updated_at FROM rate_limits WHERE bucket = %s FOR UPDATE', (key,))
+            row = cursor.fetchone()
+            tokens = min(burst, _refill(row['tokens'], row['updated_at'], rate, burst, now) + refund)
+            granted = min(wanted, int(tokens))
+            cursor.execute('UPDATE rate_limits SET tokens = %s, updated_at = %s WHERE bucket = %s',
+                           (tokens - granted, now, key))
+            if cleanup:
+                cursor.execute('DELETE FROM rate_limits WHERE updated_at < %s LIMIT 1000', (now - self.idle_ttl,))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return granted, tokens - granted
+
+
+class SQLiteBucketStore(_LeasedBucketStore):
+    """Shared buckets in the ``rate_limits`` SQLite table, for the worker processes of one host."""
+
+    def __init__(self, writer, **kwargs):
+        _LeasedBucketStore.__init__(self, **kwargs)
+        self.writer = writer
+
+    def _withdraw(self, key, rate, burst, wanted, refund, now, cleanup):
+        with self.writer() as conn:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_limits WHERE bucket = ?', (key,)).fetchone()
+            tokens = min(burst, _refill(row[0], row[1], rate, burst, now) + refund) if row is not None else burst
+            granted = min(wanted, int(tokens))
+            conn.execute('INSERT INTO rate_limits (bucket, tokens, updated_at) VALUES (?, ?, ?) '
+                         'ON CONFLICT (bucket) DO UPDATE SET tokens = excluded.tokens, '
+                         'updated_at = excluded.updated_at', (key, tokens - granted, now))
+            if cleanup:
+                conn.execute('DELETE FROM rate_limits WHERE updated_at < ?', (now - self.idle_ttl,))
+        return granted, tokens - granted
+
+
+class RateLimiter(object):
+    """Sheds overload and applies the per-IP and per-user budgets of each route class."""
+
+    def __init__(self, store=None, limits=None, ip_multiplier=4, trusted_proxies=0, enabled=True,
+                 max_in_flight=0, max_queue_time=0.0, shed_waiting=0, shed_wait=0.0):
+        self.store = store if store is not None else MemoryBucketStore()
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.ip_multiplier = ip_multiplier
+        self.trusted_proxies = trusted_proxies
+        self.enabled = enabled
+        self.max_in_flight = max_in_flight
+        self.max_queue_time = max_queue_time
+        self.shed_waiting = shed_waiting
+        self.shed_wait = shed_wait
+        self._watched = []
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._limited = {name: 0 for name in ROUTE_CLASSES}
+        self._shed = {}
+        self._store_errors = 0
+
+    def watch(self, name, load, classes=None):
+        """Shed requests of ``classes`` (default: all) while ``load()`` -> ``(waiting, recent_wait)`` is high."""
+        self._watched.append((name, load, classes))
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.register_error_handler(RateLimited, self._rate_limited)
+        app.register_error_handler(Overloaded, self._overloaded)
+
+    # --- Checks -----------------------------------------------------------
+
+    def _check_load(self, route_class, waited=None):
+        reason = None
+        # The request being checked has already entered, so it counts itself
+        if self.max_in_flight and self._in_flight > self.max_in_flight:
+            reason = 'in_flight'
+        elif self.max_queue_time and waited is not None and waited > self.max_queue_time:
+            reason = 'queue_time'
+        elif self.shed_waiting or self.shed_wait:
+            for name, load, classes in self._watched:
+                if classes is not None and route_class not in classes:
+                    continue
+                waiting, recent_wait = load()
+                if (self.shed_waiting and waiting >= self.shed_waiting) or \
+                        (self.shed_wait and recent_wait >= self.shed_wait):
+                    reason = name
+                    break
+        if reason is not None:
+            with self._lock:
+                self._shed[reason] = self._shed.get(reason, 0) + 1
+            raise Overloaded(reason)
+
+    def _take(self, route_class, key, rate, burst):
+        try:
+            wait = self.store.take(key, rate, burst)
+        except Exception as e:
+            print(f"Rate limit store error: {e}")
+            with self._lock:
+                self._store_errors += 1
+            return
+        if wait > 0:
+            with self._lock:
+                self._limited[route_class] += 1
+            raise RateLimited(route_class, wait)
+
+    def admit(self, route_class, ip, waited=None):
+        """Shedding and the per-IP budget; raises ``Overloaded`` or ``RateLimited``."""
+        self._check_load(route_class, waited)
+        if self.enabled:
+            rate, burst = self.limits[route_class]
+            if route_class != 'auth':
+                rate, burst = rate * self.ip_multiplier, burst * self.ip_multiplier
+            self._take(route_class, f'ip:{route_class}:{ip}', rate, burst)
+
+    def admit_user(self, route_class, user_id):
+        """The per-user budget; raises ``RateLimited``."""
+        if self.enabled and route_class is not None and route_class != 'auth':
+            rate, burst = self.limits[route_class]
+            self._take(route_class, f'user:{route_class}:{user_id}', rate, burst)
+
+    def enter(self):
+        """Count a request as in flight until ``exit()``; call before ``admit()``."""
+        with self._lock:
+            self._in_flight += 1
+
+    def exit(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    # --- Flask hooks ------------------------------------------------------
+
+    def _before_request(self):
+        cls = route_class(request.method, request.path)
+        if cls is None:
+            return
+        g._rate_class = cls
+        self.enter()
+        ip = client_ip(request.remote_addr, request.headers.get('X-Forwarded-For'), self.trusted_proxies)
+        self.admit(cls, ip, queue_time(request.headers.get('X-Request-Start')))
+
+    def _teardown_request(self, exception):
+        if g.pop('_rate_class', None) is not None:
+            self.exit()
+
+    def check_user(self, user_id):
+        """Per-user budget of the current request's route class; called by ``token_required``."""
+        self.admit_user(g.get('_rate_class'), user_id)
+
+    def _rate_limited(self, e):
+        response = jsonify({'message': 'Too many requests, please retry later'})
+        response.status_code = 429
+        response.headers['Retry-After'] = e.retry_after_header
+        return response
+
+    def _overloaded(self, e):
+        response = jsonify({'message': 'Server busy, please retry'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'shared': self.store.shared,
+                'in_flight': self._in_flight,
+                'limited': sum(self._limited.values()),
+                'limited_by_class': dict(self._limited),
+                'shed': sum(self._shed.values()),
+                'shed_by_reason': dict(self._shed),
+                'store_errors': self._store_errors,
+                'keys': len(self.store),
+            }
@@ -0,0 +1,263 @@
+"""Reminder scheduler for ``entries.reminder_date``.
+
+Upcoming reminders are held in an in-memory min-heap that only ever covers a
+bounded time window.  The scheduler thread loads the next window
+(``window`` seconds) shortly before the current one runs out, paging through
+it by ``(reminder_date, id)`` on the reminder index, so the table is never
+scanned and memory stays proportional to one window no matter how many
+entries exist.  Item writes are pushed in with ``item_changed`` so a reminder
+set for the next few minutes fires without waiting for a reload.
+
+When a reminder is due it is claimed with a conditional ``UPDATE`` that sets
+``reminder_sent_at`` only if the row still has the same ``reminder_date`` and
+has not been sent.  Reminders that were changed, deleted or already fired by
+another worker process are skipped this way, so heap entries never need to
+be kept exactly in sync with the database.  Claimed reminders are handed to a
+sink: ``LogSink``, ``FileSink`` (one JSON line per reminder, a local
+stand-in for a webhook) or ``WebhookSink``.
+"""
+import datetime
+import heapq
+import json
+import os
+import threading
+
+import requests
+
+from item_repository import DATE_FORMAT
+
+
+def as_datetime(value):
+    """Parse a stored reminder date; returns None for empty or unparsable values."""
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    try:
+        return datetime.datetime.fromisoformat(str(value)).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+class LogSink(object):
+    """Print reminders to the application log."""
+
+    def deliver(self, reminder):
+        print(f"Reminder for user {reminder['user_id']}: {reminder['what_to_do']} "
+              f"(item {reminder['id']}, due {reminder['due_date']})")
+
+
+class FileSink(object):
+    """Append reminders as JSON lines to a local file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def deliver(self, reminder):
+        line = json.dumps(reminder, default=str, sort_keys=True)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+
+class WebhookSink(object):
+    """POST each reminder as JSON to ``url``."""
+
+    def __init__(self, url, timeout=5.0):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def deliver(self, reminder):
+        response = self.session.post(self.url, data=json.dumps(reminder, default=str),
+                                     headers={'Content-Type': 'application/json'}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+def sink_from_config(spec):
+    """Build a sink from ``log``, ``file:<path>`` or ``webhook:<url>``."""
+    kind, _, target = (spec or 'log').partition(':')
+    if kind == 'log':
+        return LogSink()
+    if kind == 'file' and target:
+        return FileSink(target)
+    if kind == 'webhook' and target:
+        return WebhookSink(target)
+    raise ValueError(f'Unknown reminder sink: {spec}')
+
+
+class ReminderScheduler(object):
+    """Fires reminders from a windowed min-heap on a background thread.
+
+    ``load(start, end, after, limit)`` returns up to ``limit`` rows with
+    ``start <= reminder_date < end``, not yet sent, ordered by
+    ``(reminder_date, id)`` and after the ``(reminder_date, id)`` key ``after``
+    when given.  ``claim(item_id, reminder_date)`` marks the reminder sent and
+    returns the item row, or None if it no longer applies.
+    """
+
+    def __init__(self, load, claim, sink, window=3600, lookahead=300, batch_size=1000,
+                 catchup=3600, retry_interval=30, clock=datetime.datetime.now):
+        self.load = load
+        self.claim = claim
+        self.sink = sink
+        self.window = datetime.timedelta(seconds=window)
+        # Load the next window before this one runs out, but at most once per window
+        self.lookahead = datetime.timedelta(seconds=min(lookahead, window / 2))
+        self.batch_size = batch_size
+        self.catchup = datetime.timedelta(seconds=catchup)
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._heap = []  # (reminder_date, item_id)
+        self._scheduled = {}  # item_id -> reminder_date currently wanted
+        self._loaded_from = None
+        self._horizon = None
+        self._thread = None
+        self._pid = None
+        self._stopped = False
+        self._stats = {'windows_loaded': 0, 'rows_loaded': 0, 'fired': 0, 'skipped': 0,
+                       'sink_errors': 0, 'errors': 0}
+
+    def ensure_started(self):
+        """Start the scheduler thread in this process if it is not running."""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            # A forked worker inherits the parent's heap but not its thread: start over
+            self._heap = []
+            self._scheduled = {}
+            self._loaded_from = self._horizon = None
+            self._stopped = False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='reminders', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _push(self, item_id, when):
+        self._scheduled[item_id] = when
+        heapq.heappush(self._heap, (when, item_id))
+
+    def item_changed(self, item_id, reminder_date):
+        """Reschedule an item after a write; ``reminder_date`` None or past the window drops it."""
+        when = as_datetime(reminder_date)
+        with self._cond:
+            if self._horizon is None:
+                return
+            if when is None or not self._loaded_from <= when < self._horizon:
+                # Stale heap entries are skipped when popped
+                self._scheduled.pop(item_id, None)
+                return
+            self._push(item_id, when)
+            if self._heap[0] == (when, item_id):
+                self._cond.notify_all()
+
+    def item_deleted(self, item_id):
+        with self._cond:
+            self._scheduled.pop(item_id, None)
+
+    def _load_window(self, start, end):
+        """Page through ``[start, end)`` on the reminder index and schedule every row."""
+        after = None
+        while True:
+            rows = self.load(start, end, after, self.batch_size)
+            with self._cond:
+                for row in rows:
+                    when = as_datetime(row['reminder_date'])
+                    if when is not None:
+                        self._push(row['id'], when)
+            self._stats['rows_loaded'] += len(rows)
+            if len(rows) < self.batch_size:
+                break
+            last = rows[-1]
+            after = (last['reminder_date'], last['id'])
+        self._stats['windows_loaded'] += 1
+
+    def _advance(self, now):
+        """Load windows until the horizon is more than ``lookahead`` ahead of ``now``."""
+        if self._horizon is None:
+            start = now - self.catchup
+            end = now + self.window
+        else:
+            start = self._horizon
+            end = max(self._horizon, now) + self.window
+        # Widen the window first so writes committed while it loads are pushed
+        # by item_changed; a row seen both ways is only fired once
+        with self._cond:
+            previous = self._loaded_from, self._horizon
+            if self._loaded_from is None:
+                self._loaded_from = start
+            self._horizon = end
+        try:
+            self._load_window(start.strftime(DATE_FORMAT), end.strftime(DATE_FORMAT))
+        except Exception:
+            with self._cond:
+                self._loaded_from, self._horizon = previous
+            raise
+
+    def _fire_due(self, now):
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                when, item_id = heapq.heappop(self._heap)
+                if self._scheduled.get(item_id) == when:
+                    del self._scheduled[item_id]
+                    due.append((item_id, when))
+        for position, (item_id, when) in enumerate(due):
+            try:
+                reminder = self.claim(item_id, when.strftime(DATE_FORMAT))
+            except Exception:
+                # Database unavailable: keep the rest for the retry
+                with self._cond:
+                    for item_id, when in due[position:]:
+                        self._scheduled.setdefault(item_id, when)
+                        heapq.heappush(self._heap, (when, item_id))
+                raise
+            if reminder is None:
+                # Changed, deleted or already fired by another process
+                self._stats['skipped'] += 1
+                continue
+            try:
+                self.sink.deliver(reminder)
+                self._stats['fired'] += 1
+            except Exception as e:
+                self._stats['sink_errors'] += 1
+                print(f"Reminder delivery failed for item {item_id}: {e}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+            now = self.clock()
+            try:
+                if self._horizon is None or now + self.lookahead >= self._horizon:
+                    self._advance(now)
+                self._fire_due(now)
+            except Exception as e:
+                self._stats['errors'] += 1
+                print(f"Reminder scheduler error: {e}")
+                with self._cond:
+                    self._cond.wait(self.retry_interval)
+                continue
+            with self._cond:
+                wake = self._horizon - self.lookahead
+                if self._heap:
+                    wake = min(wake, self._heap[0][0])
+                timeout = (wake - self.clock()).total_seconds()
+                if timeout > 0 and not self._stopped:
+                    self._cond.wait(timeout)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['scheduled'] = len(self._scheduled)
+            stats['heap_size'] = len(self._heap)
+            stats['horizon'] = self._horizon.strftime(DATE_FORMAT) if self._horizon else None
+            stats['running'] = self._thread is not None and self._thread.is_alive()
+        return stats
@@ -0,0 +1,288 @@
+"""Opt-in profiling of individual requests.
+
+A request is profiled when it is sampled (``sample_rate``) or when it carries
+``X-Profile: timeline|cprofile|sample`` together with a valid
+``x-admin-token``.  A profiled request records a timeline: the phases the
+backend marks with ``phase(name)`` (token decoding, user lookup, password
+check, serialization, translation providers) and every SQL statement, with
+their offsets and durations.  Depending on the mode it also records either a
+``cProfile`` dump (top functions by cumulative time) or a stack-sampling
+profile (folded stacks of the request thread every ``sample_interval``
+seconds, far cheaper than ``cProfile``).
+
+Reports of forced requests are always kept, and the response carries their
+id in ``X-Profile-Id``.  Reports of sampled requests are kept only when the
+request took at least ``slow_threshold`` seconds.  Kept reports are JSON files
+in ``directory``, a ring of at most ``capacity`` files shared by the workers
+of a host, listed and fetched through ``/api/admin/profiles``.
+
+When a request is not profiled, each ``phase`` and query hook costs a
+thread-local lookup; with ``sample_rate`` 0 nothing else runs.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+from flask import g, request
+
+from metrics import statement_label
+
+MODES = ('timeline', 'cprofile', 'sample')
+PROFILE_ID = re.compile(r'^[0-9]+-[0-9]+-[0-9a-f]+$')
+TOP_FUNCTIONS = 40
+TOP_STACKS = 100
+
+_local = threading.local()
+
+
+class _NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class _Phase(object):
+    __slots__ = ('profile', 'name', 'start')
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.add(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+def phase(name):
+    """Context manager timing a named phase of the current request, if it is profiled."""
+    profile = getattr(_local, 'profile', None)
+    if profile is None:
+        return _NO_PHASE
+    return _Phase(profile, name)
+
+
+def record_query(sql, seconds):
+    """Add a finished SQL statement to the current request's timeline (``Metrics.on_query``)."""
+    profile = getattr(_local, 'profile', None)
+    if profile is not None:
+        profile.add('sql', time.perf_counter() - seconds, seconds, statement_label(sql))
+
+
+class _Profile(object):
+    def __init__(self, mode, trigger):
+        self.mode = mode
+        self.trigger = trigger
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.events = []
+        self.stacks = {}
+        self.profiler = None
+
+    def add(self, name, start, duration, detail=None):
+        event = {'name': name, 'offset': round(start - self.start, 6), 'duration': round(duration, 6)}
+        if detail is not None:
+            event['detail'] = detail
+        self.events.append(event)
+
+
+class _StackSampler(object):
+    """One thread per process sampling the stacks of the profiled request threads."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._threads = {}  # thread id -> _Profile
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def add(self, thread_id, profile):
+        with self._lock:
+            self._threads[thread_id] = profile
+            if self._pid != os.getpid():
+                # Not started yet, or started in the parent before a fork
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='stack-sampler', daemon=True).start()
+
+    def remove(self, thread_id):
+        with self._lock:
+            self._threads.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                # Held while sampling, so a profile is not written to after remove()
+                if not self._threads:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, profile in self._threads.items():
+                    frame = frames.get(thread_id)
+                    names = []
+                    while frame is not None:
+                        code = frame.f_code
+                        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                        frame = frame.f_back
+                    if names:
+                        stack = ';'.join(reversed(names))
+                        profile.stacks[stack] = profile.stacks.get(stack, 0) + 1
+
+
+class RequestProfiler(object):
+    """Decides which requests to profile and keeps the ring of reports."""
+
+    def __init__(self, directory=None, sample_rate=0.0, slow_threshold=1.0, capacity=200,
+                 mode='timeline', sample_interval=0.005, admin_token=None):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'todolist-profiles')
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.capacity = capacity
+        self.mode = mode
+        self.admin_token = admin_token
+        self._sampler = _StackSampler(sample_interval)
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _trigger(self):
+        requested = request.headers.get('X-Profile')
+        if requested and self.admin_token and request.headers.get('x-admin-token') == self.admin_token:
+            return (requested if requested in MODES else 'timeline'), 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return self.mode, 'sample'
+        return None, None
+
+    def _before_request(self):
+        mode, trigger = self._trigger()
+        if mode is None:
+            return
+        profile = _local.profile = _Profile(mode, trigger)
+        g._profile = profile
+        if mode == 'cprofile':
+            profile.profiler = cProfile.Profile()
+            profile.profiler.enable()
+        elif mode == 'sample':
+            self._sampler.add(threading.get_ident(), profile)
+
+    def _stop(self, profile):
+        _local.profile = None
+        if profile.profiler is not None:
+            profile.profiler.disable()
+        elif profile.mode == 'sample':
+            self._sampler.remove(threading.get_ident())
+
+    def _after_request(self, response):
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return response
+        duration = time.perf_counter() - profile.start
+        self._stop(profile)
+        if profile.trigger == 'header' or duration >= self.slow_threshold:
+            try:
+                response.headers['X-Profile-Id'] = self._save(profile, duration, response.status_code)
+            except OSError as e:
+                print(f"Could not save request profile: {e}")
+        return response
+
+    def _teardown_request(self, exception):
+        # The request failed before after_request ran; drop its profile
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            self._stop(profile)
+
+    def _report(self, profile, duration, status):
+        rule = request.url_rule
+        report = {
+            'method': request.method,
+            'path': request.path,
+            'route': rule.rule if rule is not None else None,
+            'status': status,
+            'duration': round(duration, 6),
+            'started_at': profile.started_at,
+            'pid': os.getpid(),
+            'trigger': profile.trigger,
+            'mode': profile.mode,
+            'phases': sorted(profile.events, key=lambda e: e['offset']),
+        }
+        if profile.profiler is not None:
+            out = io.StringIO()
+            pstats.Stats(profile.profiler, stream=out).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+            report['cprofile'] = out.getvalue()
+        if profile.mode == 'sample':
+            stacks = sorted(profile.stacks.items(), key=lambda item: -item[1])[:TOP_STACKS]
+            report['stacks'] = [{'stack': stack, 'samples': count} for stack, count in stacks]
+        return report
+
+    def _save(self, profile, duration, status):
+        report = self._report(profile, duration, status)
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        # Zero-padded milliseconds first, so ids sort by start time
+        report['id'] = profile_id = f'{int(profile.started_at * 1000):013d}-{os.getpid()}-{sequence:x}'
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, profile_id + '.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(report, f)
+        os.replace(path + '.tmp', path)
+        self._prune()
+        return profile_id
+
+    def _ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith('.json'))
+
+    def _prune(self):
+        ids = self._ids()
+        for profile_id in ids[:max(0, len(ids) - self.capacity)]:
+            try:
+                os.remove(os.path.join(self.directory, profile_id + '.json'))
+            except FileNotFoundError:
+                pass
+
+    def list(self, limit=50):
+        """Summaries of the newest ``limit`` reports."""
+        summaries = []
+        for profile_id in reversed(self._ids()):
+            report = self.get(profile_id)
+            if report is None:
+                continue
+            summaries.append({key: report[key] for key in
+                              ('id', 'method', 'path', 'status', 'duration', 'started_at', 'trigger', 'mode')})
+            if len(summaries) >= limit:
+                break
+        return summaries
+
+    def get(self, profile_id):
+        """The full report ``profile_id``, or None."""
+        if not PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, profile_id + '.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
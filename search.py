@@ -0,0 +1,138 @@
+"""Full-text search over task descriptions (``GET /api/items/search``).
+
+Each word of the query matches any word that starts with it (``gro`` finds
+"groceries"), and a task must match every word.  Results are ranked by
+relevance, best first.
+
+* SQLite searches the ``entries_fts`` FTS5 table (migrations 007 and 010),
+  kept in step with ``entries`` by triggers.  Besides the description it
+  indexes the owner as a single token, so a search only walks the user's own
+  postings rather than every user's.  Each row stores the task id, which the
+  page is joined to ``entries`` on.  Relevance is ``bm25``, lower is better,
+  and ties are broken by id; the page is ranked and cut inside the index
+  unless a ``status`` filter needs the ``entries`` row first.
+* MySQL uses a ``FULLTEXT`` index on ``what_to_do`` in boolean mode;
+  relevance is ``MATCH ... AGAINST``, higher is better, ties broken by id.
+  Words shorter than ``innodb_ft_min_token_size`` and stopwords are ignored
+  by the index.
+
+Pages use the listing's keyset cursor (see ``pagination.py``) with phase
+``'r'``, the last row's score in place of its due date and its tie-breaker in
+place of its id.  Scores depend on the whole index, so a write between two
+pages can shift rows across the page boundary.
+"""
+import re
+import unicodedata
+
+from pagination import (DEFAULT_LIMIT, ENTRY_COLUMNS, MAX_LIMIT, InvalidPageRequest,
+                        decode_cursor, encode_cursor)
+
+MAX_QUERY_LENGTH = 200
+MAX_TERMS = 8
+
+# Letters and digits only: the FTS5 unicode61 tokenizer splits on everything
+# else, underscores included, so each term stays a single token
+_TERM = re.compile(r'[^\W_]+')
+_COLUMNS = ENTRY_COLUMNS.split(', ')
+
+
+class SearchRequest(object):
+    """Validated search parameters taken from the query string."""
+
+    def __init__(self, args):
+        q = unicodedata.normalize('NFC', args.get('q', '')).strip()
+        if not q:
+            raise InvalidPageRequest('q is required')
+        if len(q) > MAX_QUERY_LENGTH:
+            raise InvalidPageRequest(f'q must be at most {MAX_QUERY_LENGTH} characters')
+        self.terms = [term.lower() for term in _TERM.findall(q)][:MAX_TERMS]
+        if not self.terms:
+            raise InvalidPageRequest('q must contain a letter or digit')
+
+        try:
+            self.limit = int(args.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise InvalidPageRequest('limit must be an integer')
+        if not 1 <= self.limit <= MAX_LIMIT:
+            raise InvalidPageRequest(f'limit must be between 1 and {MAX_LIMIT}')
+
+        self.status = args.get('status') or None
+        self.cursor = None
+        if args.get('cursor'):
+            phase, score, item_id = decode_cursor(args['cursor'], phases=('r',))
+            if isinstance(score, bool) or not isinstance(score, (int, float)):
+                raise InvalidPageRequest('Invalid cursor')
+            self.cursor = (float(score), item_id)
+
+
+def fts5_query(terms, user_id):
+    """FTS5 ``MATCH`` expression: the owner's token and every term as a prefix."""
+    words = ' AND '.join(f'"{term}"*' for term in terms)
+    return f'owner : "{owner_token(user_id)}" AND what_to_do : ({words})'
+
+
+def owner_token(user_id):
+    # The same value the triggers index: ids without dashes are one token
+    return user_id.replace('-', '').replace('"', '""')
+
+
+def boolean_query(terms):
+    """MySQL boolean-mode expression requiring every term as a prefix."""
+    return ' '.join(f'+{term}*' for term in terms)
+
+
+def search_query(search, user_id, dialect, placeholder):
+    """Return ``(sql, params)`` reading one page plus one row, best matches first."""
+    p = placeholder
+    if dialect == 'sqlite':
+        # Weight 0 for the owner column: it matches every row of the user
+        rank = 'bm25(entries_fts, 1.0, 0.0)'
+        after, after_params = '', []
+        if search.cursor is not None:
+            after = f' AND ({rank} > {p} OR ({rank} = {p} AND entries_fts.id > {p}))'
+            after_params = [search.cursor[0], search.cursor[0], search.cursor[1]]
+        columns = ', '.join(f'e.{column}' for column in _COLUMNS)
+        matches = f'SELECT id, {rank} AS score FROM entries_fts WHERE entries_fts MATCH {p}{after}'
+        params = [fts5_query(search.terms, user_id)] + after_params
+        if search.status is None:
+            # Ranked and cut in the index; only the page is joined to entries
+            sql = (f'SELECT {columns}, s.score AS score, s.id AS position FROM ('
+                   f'{matches} ORDER BY score, id LIMIT {p}) s '
+                   f'JOIN entries e ON e.id = s.id WHERE e.user_id = {p} ORDER BY s.score, s.id')
+            return sql, params + [search.limit + 1, user_id]
+        sql = (f'SELECT {columns}, s.score AS score, s.id AS position FROM ({matches}) s '
+               f'JOIN entries e ON e.id = s.id WHERE e.user_id = {p} AND e.status = {p} '
+               f'ORDER BY s.score, s.id LIMIT {p}')
+        return sql, params + [user_id, search.status, search.limit + 1]
+
+    match = f'MATCH (what_to_do) AGAINST ({p} IN BOOLEAN MODE)'
+    expression = boolean_query(search.terms)
+    clauses = [f'user_id = {p}']
+    params = [expression, user_id]
+    if search.status is not None:
+        clauses.append(f'status = {p}')
+        params.append(search.status)
+    clauses.append(match)
+    params.append(expression)
+    outer = ''
+    if search.cursor is not None:
+        outer = f' WHERE score < {p} OR (score = {p} AND id > {p})'
+        params.extend([search.cursor[0], search.cursor[0], search.cursor[1]])
+    # Rounded so the score in a cursor compares equal to the recomputed one
+    sql = (f'SELECT *, id AS position FROM (SELECT {ENTRY_COLUMNS}, ROUND({match}, 6) AS score FROM entries '
+           f"WHERE {' AND '.join(clauses)}) s{outer} ORDER BY score DESC, id LIMIT {p}")
+    return sql, params + [search.limit + 1]
+
+
+def fetch_search(search, user_id, dialect, placeholder, run):
+    """Run the search with ``run(sql, params)`` and return ``(rows, next_cursor)``.
+
+    Rows come back as dicts of ``ENTRY_COLUMNS``, without the score.
+    """
+    rows = run(*search_query(search, user_id, dialect, placeholder))
+    next_cursor = None
+    if len(rows) > search.limit:
+        rows = rows[:search.limit]
+        last = rows[-1]
+        next_cursor = encode_cursor('r', last['score'], str(last['position']))
+    return [{column: row[column] for column in _COLUMNS} for row in rows], next_cursor
@@ -0,0 +1,87 @@
+"""JSON responses for item listings.
+
+``jsonify`` goes through the pure-Python parts of ``json`` and needs plain
+dicts with string dates, so the listing routes used to copy every row and
+``strftime`` its dates in a Python loop first.  This module encodes the rows
+as the drivers return them (``DictCursor`` dicts, ``sqlite3.Row``) instead:
+
+* with ``orjson`` installed it is the encoder, and ``datetime`` values and
+  ``sqlite3.Row`` objects are converted in its ``default`` hook while it
+  walks the data; without it the stdlib encoder uses the same hook;
+* dates come out as ``YYYY-MM-DD HH:MM:SS``, keys are sorted and separators
+  compact, as with ``jsonify``;
+* lists longer than ``STREAM_THRESHOLD`` are sent as a stream of encoded
+  chunks rather than as one large string.
+"""
+import datetime
+import json
+import sqlite3
+
+from flask import Response
+
+from item_repository import DATE_FORMAT
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STREAM_THRESHOLD = 2000
+CHUNK_ROWS = 1000
+
+
+def _default(value):
+    cls = type(value)
+    if cls is datetime.datetime:
+        # isoformat(' ') is DATE_FORMAT without the format parsing, unless
+        # there are microseconds (MySQL DATETIME columns have none)
+        return value.strftime(DATE_FORMAT) if value.microsecond else value.isoformat(' ')
+    if cls is sqlite3.Row:
+        return dict(zip(value.keys(), value))
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(value):
+        """Encode ``value`` to JSON bytes."""
+        return orjson.dumps(value, default=_default, option=_OPTIONS)
+else:
+    _encoder = json.JSONEncoder(default=_default, sort_keys=True, separators=(',', ':'),
+                                ensure_ascii=False)
+
+    def dumps(value):
+        """Encode ``value`` to JSON bytes."""
+        return _encoder.encode(value).encode('utf-8')
+
+
+def _list_chunks(items):
+    yield b'['
+    for start in range(0, len(items), CHUNK_ROWS):
+        chunk = dumps(items[start:start + CHUNK_ROWS])
+        # Drop the brackets of each chunk's own list
+        yield (b',' if start else b'') + chunk[1:-1]
+    yield b']'
+
+
+def _iter_payload(payload):
+    if isinstance(payload, list):
+        yield from _list_chunks(payload)
+    else:
+        rest = {k: v for k, v in payload.items() if k != 'items'}
+        yield b'{"items":'
+        yield from _list_chunks(payload['items'])
+        tail = dumps(rest)
+        yield b',' + tail[1:] if len(tail) > 2 else b'}'
+    yield b'\n'
+
+
+def json_response(payload, status=200):
+    """Response with ``payload`` as JSON; a long list (or ``payload['items']``) is streamed."""
+    items = payload if isinstance(payload, list) else payload.get('items')
+    if isinstance(items, list) and len(items) > STREAM_THRESHOLD:
+        return Response(_iter_payload(payload), status=status, mimetype='application/json')
+    return Response(dumps(payload) + b'\n', status=status, mimetype='application/json')
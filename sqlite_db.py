@@ -0,0 +1,247 @@
+"""Long-lived SQLite connections for the SQLite backend.
+
+Opening a connection per request in the default rollback-journal mode makes
+readers and writers block each other ("database is locked").  This module
+instead:
+
+* switches the database to WAL journaling, where readers never block the
+  writer and the writer never blocks readers, and tunes the per-connection
+  pragmas (``synchronous``, ``cache_size``, ``mmap_size``, ``busy_timeout``);
+* keeps a bounded pool of read-only connections.  A thread checks one out on
+  its first read and hands it back with ``end_read()``, so servers that start
+  a thread per request reuse the same few connections instead of opening and
+  tuning a new one each time;
+* sends every write through a single writer connection behind a lock, inside
+  ``BEGIN IMMEDIATE``.  Writers in this process queue on the lock instead of
+  spinning on ``SQLITE_BUSY``; writers in other processes are still
+  serialized by SQLite itself, waiting up to ``busy_timeout``.
+
+``load()`` reports the writers queued on the lock and the recent lock wait,
+for load shedding in front of writes.
+
+Connections are tied to the process that opened them, so worker processes
+forked after import open their own.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Writer lock waits are averaged over roughly this many seconds by load()
+RECENT_WAIT_WINDOW = 2.0
+RECENT_WAIT_WEIGHT = 0.1
+
+
+class WriterBusy(Exception):
+    """Raised when the writer lock could not be acquired within the timeout."""
+
+
+class ReaderBusy(Exception):
+    """Raised when no reader connection became free within the timeout."""
+
+
+class SQLiteDatabase(object):
+    """A pool of reader connections plus one serialized writer for ``path``."""
+
+    def __init__(self, path, journal_mode='wal', synchronous='normal', cache_size_kb=65536,
+                 mmap_size=268435456, busy_timeout_ms=5000, write_timeout=10.0,
+                 factory=sqlite3.Connection, max_readers=16, read_timeout=10.0):
+        self.path = path
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.write_timeout = write_timeout
+        self.factory = factory
+        self.max_readers = max_readers
+        self.read_timeout = read_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._readers_free = threading.Condition(self._lock)
+        self._idle_readers = []
+        self._readers = 0
+        self._readers_in_use = 0
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._pid = os.getpid()
+        self._journal_mode_set = False
+        self._waiting = 0
+        self._recent_wait = 0.0
+        self._recent_at = time.monotonic()
+        self._stats = {
+            'readers_opened': 0,
+            'reader_checkouts': 0,
+            'reader_timeouts': 0,
+            'writes': 0,
+            'write_timeouts': 0,
+            'write_wait_total': 0.0,
+            'write_wait_max': 0.0,
+        }
+
+    def connect(self, check_same_thread=True):
+        """Open a new connection with the tuned pragmas applied."""
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0,
+                               check_same_thread=check_same_thread, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        if not self._journal_mode_set:
+            # Persistent in the database file; only needs to succeed once
+            conn.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+            self._journal_mode_set = True
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        return conn
+
+    def _check_pid(self):
+        pid = os.getpid()
+        if pid != self._pid:
+            # Forked child: never reuse the parent's connections or locks
+            self._pid = pid
+            self._local = threading.local()
+            self._lock = threading.Lock()
+            self._readers_free = threading.Condition(self._lock)
+            self._idle_readers = []
+            self._readers = 0
+            self._readers_in_use = 0
+            self._write_lock = threading.Lock()
+            self._writer = None
+            self._waiting = 0
+
+    def reader(self):
+        """Return the read-only connection checked out by this thread, checking one out if needed.
+
+        Opens a new connection while fewer than ``max_readers`` exist, otherwise
+        waits for one to be returned.  Raises ``ReaderBusy`` after ``read_timeout``.
+        """
+        self._check_pid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+        deadline = time.monotonic() + self.read_timeout
+        with self._readers_free:
+            while not self._idle_readers and self._readers >= self.max_readers:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['reader_timeouts'] += 1
+                    raise ReaderBusy('Timed out waiting for a database reader')
+                self._readers_free.wait(remaining)
+            if self._idle_readers:
+                conn = self._idle_readers.pop()
+            else:
+                # Reserve the slot before connecting outside the lock
+                self._readers += 1
+            self._readers_in_use += 1
+            self._stats['reader_checkouts'] += 1
+        if conn is None:
+            try:
+                # Checked out by whichever thread handles the next request
+                conn = self.connect(check_same_thread=False)
+                # Writes must go through writer(); fail loudly if one slips through
+                conn.execute('PRAGMA query_only = ON')
+            except Exception:
+                with self._readers_free:
+                    self._readers -= 1
+                    self._readers_in_use -= 1
+                    self._readers_free.notify()
+                raise
+            with self._lock:
+                self._stats['readers_opened'] += 1
+        self._local.conn = conn
+        return conn
+
+    def end_read(self):
+        """Close this thread's read transaction and return its connection to the pool.
+
+        Ending the transaction lets WAL checkpoints advance.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            return
+        self._local.conn = None
+        if self._pid != os.getpid():
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            conn.close()
+            with self._readers_free:
+                self._readers -= 1
+                self._readers_in_use -= 1
+                self._readers_free.notify()
+            return
+        with self._readers_free:
+            self._idle_readers.append(conn)
+            self._readers_in_use -= 1
+            self._readers_free.notify()
+
+    @contextmanager
+    def writer(self):
+        """Run a write transaction on the shared writer connection.
+
+        Commits when the block exits normally and rolls back on an exception.
+        Raises ``WriterBusy`` if the lock is not free within ``write_timeout``.
+        """
+        self._check_pid()
+        start = time.monotonic()
+        with self._lock:
+            self._waiting += 1
+        try:
+            acquired = self._write_lock.acquire(timeout=self.write_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        if not acquired:
+            with self._lock:
+                self._stats['write_timeouts'] += 1
+                self._record_wait_locked(self.write_timeout, time.monotonic())
+            raise WriterBusy('Timed out waiting for the database writer')
+        try:
+            now = time.monotonic()
+            waited = now - start
+            with self._lock:
+                self._record_wait_locked(waited, now)
+                self._stats['writes'] += 1
+                self._stats['write_wait_total'] += waited
+                self._stats['write_wait_max'] = max(self._stats['write_wait_max'], waited)
+            if self._writer is None:
+                self._writer = self.connect(check_same_thread=False)
+            conn = self._writer
+            # Take the write lock up front instead of upgrading mid-transaction
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            self._write_lock.release()
+
+    def _recent_wait_locked(self, now):
+        return self._recent_wait * math.exp(-(now - self._recent_at) / RECENT_WAIT_WINDOW)
+
+    def _record_wait_locked(self, waited, now):
+        recent = self._recent_wait_locked(now)
+        self._recent_wait = recent + (waited - recent) * RECENT_WAIT_WEIGHT
+        self._recent_at = now
+
+    def load(self):
+        """Return ``(waiting, recent_wait)``: writers queued on the lock and the recent average wait."""
+        with self._lock:
+            return self._waiting, self._recent_wait_locked(time.monotonic())
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['waiting'] = self._waiting
+            stats['readers'] = self._readers
+            stats['readers_in_use'] = self._readers_in_use
+            stats['recent_wait'] = self._recent_wait_locked(time.monotonic())
+        stats['journal_mode'] = self.journal_mode
+        stats['write_wait_avg'] = stats['write_wait_total'] / stats['writes'] if stats['writes'] else 0.0
+        return stats
@@ -0,0 +1,75 @@
+import pytest
+
+from item_batch import InvalidBatch, apply_batch
+
+
+def ids(db, user_id):
+    return {row['id']: row for row in db.execute('SELECT * FROM entries WHERE user_id = ?', (user_id,))}
+
+
+def test_mixed_batch(db, repository, make_user):
+    user_id = make_user()
+    cursor = db.cursor()
+    update_id = repository.create(cursor, user_id, 'update me')
+    delete_id = repository.create(cursor, user_id, 'delete me')
+    db.commit()
+    reminders = []
+
+    results = apply_batch(db, cursor, repository, user_id, [
+        {'op': 'create', 'what_to_do': 'new', 'reminder_date': '2030-01-01 09:00'},
+        {'op': 'update', 'id': update_id, 'status': 'done'},
+        {'op': 'delete', 'id': delete_id},
+        {'op': 'create'},
+        {'op': 'rename', 'id': update_id},
+    ], on_reminder=lambda item_id, reminder_date: reminders.append(item_id))
+
+    assert [result['status'] for result in results] == [201, 200, 200, 400, 400]
+    rows = ids(db, user_id)
+    assert set(rows) == {results[0]['id'], update_id}
+    assert rows[update_id]['status'] == 'done'
+    assert reminders == [results[0]['id']]
+
+
+def test_items_of_other_users_are_not_found(db, repository, make_user):
+    user_id, other = make_user(), make_user()
+    cursor = db.cursor()
+    theirs = repository.create(cursor, other, 'not yours')
+    db.commit()
+
+    results = apply_batch(db, cursor, repository, user_id, [
+        {'op': 'update', 'id': theirs, 'status': 'done'},
+        {'op': 'delete', 'id': 'no-such-item'},
+    ])
+
+    assert [(result['status'], result['message']) for result in results] == [
+        (404, 'Item not found'), (404, 'Item not found')]
+    assert ids(db, other)[theirs]['status'] == 'pending'
+    # Deleting someone else's item by id is refused too
+    results = apply_batch(db, cursor, repository, user_id, [{'op': 'delete', 'id': theirs}])
+    assert results[0]['status'] == 404
+    assert theirs in ids(db, other)
+
+
+@pytest.mark.parametrize('operations', [
+    [{'op': 'update', 'id': 'X', 'status': 'done'}, {'op': 'delete', 'id': 'X'}],
+    [{'op': 'delete', 'id': 'X'}, {'op': 'delete', 'id': 'X'}],
+    [{'op': 'update', 'id': 'X', 'status': 'done'}, {'op': 'update', 'id': 'X', 'what_to_do': 'b'}],
+])
+def test_batches_referencing_an_item_twice_are_rejected(db, repository, make_user, operations):
+    user_id = make_user()
+    cursor = db.cursor()
+    item_id = repository.create(cursor, user_id, 'task')
+    db.commit()
+    operations = [dict(op, id=item_id) for op in operations]
+
+    with pytest.raises(InvalidBatch):
+        apply_batch(db, cursor, repository, user_id, [{'op': 'create', 'what_to_do': 'new'}] + operations)
+    # Rejected as a whole: not even the create was written
+    assert list(ids(db, user_id)) == [item_id]
+    assert ids(db, user_id)[item_id]['status'] == 'pending'
+
+
+@pytest.mark.parametrize('operations', [None, [], {'op': 'create'}, [{'op': 'create', 'what_to_do': 'x'}] * 3])
+def test_invalid_batches(db, repository, make_user, operations):
+    with pytest.raises(InvalidBatch):
+        apply_batch(db, db.cursor(), repository, make_user(), operations, max_operations=2)
@@ -0,0 +1,86 @@
+import sqlite3
+
+import migrations
+
+
+def counts(db):
+    result = {table: db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+              for table in ('entries', 'entries_fts', 'sync_versions', 'entry_tombstones')}
+    # A recount drops the rows of statuses that went down to zero
+    result['task_counts'] = [tuple(row) for row in db.execute(
+        'SELECT user_id, status, tasks FROM task_counts WHERE tasks > 0 ORDER BY user_id, status')]
+    return result
+
+
+def seed(db, repository, user_id):
+    cursor = db.cursor()
+    kept = repository.create(cursor, user_id, 'buy milk', '2024-01-01T09:00')
+    gone = repository.create(cursor, user_id, 'walk the dog')
+    repository.update(cursor, user_id, kept, {'status': 'done'})
+    repository.delete(cursor, user_id, gone)
+    db.commit()
+    return kept
+
+
+def test_second_run_applies_nothing(db):
+    assert migrations.pending_migrations(db, 'sqlite') == []
+    assert migrations.migrate(db, 'sqlite', log=lambda message: None) == []
+
+
+def test_fresh_database_runs_in_order_and_stops_at_target():
+    conn = sqlite3.connect(':memory:')
+    applied = migrations.migrate(conn, 'sqlite', target=3, log=lambda message: None)
+    assert applied == [1, 2, 3]
+    assert [m.version for m in migrations.pending_migrations(conn, 'sqlite')] == \
+        [m.version for m in migrations.MIGRATIONS[3:]]
+    applied = migrations.migrate(conn, 'sqlite', log=lambda message: None)
+    assert applied == [m.version for m in migrations.MIGRATIONS[3:]]
+
+
+def test_repeating_every_migration_keeps_the_data(db, repository, make_user):
+    user_id = make_user()
+    kept = seed(db, repository, user_id)
+    before = counts(db)
+    version = repository.sync_version(db.cursor(), user_id)
+
+    # As if a run had been interrupted before recording any version
+    db.execute(f'DELETE FROM {migrations.VERSION_TABLE}')
+    db.commit()
+    applied = migrations.migrate(db, 'sqlite', log=lambda message: None)
+
+    assert applied == [m.version for m in migrations.MIGRATIONS]
+    assert counts(db) == before
+    assert repository.sync_version(db.cursor(), user_id) == version
+    row = db.execute('SELECT due_date, status FROM entries WHERE id = ?', (kept,)).fetchone()
+    assert tuple(row) == ('2024-01-01 09:00:00', 'done')
+    # Triggers were not doubled up: one more write is counted once
+    repository.create(db.cursor(), user_id, 'buy bread')
+    db.commit()
+    assert db.execute("SELECT tasks FROM task_counts WHERE user_id = ? AND status = 'pending'",
+                      (user_id,)).fetchone()[0] == 1
+    assert db.execute('SELECT COUNT(*) FROM entries_fts').fetchone()[0] == 2
+    assert repository.sync_version(db.cursor(), user_id) == version + 1
+
+
+def test_search_index_follows_writes_by_id(db, repository, make_user):
+    user_id = make_user()
+    cursor = db.cursor()
+    item_id = repository.create(cursor, user_id, 'buy milk')
+    other = repository.create(cursor, user_id, 'buy eggs')
+    db.commit()
+    # VACUUM may renumber the rowids of entries; the index is keyed by id
+    db.execute('VACUUM')
+    repository.update(cursor, user_id, item_id, {'what_to_do': 'fly a kite'})
+    repository.delete(cursor, user_id, other)
+    db.commit()
+    assert [tuple(row) for row in db.execute('SELECT id, what_to_do FROM entries_fts')] == \
+        [(item_id, 'fly a kite')]
+
+
+def test_status_command(tmp_path, capsys):
+    path = str(tmp_path / 'cli.db')
+    assert migrations.main(['--backend', 'sqlite', '--database', path, 'status']) == 1
+    assert migrations.main(['--backend', 'sqlite', '--database', path, 'upgrade']) == 0
+    capsys.readouterr()
+    assert migrations.main(['--backend', 'sqlite', '--database', path, 'status']) == 0
+    assert 'pending' not in capsys.readouterr().out
@@ -0,0 +1,129 @@
+import base64
+import json
+
+import pytest
+
+from pagination import InvalidPageRequest, PageRequest, decode_cursor, encode_cursor
+from search import SearchRequest
+
+
+def add(db, user_id, item_id, due_date=None, status='pending'):
+    db.execute('INSERT INTO entries (id, what_to_do, due_date, status, user_id) VALUES (?, ?, ?, ?, ?)',
+               (item_id, f'task {item_id}', due_date, status, user_id))
+
+
+@pytest.fixture
+def user(db, make_user):
+    user_id = make_user()
+    # Ties on due_date, and several rows without one so the walk has to cross
+    # into the second (NULL due date) range and page within it
+    for item_id, due_date in [('a', '2024-01-02 09:00:00'), ('b', '2024-01-01 09:00:00'),
+                              ('c', '2024-01-02 09:00:00'), ('d', None), ('e', '2024-01-03 09:00:00'),
+                              ('f', None), ('g', '2024-01-02 09:00:00'), ('h', None)]:
+        add(db, user_id, item_id, due_date, status='done' if item_id in 'cf' else 'pending')
+    other = make_user()
+    add(db, other, 'x', '2024-01-02 09:00:00')
+    add(db, other, 'y', None)
+    db.commit()
+    return user_id
+
+
+def walk(db, repository, user_id, **args):
+    """Follow next_cursor to the end; returns the ids and the cursors seen."""
+    ids, cursors, cursor = [], [], None
+    while True:
+        query = {key: str(value) for key, value in args.items()}
+        if cursor is not None:
+            query['cursor'] = cursor
+        rows, cursor = repository.page(db.cursor(), PageRequest(query), user_id)
+        ids.extend(row['id'] for row in rows)
+        if cursor is None:
+            return ids, cursors
+        cursors.append(decode_cursor(cursor))
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 4, 7, 8, 50])
+def test_due_date_walk_crosses_into_the_null_range(db, repository, user, limit):
+    ids, _ = walk(db, repository, user, limit=limit)
+    assert ids == ['b', 'a', 'c', 'g', 'e', 'd', 'f', 'h']
+
+
+def test_cursor_on_the_last_dated_row_continues_with_the_null_range(db, repository, user):
+    rows, cursor = repository.page(db.cursor(), PageRequest({'limit': '5'}), user)
+    assert [row['id'] for row in rows] == ['b', 'a', 'c', 'g', 'e']
+    assert decode_cursor(cursor) == ('v', '2024-01-03 09:00:00', 'e')
+    rows, cursor = repository.page(db.cursor(), PageRequest({'limit': '2', 'cursor': cursor}), user)
+    assert [row['id'] for row in rows] == ['d', 'f']
+    assert decode_cursor(cursor) == ('n', None, 'f')
+    rows, cursor = repository.page(db.cursor(), PageRequest({'limit': '2', 'cursor': cursor}), user)
+    assert [row['id'] for row in rows] == ['h']
+    assert cursor is None
+
+
+@pytest.mark.parametrize('limit', [1, 3, 8])
+def test_descending_walk_still_puts_undated_rows_last(db, repository, user, limit):
+    ids, _ = walk(db, repository, user, limit=limit, order='desc')
+    assert ids == ['e', 'g', 'c', 'a', 'b', 'h', 'f', 'd']
+
+
+@pytest.mark.parametrize('limit', [1, 3])
+def test_sort_by_id_is_a_single_range(db, repository, user, limit):
+    ids, cursors = walk(db, repository, user, limit=limit, sort='id')
+    assert ids == list('abcdefgh')
+    assert all(phase == 'n' for phase, _, _ in cursors)
+
+
+def test_status_filter_and_due_window(db, repository, user):
+    assert walk(db, repository, user, limit=1, status='done')[0] == ['c', 'f']
+    # A due-date window never reaches the NULL range
+    ids, _ = walk(db, repository, user, limit=2, due_after='2024-01-02 00:00:00',
+                  due_before='2024-01-03 00:00:00')
+    assert ids == ['a', 'c', 'g']
+
+
+def test_unpaginated_request_returns_everything(db, repository, user):
+    rows, cursor = repository.page(db.cursor(), PageRequest({}), user)
+    assert [row['id'] for row in rows] == ['b', 'a', 'c', 'g', 'e', 'd', 'f', 'h']
+    assert cursor is None
+
+
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor!',
+    'AAAA',
+    raw_cursor({'phase': 'v'}),
+    raw_cursor(['v', '2024-01-01']),
+    raw_cursor(['x', '2024-01-01', 'a']),
+    raw_cursor(['r', 1.5, 'a']),
+    raw_cursor(['v', '2024-01-01', 7]),
+    raw_cursor(['n', None, None]),
+    encode_cursor('v', '2024-01-01', 'a')[:-3],
+])
+def test_tampered_listing_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidPageRequest):
+        PageRequest({'cursor': cursor})
+
+
+@pytest.mark.parametrize('cursor', [
+    encode_cursor('v', '2024-01-01', 'a'),
+    raw_cursor(['r', '1.5', 'a']),
+    raw_cursor(['r', True, 'a']),
+    raw_cursor(['r', None, 'a']),
+])
+def test_tampered_search_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidPageRequest):
+        SearchRequest({'q': 'milk', 'cursor': cursor})
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor('n', None, 'a-b')) == ('n', None, 'a-b')
+
+
+@pytest.mark.parametrize('args', [{'limit': '0'}, {'limit': '501'}, {'limit': 'ten'},
+                                  {'sort': 'name'}, {'order': 'up'}])
+def test_invalid_page_parameters(args):
+    with pytest.raises(InvalidPageRequest):
+        PageRequest(args)
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+from flask import Flask
+
+from sqlite_db import SQLiteDatabase, ReaderBusy
+
+
+def make_app(database):
+    app = Flask(__name__)
+
+    @app.route('/read')
+    def read():
+        return str(database.reader().execute('SELECT 1').fetchone()[0])
+
+    @app.teardown_appcontext
+    def close_connection(exception):
+        database.end_read()
+
+    return app
+
+
+def test_readers_stay_bounded_across_threaded_requests(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / 'test.db'), max_readers=4)
+    client = make_app(database).test_client()
+    errors = []
+
+    def request():
+        # Like Werkzeug's threaded server: a new thread for every request
+        try:
+            assert client.get('/read').data == b'1'
+        except Exception as e:
+            errors.append(e)
+
+    for _ in range(25):
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    stats = database.stats()
+    assert not errors
+    assert stats['reader_checkouts'] == 200
+    assert stats['readers_opened'] <= 4
+    assert stats['readers'] <= 4
+    assert stats['readers_in_use'] == 0
+
+
+def test_reader_is_reused_within_a_thread_until_end_read(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / 'test.db'), max_readers=1)
+    conn = database.reader()
+    assert database.reader() is conn
+    database.end_read()
+    assert database.reader() is conn
+    database.end_read()
+    assert database.stats()['readers_opened'] == 1
+
+
+def test_reader_times_out_when_the_pool_is_exhausted(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / 'test.db'), max_readers=1, read_timeout=0.05)
+    database.reader()
+    errors = []
+
+    def read():
+        try:
+            database.reader()
+        except ReaderBusy as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    thread.join()
+    assert len(errors) == 1
+    assert database.stats()['reader_timeouts'] == 1
+
+
+def test_readers_reject_writes(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / 'test.db'))
+    with pytest.raises(Exception):
+        database.reader().execute('CREATE TABLE t (x)')
+    database.end_read()
@@ -0,0 +1,65 @@
+import pytest
+
+from sync import InvalidSyncCursor, list_etag, parse_since
+
+
+def test_parse_since():
+    assert parse_since(None) is None
+    assert parse_since('0') == 0
+    assert parse_since('42') == 42
+    for value in ('-1', 'abc', '1.5', ''):
+        with pytest.raises(InvalidSyncCursor):
+            parse_since(value)
+
+
+def test_since_returns_changed_rows_and_tombstones(db, repository, make_user):
+    user_id, other = make_user(), make_user()
+    cursor = db.cursor()
+    assert repository.sync_version(cursor, user_id) == 0
+
+    kept = repository.create(cursor, user_id, 'kept')
+    changed = repository.create(cursor, user_id, 'changed')
+    deleted = repository.create(cursor, user_id, 'deleted')
+    repository.create(cursor, other, 'someone else')
+    db.commit()
+    since = repository.sync_version(cursor, user_id)
+    assert since == 3
+
+    rows, deleted_ids = repository.changes_since(cursor, user_id, 0)
+    assert [row['id'] for row in rows] == [kept, changed, deleted]
+    assert deleted_ids == []
+
+    assert repository.update(cursor, user_id, changed, {'status': 'done'})
+    assert repository.delete(cursor, user_id, deleted)
+    # Another user's writes never show up in this user's delta
+    repository.create(cursor, other, 'someone else again')
+    db.commit()
+
+    rows, deleted_ids = repository.changes_since(cursor, user_id, since)
+    assert [(row['id'], row['status']) for row in rows] == [(changed, 'done')]
+    assert deleted_ids == [deleted]
+    latest = repository.sync_version(cursor, user_id)
+    assert latest > since
+    assert repository.changes_since(cursor, user_id, latest) == ([], [])
+
+
+def test_tombstones_older_than_the_cursor_are_not_resent(db, repository, make_user):
+    user_id = make_user()
+    cursor = db.cursor()
+    item_id = repository.create(cursor, user_id, 'task')
+    db.commit()
+    since = repository.sync_version(cursor, user_id)
+    repository.delete(cursor, user_id, item_id)
+    db.commit()
+    _, deleted_ids = repository.changes_since(cursor, user_id, since)
+    assert deleted_ids == [item_id]
+    _, deleted_ids = repository.changes_since(cursor, user_id, repository.sync_version(cursor, user_id))
+    assert deleted_ids == []
+
+
+def test_list_etag_changes_with_version_and_query():
+    etag = list_etag('u', 3, b'limit=50')
+    assert etag == list_etag('u', 3, b'limit=50')
+    assert etag != list_etag('u', 4, b'limit=50')
+    assert etag != list_etag('u', 3, b'limit=10')
+    assert etag != list_etag('v', 3, b'limit=50')
@@ -1,17 +1,67 @@
-from flask import Flask, render_template, request, redirect, jsonify, url_for
+from flask import Flask, render_template, request, redirect, jsonify, url_for, send_file, abort
 import requests
+import json
 import os
 
+import build_assets
+
 app = Flask(__name__)
 API_URL = os.environ.get('API_URL', 'http://localhost:5050')
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+def load_manifest():
+    """Return the asset build's manifest, or None if it is missing or older than the templates."""
+    path = os.path.join(build_assets.OUTPUT_DIR, build_assets.MANIFEST)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        print("No asset build found; rendering templates (run 'python build_assets.py')")
+        return None
+    if manifest.get('sources') != build_assets.source_digests():
+        print("Asset build is out of date; rendering templates (run 'python build_assets.py')")
+        return None
+    return manifest
+
+manifest = load_manifest()
+
+def send_built(name, mimetype, immutable):
+    """Send a built file, precompressed when the client accepts gzip.
+
+    ``send_file`` hands the open file to the server's ``wsgi.file_wrapper``,
+    which servers such as gunicorn turn into a zero-copy ``sendfile``.
+    """
+    path = os.path.join(build_assets.OUTPUT_DIR, name)
+    compressed = request.accept_encodings['gzip'] > 0
+    # Without a max_age send_file marks the response no-cache, which is what a page needs
+    response = send_file(path + '.gz' if compressed else path, mimetype=mimetype, conditional=True,
+                         max_age=ASSET_MAX_AGE if immutable else None)
+    if compressed:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    if immutable:
+        # The name changes whenever the content does
+        response.cache_control.immutable = True
+    return response
+
+def show_page(page):
+    if manifest is None:
+        return render_template(page)
+    return send_built(page, manifest['pages'][page], immutable=False)
 
 @app.route("/")
 def show_list():
-    return render_template("index.html")
+    return show_page("index.html")
 
 @app.route("/test")
 def test_page():
-    return render_template("test.html")
+    return show_page("test.html")
+
+@app.route("/assets/<name>")
+def asset(name):
+    if manifest is None or name not in manifest['assets']:
+        abort(404)
+    return send_built(name, manifest['assets'][name], immutable=True)
 
 @app.route("/health")
 def health_check():
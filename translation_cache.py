@@ -0,0 +1,185 @@
+"""Two-tier cache of translation results.
+
+Lookups are keyed on ``(normalized text, target_language)``.  The memory tier
+is a per-process LRU with TTL eviction; the persistent tier is the
+``translation_cache`` table in the application database, so warm entries
+survive restarts and are shared between replicas.  A database hit is promoted
+into the memory tier.  Failures of the persistent tier are logged and treated
+as misses so translation keeps working without it.
+"""
+import hashlib
+import threading
+import unicodedata
+
+from ttl_cache import TTLCache
+
+# Keys per query in bulk lookups
+LOOKUP_CHUNK_SIZE = 500
+
+
+def normalize_text(text):
+    """Canonical form used for cache keys: NFC, trimmed, single-spaced."""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def cache_key(text, target_language):
+    normalized = normalize_text(text)
+    return hashlib.sha256(f"{target_language}\0{normalized}".encode('utf-8')).hexdigest()
+
+
+class MySQLTranslationStore(object):
+    """Persistent tier stored in the ``translation_cache`` MySQL table."""
+
+    def __init__(self, get_db, ttl=30 * 24 * 3600):
+        self.get_db = get_db
+        self.ttl = ttl
+
+    def get(self, key):
+        cursor = self.get_db().cursor()
+        cursor.execute(
+            'SELECT translated_text, source_language, service FROM translation_cache '
+            'WHERE cache_key = %s AND created_at > NOW() - INTERVAL %s SECOND',
+            (key, self.ttl)
+        )
+        return cursor.fetchone()
+
+    def get_many(self, keys):
+        """Return ``{key: row}`` for the fresh entries among ``keys``, a chunk per query."""
+        cursor = self.get_db().cursor()
+        rows = {}
+        for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+            chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+            marks = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                'SELECT cache_key, translated_text, source_language, service FROM translation_cache '
+                f'WHERE cache_key IN ({marks}) AND created_at > NOW() - INTERVAL %s SECOND',
+                (*chunk, self.ttl)
+            )
+            for row in cursor.fetchall():
+                rows[row['cache_key']] = row
+        return rows
+
+    def set(self, key, text, target_language, result):
+        db = self.get_db()
+        cursor = db.cursor()
+        cursor.execute(
+            'INSERT INTO translation_cache '
+            '(cache_key, source_text, target_language, translated_text, source_language, service) '
+            'VALUES (%s, %s, %s, %s, %s, %s) '
+            'ON DUPLICATE KEY UPDATE translated_text = VALUES(translated_text), '
+            'source_language = VALUES(source_language), service = VALUES(service), '
+            'created_at = CURRENT_TIMESTAMP',
+            (key, normalize_text(text), target_language, result['translated_text'],
+             result.get('source_language'), result.get('service'))
+        )
+        db.commit()
+
+
+class TranslationCache(object):
+    """In-process LRU tier in front of an optional persistent store."""
+
+    def __init__(self, store=None, max_size=5000, ttl=3600):
+        self.memory = TTLCache(max_size=max_size, ttl=ttl)
+        self.store = store
+        self._lock = threading.Lock()
+        self.store_hits = 0
+        self.store_misses = 0
+        self.store_errors = 0
+
+    def get(self, text, target_language):
+        """Return ``(result, tier)`` where tier is 'memory' or 'database', or ``(None, None)``."""
+        key = cache_key(text, target_language)
+        result = self.memory.get(key)
+        if result is not None:
+            return result, 'memory'
+        if self.store is None:
+            return None, None
+
+        try:
+            row = self.store.get(key)
+        except Exception as e:
+            print(f"Translation cache read error: {str(e)}")
+            with self._lock:
+                self.store_errors += 1
+            return None, None
+
+        with self._lock:
+            if row:
+                self.store_hits += 1
+            else:
+                self.store_misses += 1
+        if not row:
+            return None, None
+        return self._promote(key, row), 'database'
+
+    def get_many(self, items):
+        """Bulk ``get`` for ``(text, target_language)`` pairs; returns ``(result, tier)`` pairs in order.
+
+        Memory misses are looked up in the persistent tier together.
+        """
+        keys = [cache_key(text, target_language) for text, target_language in items]
+        found = {}
+        for key in keys:
+            result = self.memory.get(key)
+            if result is not None:
+                found[key] = (result, 'memory')
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if self.store is not None and missing:
+            try:
+                rows = self.store.get_many(missing)
+            except Exception as e:
+                print(f"Translation cache read error: {str(e)}")
+                rows = {}
+                with self._lock:
+                    self.store_errors += 1
+            else:
+                with self._lock:
+                    self.store_hits += len(rows)
+                    self.store_misses += len(missing) - len(rows)
+            for key, row in rows.items():
+                found[key] = (self._promote(key, row), 'database')
+        return [found.get(key, (None, None)) for key in keys]
+
+    def _promote(self, key, row):
+        result = {
+            'translated_text': row['translated_text'],
+            'source_language': row['source_language'],
+            'service': row['service'],
+        }
+        self.memory.set(key, result)
+        return result
+
+    def set(self, text, target_language, result):
+        """Store a successful provider result in both tiers."""
+        key = cache_key(text, target_language)
+        entry = {
+            'translated_text': result['translated_text'],
+            'source_language': result.get('source_language'),
+            'service': result.get('service'),
+        }
+        self.memory.set(key, entry)
+        if self.store is None:
+            return
+        try:
+            self.store.set(key, text, target_language, entry)
+        except Exception as e:
+            print(f"Translation cache write error: {str(e)}")
+            with self._lock:
+                self.store_errors += 1
+
+    def stats(self):
+        memory = self.memory.stats()
+        with self._lock:
+            store_lookups = self.store_hits + self.store_misses
+            hits = memory['hits'] + self.store_hits
+            lookups = memory['hits'] + memory['misses']
+            return {
+                'memory': memory,
+                'database': {
+                    'hits': self.store_hits,
+                    'misses': self.store_misses,
+                    'errors': self.store_errors,
+                    'hit_rate': self.store_hits / store_lookups if store_lookups else 0.0,
+                },
+                'overall_hit_rate': hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,584 @@
+"""Translation providers and the engine that races them.
+
+Each provider wraps one public translation endpoint and turns its response
+into a translated string.  ``TranslationEngine`` orders the providers that
+support the target language with a ``ProviderScoreboard`` (fastest reliable
+first, circuit-broken ones skipped) and runs them in a hedged fan-out: the
+first ``concurrency`` providers start immediately, another one is started
+whenever an attempt fails or ``hedge_delay`` passes without an answer, and the
+first acceptable answer wins.  Attempts that have not started yet are
+cancelled and the rest are abandoned; every HTTP call carries
+``provider_timeout`` and the whole translation gives up after
+``overall_timeout``.
+
+``TranslationEngine.translate_batch`` serves many texts at once: it walks
+the ranked providers, packing the texts that are still untranslated into as
+few calls as each provider's ``max_batch`` allows.
+
+All HTTP goes through long-lived ``requests.Session`` objects (one per
+provider) so connections to each host are pooled and kept alive.
+``AsyncTranslationEngine`` runs the same race on asyncio with ``aiohttp``
+(imported only when it is used) for the ASGI serving mode.
+"""
+import asyncio
+import html
+import json
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from provider_scoreboard import ProviderScoreboard, SUCCESS, UNCHANGED, ERROR, TIMEOUT
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+
+# MyMemory API language codes
+MYMEMORY_LANG_MAP = {
+    'en': 'en',
+    'fr': 'fr',
+    'es': 'es',
+    'it': 'it',
+    'de': 'de',
+    'zh-CN': 'zh',  # MyMemory uses 'zh' for Chinese
+    'ja': 'ja',
+    'ko': 'ko',
+    'ru': 'ru'
+}
+
+# Google Translate language codes
+GOOGLE_LANG_MAP = {
+    'en': 'en',
+    'fr': 'fr',
+    'es': 'es',
+    'it': 'it',
+    'de': 'de',
+    'zh-CN': 'zh',  # Google sometimes uses just 'zh'
+    'ja': 'ja',
+    'ko': 'ko',
+    'ru': 'ru'
+}
+
+# LingoJAM language codes
+LINGO_LANG_MAP = {
+    'en': 'english',
+    'fr': 'french',
+    'es': 'spanish',
+    'it': 'italian',
+    'de': 'german',
+    'zh-CN': 'chinese',
+    'ja': 'japanese',
+    'ko': 'korean',
+    'ru': 'russian'
+}
+
+
+class Provider(ABC):
+    """One translation endpoint.
+
+    Subclasses describe the HTTP call for some texts in ``build_request`` and
+    turn the response body back into translations in ``parse``, so the same
+    provider serves both the threaded and the asyncio engine.  ``languages``
+    restricts the provider to some targets.  Providers whose endpoint accepts
+    several texts per call set ``max_batch``.
+    """
+    name = None
+    service = None
+    source_language = 'en'
+    languages = None
+    max_batch = 1
+
+    def supports(self, target_lang):
+        return self.languages is None or target_lang in self.languages
+
+    def chunks(self, texts):
+        """Split ``texts`` into groups that can each be sent in one call."""
+        size = max(1, self.max_batch)
+        return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+    @abstractmethod
+    def build_request(self, texts, target_lang):
+        """Return ``{'method', 'url', 'params', 'json', 'headers'}`` for one call."""
+
+    @abstractmethod
+    def parse(self, status, body, texts):
+        """Return translations aligned with ``texts`` (``None`` for misses), or ``None``."""
+
+    def fetch_many(self, session, texts, target_lang, timeout):
+        """Translate several texts in one call with a ``requests`` session."""
+        request = self.build_request(texts, target_lang)
+        response = session.request(request['method'], request['url'], params=request.get('params'),
+                                   json=request.get('json'), headers=request.get('headers'),
+                                   timeout=timeout)
+        return self.parse(response.status_code, response.text, texts)
+
+    def fetch(self, session, text, target_lang, timeout):
+        translated = self.fetch_many(session, [text], target_lang, timeout)
+        return translated[0] if translated else None
+
+
+def _google_parts(result):
+    """Join the sentence fragments of a translate_a/single response."""
+    if result and isinstance(result, list) and len(result) > 0 and isinstance(result[0], list):
+        return ''.join(item[0] for item in result[0]
+                       if item and len(item) > 0 and isinstance(item[0], str))
+    return None
+
+
+class MyMemoryProvider(Provider):
+    name = 'mymemory'
+    service = 'MyMemory Translation API'
+    base_url = 'https://api.mymemory.translated.net/get'
+
+    def build_request(self, texts, target_lang):
+        mm_lang = MYMEMORY_LANG_MAP.get(target_lang, target_lang)
+        return {'method': 'GET', 'url': self.base_url,
+                'params': {'q': texts[0], 'langpair': f'en|{mm_lang}'}}
+
+    def parse(self, status, body, texts):
+        if status != 200:
+            return None
+        result = json.loads(body)
+        if result and 'responseData' in result and 'translatedText' in result['responseData']:
+            # Sometimes the API returns HTML entities
+            return [html.unescape(result['responseData']['translatedText'])]
+        return None
+
+
+class GoogleGtxProvider(Provider):
+    name = 'google'
+    service = 'Google Translate'
+    source_language = 'auto'
+    base_url = 'https://translate.googleapis.com/translate_a/single'
+    max_batch = 20
+
+    def chunks(self, texts):
+        # Texts are packed one per line, so multi-line texts travel alone
+        single = [[text] for text in texts if '\n' in text]
+        packable = [text for text in texts if '\n' not in text]
+        return Provider.chunks(self, packable) + single
+
+    def build_request(self, texts, target_lang):
+        return {'method': 'GET', 'url': self.base_url,
+                'params': {'client': 'gtx', 'sl': 'en', 'tl': GOOGLE_LANG_MAP.get(target_lang, target_lang),
+                           'dt': 't', 'q': '\n'.join(texts)}}
+
+    def parse(self, status, body, texts):
+        if status != 200:
+            return None
+        # The response is not always valid JSON, so parse it carefully
+        joined = _google_parts(json.loads(body))
+        if not joined:
+            return None
+        # Line breaks survive translation, one line per packed text
+        return [joined] if len(texts) == 1 else joined.split('\n')
+
+
+class LingoJamProvider(Provider):
+    name = 'lingojam'
+    service = 'LingoJAM Translation'
+    languages = tuple(LINGO_LANG_MAP)
+    base_url = 'https://lingojam.com/api/api.php'
+
+    def build_request(self, texts, target_lang):
+        return {'method': 'GET', 'url': self.base_url,
+                'params': {'action': 'translate', 'from': 'english',
+                           'to': LINGO_LANG_MAP[target_lang], 'text': texts[0]}}
+
+    def parse(self, status, body, texts):
+        if status != 200:
+            return None
+        result = json.loads(body)
+        if result and 'translatedText' in result:
+            return [result['translatedText']]
+        return None
+
+
+class LibreTranslateProvider(Provider):
+    name = 'libretranslate'
+    service = 'LibreTranslate'
+    base_url = 'https://libretranslate.com/translate'
+    max_batch = 50
+
+    def build_request(self, texts, target_lang):
+        payload = {
+            "q": texts,
+            "source": "en",
+            "target": target_lang,
+            "format": "text",
+            "api_key": ""  # LibreTranslate may require an API key for some instances
+        }
+        return {'method': 'POST', 'url': self.base_url, 'json': payload}
+
+    def parse(self, status, body, texts):
+        if status != 200:
+            return [None] * len(texts)
+        # A list of texts gets a list of translations back
+        translated = json.loads(body).get('translatedText')
+        if isinstance(translated, list) and len(translated) == len(texts):
+            return translated
+        return [None] * len(texts)
+
+
+class GoogleCloudKeylessProvider(Provider):
+    name = 'google_cloud_special'
+    service = 'Google Cloud Translation API (Special)'
+    base_url = 'https://translation.googleapis.com/language/translate/v2'
+    max_batch = 50
+
+    def build_request(self, texts, target_lang):
+        target_code = GOOGLE_LANG_MAP.get(target_lang, target_lang)
+        return {'method': 'GET', 'url': self.base_url,
+                'params': {'key': '', 'q': texts, 'source': 'en', 'target': target_code},
+                'headers': {'Referer': 'https://translate.google.com/', 'Accept': 'application/json'}}
+
+    def parse(self, status, body, texts):
+        # The response may not be JSON; extract the translations with a regex
+        if "data" in body:
+            matches = re.findall(r'"translatedText":\s*"([^"]+)"', body)
+            if len(matches) == len(texts):
+                return [html.unescape(match) for match in matches]
+        return [None] * len(texts)
+
+
+class GoogleClients5Provider(Provider):
+    name = 'google_alternative'
+    service = 'Google Translate (Alternative)'
+    base_url = 'https://clients5.google.com/translate_a/t'
+    max_batch = 50
+
+    def build_request(self, texts, target_lang):
+        return {'method': 'GET', 'url': self.base_url,
+                'params': {'client': 'dict-chrome-ex', 'sl': 'en', 'tl': target_lang, 'q': texts}}
+
+    def parse(self, status, body, texts):
+        if status != 200:
+            return [None] * len(texts)
+        # This API has a different response format: one string per q
+        result = json.loads(body)
+        if isinstance(result, list) and len(result) == len(texts):
+            return [item if isinstance(item, str) else None for item in result]
+        return [None] * len(texts)
+
+
+def default_providers(base_url=None):
+    """The provider chain in its historical fallback order, used as the ranking prior.
+
+    With ``base_url`` every provider calls ``<base_url>/<provider name>``
+    instead of its public endpoint (a mirror, or the benchmark stub).
+    """
+    providers = [
+        MyMemoryProvider(),
+        GoogleGtxProvider(),
+        LingoJamProvider(),
+        LibreTranslateProvider(),
+        GoogleCloudKeylessProvider(),
+        GoogleClients5Provider(),
+    ]
+    if base_url:
+        for provider in providers:
+            provider.base_url = f"{base_url.rstrip('/')}/{provider.name}"
+    return providers
+
+
+def _check_translations(translated, texts):
+    """Reject a parsed response that is not one string (or null) per requested text."""
+    if not isinstance(translated, (list, tuple)) or len(translated) != len(texts):
+        raise ValueError('batch response does not match the request')
+    if not all(out is None or isinstance(out, str) for out in translated):
+        raise ValueError('response contains items that are not text')
+
+
+class _BaseEngine(object):
+    """Provider ranking and outcome bookkeeping shared by both engines."""
+
+    def __init__(self, providers=None, scoreboard=None, concurrency=2, hedge_delay=0.3,
+                 provider_timeout=3.0, overall_timeout=6.0):
+        self.providers = providers if providers is not None else default_providers()
+        self.scoreboard = scoreboard if scoreboard is not None else ProviderScoreboard()
+        self.concurrency = max(1, concurrency)
+        self.hedge_delay = hedge_delay
+        self.provider_timeout = provider_timeout
+        self.overall_timeout = overall_timeout
+
+    def candidates(self, target_lang):
+        """Providers supporting ``target_lang``, best expected cost first."""
+        supported = [p for p in self.providers if p.supports(target_lang)]
+        return self.scoreboard.rank(supported, target_lang)
+
+    def _record_outcome(self, provider, texts, translated, target_lang, latency):
+        """Record a finished call and return ``({text: translated_text}, error)``."""
+        results = {}
+        answered = 0
+        for text, out in zip(texts, translated):
+            if not out or not out.strip():
+                continue
+            answered += 1
+            if out.lower() != text.lower():
+                results[text] = out
+        if results:
+            self.scoreboard.record(provider.name, target_lang, SUCCESS, latency)
+            return results, None
+        if answered:
+            self.scoreboard.record(provider.name, target_lang, UNCHANGED, latency)
+            return results, 'returned the original text'
+        self.scoreboard.record(provider.name, target_lang, ERROR, latency)
+        return results, 'empty response'
+
+    def _result(self, provider, text, translated, target_lang):
+        return {
+            'original_text': text,
+            'translated_text': translated,
+            'source_language': provider.source_language,
+            'target_language': target_lang,
+            'service': provider.service
+        }
+
+
+class TranslationEngine(_BaseEngine):
+    """Hedged fan-out over a list of providers with shared HTTP sessions."""
+
+    def __init__(self, providers=None, scoreboard=None, concurrency=2, hedge_delay=0.3,
+                 provider_timeout=3.0, overall_timeout=6.0, max_workers=32):
+        _BaseEngine.__init__(self, providers, scoreboard, concurrency, hedge_delay,
+                             provider_timeout, overall_timeout)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='translate')
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        self.max_workers = max_workers
+
+    def session_for(self, provider):
+        """Return the keep-alive session dedicated to ``provider``."""
+        session = self._sessions.get(provider.name)
+        if session is None:
+            with self._sessions_lock:
+                session = self._sessions.get(provider.name)
+                if session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers,
+                                          max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.headers['User-Agent'] = USER_AGENT
+                    self._sessions[provider.name] = session
+        return session
+
+    def _attempt_many(self, provider, texts, target_lang):
+        """Run one provider call for ``texts``.
+
+        Returns ``(provider, {text: translated_text}, error)``; texts missing
+        from the dict were not translated acceptably.
+        """
+        if not self.scoreboard.allow(provider.name):
+            return provider, {}, 'circuit open'
+        start = time.monotonic()
+        session = self.session_for(provider)
+        try:
+            if len(texts) == 1:
+                translated = [provider.fetch(session, texts[0], target_lang, self.provider_timeout)]
+            else:
+                translated = provider.fetch_many(session, texts, target_lang, self.provider_timeout)
+            _check_translations(translated, texts)
+        except requests.Timeout as e:
+            self.scoreboard.record(provider.name, target_lang, TIMEOUT, time.monotonic() - start)
+            return provider, {}, str(e)
+        except Exception as e:
+            self.scoreboard.record(provider.name, target_lang, ERROR, time.monotonic() - start)
+            return provider, {}, str(e)
+        return (provider,) + self._record_outcome(provider, texts, translated, target_lang,
+                                                  time.monotonic() - start)
+
+    def _attempt(self, provider, text, target_lang, abandoned):
+        """Run one provider; returns ``(provider, translated_text or None, error)``."""
+        if abandoned.is_set():
+            return provider, None, 'cancelled'
+        provider, results, error = self._attempt_many(provider, [text], target_lang)
+        return provider, results.get(text), error
+
+    def translate(self, text, target_lang):
+        """Return the first acceptable result dict, or ``None`` if every provider failed."""
+        queue = self.candidates(target_lang)
+        deadline = time.monotonic() + self.overall_timeout
+        abandoned = threading.Event()
+        pending = set()
+
+        def launch():
+            provider = queue.pop(0)
+            print(f"Trying {provider.service} for {target_lang}")
+            pending.add(self.executor.submit(self._attempt, provider, text, target_lang, abandoned))
+
+        try:
+            while queue and len(pending) < self.concurrency:
+                launch()
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print(f"Translation deadline of {self.overall_timeout}s exceeded")
+                    return None
+                timeout = min(self.hedge_delay, remaining) if queue else remaining
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider, translated, error = future.result()
+                    if translated is not None:
+                        return self._result(provider, text, translated, target_lang)
+                    print(f"{provider.service} failed: {error}")
+                    if queue:
+                        launch()
+                if not done and queue:
+                    # Hedge: nobody answered within hedge_delay, start one more
+                    launch()
+            return None
+        finally:
+            abandoned.set()
+            for future in pending:
+                future.cancel()
+
+    def translate_batch(self, texts, target_lang):
+        """Translate many texts; returns ``{text: result dict}`` for those that succeeded.
+
+        Providers are tried in ranked order.  Each one gets every text that is
+        still untranslated, packed into as few calls as its ``chunks`` allows and sent
+        concurrently; whatever it fails on falls through to the next provider.
+        """
+        pending = list(dict.fromkeys(texts))
+        deadline = time.monotonic() + self.overall_timeout
+        results = {}
+        for provider in self.candidates(target_lang):
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                break
+            chunks = provider.chunks(pending)
+            print(f"Trying {provider.service} for {len(pending)} texts in {len(chunks)} calls to {target_lang}")
+            futures = [self.executor.submit(self._attempt_many, provider, chunk, target_lang)
+                       for chunk in chunks]
+            done, not_done = wait(futures, timeout=remaining)
+            for future in not_done:
+                future.cancel()
+            for future in done:
+                provider, translated, error = future.result()
+                if error:
+                    print(f"{provider.service} failed: {error}")
+                for text, out in translated.items():
+                    results[text] = self._result(provider, text, out, target_lang)
+            pending = [text for text in pending if text not in results]
+        return results
+
+
+def _query_pairs(params):
+    """Flatten list values into repeated keys, as ``requests`` does."""
+    if not params:
+        return None
+    pairs = []
+    for key, value in params.items():
+        for item in (value if isinstance(value, list) else [value]):
+            pairs.append((key, item))
+    return pairs
+
+
+class AsyncTranslationEngine(_BaseEngine):
+    """The hedged fan-out of ``TranslationEngine.translate`` on asyncio.
+
+    Used by the ASGI entry point.  Provider calls share one keep-alive
+    ``aiohttp.ClientSession`` per event loop instead of holding a thread each,
+    so one process can keep thousands of slow translations in flight.
+    Attempts that lose the race are left to finish in the background, bounded
+    by ``provider_timeout``, so their outcome still reaches the scoreboard.
+    """
+
+    def __init__(self, providers=None, scoreboard=None, concurrency=2, hedge_delay=0.3,
+                 provider_timeout=3.0, overall_timeout=6.0, max_connections=512):
+        _BaseEngine.__init__(self, providers, scoreboard, concurrency, hedge_delay,
+                             provider_timeout, overall_timeout)
+        self.max_connections = max_connections
+        self._session = None
+        self._background = set()
+
+    @classmethod
+    def from_engine(cls, engine, max_connections=512):
+        """Build an async engine sharing ``engine``'s providers, scoreboard and timeouts."""
+        return cls(engine.providers, engine.scoreboard, engine.concurrency, engine.hedge_delay,
+                   engine.provider_timeout, engine.overall_timeout, max_connections)
+
+    def _client(self):
+        if self._session is None or self._session.closed:
+            import aiohttp
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  headers={'User-Agent': USER_AGENT})
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _fetch(self, provider, texts, target_lang):
+        import aiohttp
+        request = provider.build_request(texts, target_lang)
+        async with self._client().request(
+                request['method'], request['url'], params=_query_pairs(request.get('params')),
+                json=request.get('json'), headers=request.get('headers'),
+                timeout=aiohttp.ClientTimeout(total=self.provider_timeout)) as response:
+            body = await response.text()
+            return provider.parse(response.status, body, texts)
+
+    async def _attempt_many(self, provider, texts, target_lang):
+        if not self.scoreboard.allow(provider.name):
+            return provider, {}, 'circuit open'
+        start = time.monotonic()
+        try:
+            translated = await self._fetch(provider, texts, target_lang)
+            _check_translations(translated, texts)
+        except asyncio.TimeoutError as e:
+            self.scoreboard.record(provider.name, target_lang, TIMEOUT, time.monotonic() - start)
+            return provider, {}, str(e) or 'timed out'
+        except Exception as e:
+            self.scoreboard.record(provider.name, target_lang, ERROR, time.monotonic() - start)
+            return provider, {}, str(e)
+        return (provider,) + self._record_outcome(provider, texts, translated, target_lang,
+                                                  time.monotonic() - start)
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def translate(self, text, target_lang):
+        """Return the first acceptable result dict, or ``None`` if every provider failed."""
+        loop = asyncio.get_running_loop()
+        queue = self.candidates(target_lang)
+        deadline = loop.time() + self.overall_timeout
+        pending = set()
+
+        def launch():
+            provider = queue.pop(0)
+            print(f"Trying {provider.service} for {target_lang}")
+            pending.add(self._spawn(self._attempt_many(provider, [text], target_lang)))
+
+        while queue and len(pending) < self.concurrency:
+            launch()
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                print(f"Translation deadline of {self.overall_timeout}s exceeded")
+                return None
+            timeout = min(self.hedge_delay, remaining) if queue else remaining
+            done, pending = await asyncio.wait(pending, timeout=timeout,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                provider, results, error = task.result()
+                if text in results:
+                    return self._result(provider, text, results[text], target_lang)
+                print(f"{provider.service} failed: {error}")
+                if queue:
+                    launch()
+            if not done and queue:
+                # Hedge: nobody answered within hedge_delay, start one more
+                launch()
+        return None